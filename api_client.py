@@ -1,35 +1,236 @@
-import os, requests, pandas as pd
+import hashlib, hmac, json, os, threading, time, zlib, requests, pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from urllib3.util.retry import Retry
+
+try:
+    import pyarrow as pa
+except ImportError:  # opcional: sin pyarrow se usa JSON
+    pa = None
 
 API_URL = os.environ.get("ERP_API_URL","http://localhost:8000")
 API_KEY = os.environ.get("ERP_API_KEY","dev-key")
+API_URL_PUBLICA = os.environ.get("ERP_API_URL_PUBLICA")  # la que abre el navegador si no es API_URL (enlaces de descarga)
+EXPORT_ENLACE_TTL = float(os.environ.get("ERP_EXPORT_ENLACE_TTL", "900"))  # s de vigencia de un enlace firmado
 HEAD = {"x-api-key": API_KEY}
+ARROW_MEDIA = "application/vnd.apache.arrow.stream"
+# Formato preferido para tickets/usuarios: Arrow IPC (tipado, sin parseo JSON ni de fechas) si hay pyarrow
+API_FORMATO = os.environ.get("ERP_API_FORMATO", "arrow" if pa is not None else "json")
+API_COMPRESION = os.environ.get("ERP_API_COMPRESION", "lz4")
+API_POOL = int(os.environ.get("ERP_API_POOL", "10"))          # conexiones keep-alive por host
+API_REINTENTOS = int(os.environ.get("ERP_API_REINTENTOS", "3"))
+API_BACKOFF = float(os.environ.get("ERP_API_BACKOFF", "0.3"))  # 0.3s, 0.6s, 1.2s...
+CATALOGO_TTL = float(os.environ.get("ERP_CATALOGO_TTL", "60"))  # dentro del TTL no hay request; después, GET condicional
+FEED_LATIDO = float(os.environ.get("ERP_FEED_LATIDO", "15"))    # el servidor manda un latido SSE cada tantos segundos
+
+def _nueva_sesion()->requests.Session:
+    # Sesión compartida por el proceso: reutiliza conexiones (keep-alive) y pide gzip (Accept-Encoding
+    # lo agrega requests; también br si está instalado brotli). Reintentos acotados con backoff: los
+    # errores de conexión se reintentan siempre (el request no llegó); los 502/503/504 solo en GET.
+    reintentos = Retry(total=API_REINTENTOS, connect=API_REINTENTOS, read=0, backoff_factor=API_BACKOFF,
+                       status_forcelist=(502, 503, 504), allowed_methods=frozenset({"GET"}), raise_on_status=False)
+    adaptador = HTTPAdapter(pool_connections=API_POOL, pool_maxsize=API_POOL, max_retries=reintentos)
+    ses = requests.Session(); ses.headers.update(HEAD)
+    ses.mount("http://", adaptador); ses.mount("https://", adaptador)
+    return ses
+
+_sesion = _nueva_sesion()
+
+def _get_resp(path, params=None, headers=None):
+    r = _sesion.get(f"{API_URL}{path}", params=params or {}, headers=headers, timeout=15)
+    r.raise_for_status(); return r
+
+def _get_frame(path, params=None, headers=None):
+    params = dict(params or {}); headers = dict(headers or {})
+    if API_FORMATO=="arrow" and pa is not None:
+        headers["Accept"] = f"{ARROW_MEDIA}, application/json;q=0.5"
+        if API_COMPRESION and pa.Codec.is_available(API_COMPRESION):
+            # el cuerpo Arrow ya viene comprimido (lz4/zstd): gzip encima solo gastaría CPU en ambos lados
+            params["compresion"] = API_COMPRESION; headers["Accept-Encoding"] = "identity"
+    r = _get_resp(path, params, headers)
+    if r.status_code==304: return None, r
+    if r.headers.get("content-type","").startswith(ARROW_MEDIA):
+        return pa.ipc.open_stream(r.content).read_pandas(), r
+    return pd.DataFrame(r.json()), r
 
 def _get(path, params=None):
-    r = requests.get(f"{API_URL}{path}", params=params or {}, headers=HEAD, timeout=15)
-    r.raise_for_status(); return r.json()
+    return _get_resp(path, params).json()
+
+# Caché condicional de catálogos: (path, params) -> (vence, etag, valor)
+_catalogos = {}
+
+def _get_catalogo(path, params=None, frame=False):
+    clave = (path, tuple(sorted((params or {}).items()))); hit = _catalogos.get(clave); ahora = time.monotonic()
+    if hit and hit[0] > ahora: return hit[2]
+    cond = {"If-None-Match": hit[1]} if hit and hit[1] else None
+    if frame: valor, r = _get_frame(path, params, cond)
+    else: r = _get_resp(path, params, cond); valor = r.json() if r.status_code!=304 else None
+    if r.status_code==304: valor = hit[2]  # sin cambios: solo se renueva el vencimiento
+    _catalogos[clave] = (ahora + CATALOGO_TTL, r.headers.get("ETag"), valor)
+    return valor
+
+def invalidar_catalogos(path=None):
+    for clave in [c for c in _catalogos if path is None or c[0]==path]: _catalogos.pop(clave, None)
 
 def _post(path, data=None, params=None):
     if isinstance(data, dict):
-        r = requests.post(f"{API_URL}{path}", json=data, params=params or {}, headers=HEAD, timeout=20)
+        r = _sesion.post(f"{API_URL}{path}", json=data, params=params or {}, timeout=20)
     else:
-        r = requests.post(f"{API_URL}{path}", params=params or {}, headers=HEAD, timeout=20)
+        r = _sesion.post(f"{API_URL}{path}", params=params or {}, timeout=20)
     r.raise_for_status(); return r.json()
 
 def load_usuarios_df():
-    return pd.DataFrame(_get("/usuarios"))
+    return _get_catalogo("/usuarios", frame=True).copy()
 
-def load_tickets_df():
-    data = _get("/tickets")
-    df = pd.DataFrame(data)
-    if not df.empty:
-        df["Fecha_Creación"] = pd.to_datetime(df["Fecha_Creación"], errors="coerce")
+def _get_tickets(path, params)->pd.DataFrame:
+    df, r = _get_frame(path, params={k: v for k, v in params.items() if v not in (None, "")})
+    if not df.empty and not pd.api.types.is_datetime64_any_dtype(df["Fecha_Creación"]):
+        df["Fecha_Creación"] = pd.to_datetime(df["Fecha_Creación"], format="ISO8601", errors="coerce")
+    df.attrs["cursor"] = r.headers.get("X-Next-Cursor")
     return df
 
-def upsert_ticket(rec: dict):
-    rc = rec.copy()
+def load_tickets_df(**filtros):
+    # mismos filtros que storage_sqlite.load_tickets_df (empresa, modulo, ..., orden, cursor, limit)
+    return _get_tickets("/tickets", filtros)
+
+def buscar_tickets(q: str, cursor=None, limit=50, **filtros):
+    return _get_tickets("/tickets/search", {"q": q, "cursor": cursor, "limit": limit, **filtros})
+
+# ====== FEED DE CAMBIOS ======
+def _delta(data: dict)->dict:
+    df = pd.DataFrame(data["tickets"])
+    if not df.empty: df["Fecha_Creación"] = pd.to_datetime(df["Fecha_Creación"], format="ISO8601", errors="coerce")
+    return {**data, "tickets": df}
+
+def cambios(since=None, limit=1000)->dict:
+    # mismo contrato que storage_sqlite.cambios_desde; sin since devuelve solo el cursor actual
+    return _delta(_get("/changes", params={k: v for k, v in (("since", since), ("limit", limit)) if v is not None}))
+
+def stream_cambios(since=None):
+    """Deltas del stream SSE a medida que llegan (bloqueante). Termina con excepción si se corta la conexión."""
+    params = {"since": since} if since is not None else {}
+    with _sesion.get(f"{API_URL}/changes/stream", params=params, stream=True, timeout=(5, FEED_LATIDO*3),
+                     headers={"Accept": "text/event-stream", "Accept-Encoding": "identity"}) as r:
+        r.raise_for_status(); evento, datos = None, []
+        for linea in r.iter_lines(decode_unicode=True):
+            if linea:
+                if linea.startswith("event:"): evento = linea[6:].strip()
+                elif linea.startswith("data:"): datos.append(linea[5:].lstrip())
+                continue
+            if evento=="cambios" and datos: yield _delta(json.loads("\n".join(datos)))
+            evento, datos = None, []
+
+def seguir_cambios(cache, since=None)->threading.Thread:
+    """Mantiene un TicketCache al día con el feed SSE desde un hilo (reconecta con backoff). El cursor se toma
+    antes de la primera carga completa del caché: los deltas repetidos son inocuos (upsert por ID_Ticket)."""
+    estado = {"since": cambios()["hasta"] if since is None else since}
+    def _correr():
+        espera = 1
+        while True:
+            try:
+                for delta in stream_cambios(estado["since"]):
+                    cache.aplicar_delta(delta); estado["since"] = delta["hasta"]; espera = 1
+            except (requests.RequestException, ValueError):
+                pass
+            time.sleep(espera); espera = min(espera*2, 30)
+    hilo = threading.Thread(target=_correr, name="feed-cambios", daemon=True); hilo.start()
+    return hilo
+
+def contar_tickets(por="estado", **filtros)->dict:
+    return _get("/tickets/conteo", params={"por": por, **{k: v for k, v in filtros.items() if v not in (None, "")}})
+
+def load_auditoria(**filtros):
+    # mismos filtros que storage_sqlite.load_auditoria (ticket, usuario, campo, desde, hasta, cursor, limit)
+    df, r = _get_frame("/auditoria", params={k: v for k, v in filtros.items() if v not in (None, "")})
+    df.attrs["cursor"] = r.headers.get("X-Next-Cursor")
+    return df
+
+def export_tickets(destino: str, formato="csv", **filtros)->str:
+    # descarga en streaming a disco: memoria constante sin importar la cantidad de tickets
+    params = {k: v for k, v in filtros.items() if v not in (None, "")}; params["formato"] = formato
+    sin_gzip = {"Accept-Encoding": "identity"} if formato!="csv" else None  # Arrow/Parquet ya vienen comprimidos
+    with _sesion.get(f"{API_URL}/tickets/export", params=params, headers=sin_gzip, timeout=60, stream=True) as r:
+        r.raise_for_status()
+        with open(destino, "wb") as fh:
+            for parte in r.iter_content(chunk_size=1 << 16): fh.write(parte)
+    return destino
+
+def url_export(formato="csv", **filtros)->str:
+    # enlace para que el navegador baje el export directo de la API, en streaming y sin pasar por Streamlit:
+    # no puede mandar x-api-key, así que va firmado como lo verifica api_server.firmar_export
+    pares = sorted({**{k: str(v) for k, v in filtros.items() if v not in (None, "")}, "formato": formato,
+                    "expira": str(int(time.time()+EXPORT_ENLACE_TTL))}.items())
+    firma = hmac.new(API_KEY.encode(), urlencode(pares).encode(), hashlib.sha256).hexdigest()
+    return f"{API_URL_PUBLICA or API_URL}/tickets/export?{urlencode(pares + [('firma', firma)])}"
+
+def load_stats(desde=None, hasta=None, agente=None):
+    params = {k: v for k, v in (("desde",desde),("hasta",hasta),("agente",agente)) if v}
+    # cada frame viene como {"columns", "data"}: vacío conserva sus columnas, igual que storage_sqlite.load_stats
+    return {k: pd.DataFrame(v["data"], columns=v["columns"]) for k, v in _get("/stats", params=params).items()}
+
+def _ticket_json(rec: dict)->dict:
+    # fechas a ISO y NaN/NaT a null (el frame los trae así y no son JSON válido)
+    rc = {k: None if pd.isna(v) else v for k, v in rec.items()}
     v = rc.get("Fecha_Creación")
     if hasattr(v, "isoformat"): rc["Fecha_Creación"] = v.isoformat()
-    return _post("/tickets", data=rc)
+    return rc
+
+def upsert_ticket(rec: dict):
+    return _post("/tickets", data=_ticket_json(rec))
+
+INGESTA_LOTE = 5000  # registros por transacción del lado del servidor
+
+def _jsonl_gzip(registros, bloque=INGESTA_LOTE):
+    # cuerpo JSONL comprimido al vuelo: ni el JSON ni el gzip completos pasan por memoria
+    gz = zlib.compressobj(5, zlib.DEFLATED, 31)
+    if isinstance(registros, pd.DataFrame):
+        for desde in range(0, len(registros), bloque):
+            parte = registros.iloc[desde:desde+bloque]
+            yield gz.compress(parte.to_json(orient="records", lines=True, force_ascii=False, date_format="iso", date_unit="us").encode() + b"\n")
+    else:
+        lineas = []
+        for rec in registros:
+            lineas.append(json.dumps(_ticket_json(rec), ensure_ascii=False, default=str))
+            if len(lineas) >= bloque: yield gz.compress(("\n".join(lineas) + "\n").encode()); lineas = []
+        if lineas: yield gz.compress(("\n".join(lineas) + "\n").encode())
+    yield gz.flush()
+
+def upsert_tickets_bulk(registros, lote=INGESTA_LOTE)->dict:
+    """Upsert masivo (DataFrame o iterable de dicts) en un solo request: JSONL con gzip contra POST /tickets/batch.
+    Devuelve el resumen del servidor: recibidos, guardados, con_error y errores por n° de registro."""
+    r = _sesion.post(f"{API_URL}/tickets/batch", params={"lote": lote}, data=_jsonl_gzip(registros), timeout=(10, 600),
+                     headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})
+    r.raise_for_status(); return r.json()
+
+class ConflictoVersion(Exception):
+    """El ticket cambió (otro rowversion) desde que se leyó; `actual` es la fila vigente (mismo contrato que storage_sqlite)."""
+    def __init__(self, actual: dict):
+        super().__init__(f"{actual['ID_Ticket']} cambió: rowversion actual {actual['rowversion']}")
+        self.actual = actual
+
+def get_ticket(ticket_id: str)->dict | None:
+    r = _sesion.get(f"{API_URL}/tickets/{ticket_id}", timeout=15)
+    if r.status_code==404: return None
+    r.raise_for_status(); return r.json()
+
+def patch_ticket(ticket_id: str, cambios: dict, rowversion=None, usuario="api", rol="", motivo="Edición")->dict | None:
+    # solo viajan los campos modificados; 409 = otro lo editó desde que se leyó
+    data = {**_ticket_json(cambios), "usuario": usuario, "rol": rol, "motivo": motivo}
+    if rowversion is not None: data["rowversion"] = int(rowversion)
+    r = _sesion.patch(f"{API_URL}/tickets/{ticket_id}", json=data, timeout=20)
+    if r.status_code==404: return None
+    if r.status_code==409: raise ConflictoVersion(r.json()["detail"]["actual"])
+    r.raise_for_status(); return r.json()
+
+def crear_ticket(rec: dict, usuario="", rol="")->str:
+    rc = _ticket_json({k: v for k, v in rec.items() if k!="ID_Ticket"})
+    return _post("/tickets/new", data={**rc, "usuario": usuario, "rol": rol})["ID_Ticket"]
+
+def registrar_auditoria_batch(registros, ticket: dict | None = None):
+    # un solo request: upsert del ticket (opcional) + todos sus registros de auditoría
+    data = {"registros": [{**r, "antes": str(r["antes"]), "despues": str(r["despues"]), "motivo": str(r["motivo"])} for r in registros]}
+    if ticket is not None: data["ticket"] = _ticket_json(ticket)
+    return _post("/auditoria/batch", data=data)
 
 def registrar_auditoria(usuario, rol, ticket, campo, antes, despues, motivo):
     return _post("/auditoria", data={
@@ -38,20 +239,23 @@ def registrar_auditoria(usuario, rol, ticket, campo, antes, despues, motivo):
     })
 
 def list_clientes():
-    return _get("/clientes")
+    return list(_get_catalogo("/clientes"))
 
 def list_reportantes(cliente: str):
-    return _get("/reportantes", params={"cliente": cliente})
+    return list(_get_catalogo("/reportantes", params={"cliente": cliente}))
 
 def create_cliente(nombre: str):
-    return _post("/clientes", params={"nombre": nombre})
+    res = _post("/clientes", params={"nombre": nombre}); invalidar_catalogos("/clientes"); return res
 
 def create_reportante(cliente: str, nombre: str):
-    return _post("/reportantes", params={"cliente": cliente, "nombre": nombre})
+    res = _post("/reportantes", params={"cliente": cliente, "nombre": nombre}); invalidar_catalogos("/reportantes"); return res
 
-def bulk_update_tickets(ids, set_estado=None, set_prioridad=None, set_agente=None):
+def bulk_update_tickets(ids, set_estado=None, set_prioridad=None, set_agente=None, usuario=None, rol=None, motivo=None):
     payload = {"ids": ids}
     if set_estado: payload["set_estado"] = set_estado
     if set_prioridad: payload["set_prioridad"] = set_prioridad
     if set_agente: payload["set_agente"] = set_agente
+    if usuario: payload["usuario"] = usuario
+    if rol: payload["rol"] = rol
+    if motivo: payload["motivo"] = motivo
     return _post("/tickets/bulk_update", data=payload)
@@ -1,24 +1,217 @@
-import os
-from fastapi import FastAPI, Header, HTTPException, Query
+import asyncio, codecs, csv, hashlib, hmac, json, logging, os, sqlite3, time, zlib
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError, field_validator
 from typing import List, Optional
+from urllib.parse import parse_qs, urlencode
 import storage_sqlite as store
+import metricas, perfilado
+from storage_async import AsyncStore
 import pandas as pd
 
 API_KEY = os.environ.get("ERP_API_KEY","dev-key")
 
-app = FastAPI(title="ERP Support API (Portfolio)")
+db = AsyncStore()
+FEED_INTERVALO = float(os.environ.get("ERP_FEED_INTERVALO", "0.5"))  # s entre sondeos del change log
+FEED_LATIDO = float(os.environ.get("ERP_FEED_LATIDO", "15"))        # comentario SSE para mantener viva la conexión
+FEED_DURACION = float(os.environ.get("ERP_FEED_DURACION", "300"))   # vida máxima de un stream: el cliente reconecta con Last-Event-ID
+
+_log_feed = logging.getLogger("erp.feed")
+
+class _FeedCambios:
+    """Un único sondeo del change log por proceso (MAX(id) cada FEED_INTERVALO): los streams SSE esperan
+    la señal en lugar de consultar cada uno, así N clientes ociosos cuestan una consulta, no N."""
+    def __init__(self):
+        self.ultimo = None; self._cond = None; self._tarea = None; self._loop = None
+
+    def arrancar(self):
+        self._loop = asyncio.get_running_loop()
+        self._cond = asyncio.Condition(); self._tarea = asyncio.create_task(self._sondear())
+
+    def _activo(self)->asyncio.Condition:
+        # lo arranca lifespan; sin él (p. ej. TestClient sin `with`, que usa un loop por request) o si el
+        # sondeo murió, se arranca acá en el loop actual
+        if self._tarea is None or self._tarea.done() or self._loop is not asyncio.get_running_loop(): self.arrancar()
+        return self._cond
+
+    async def detener(self):
+        if self._tarea: self._tarea.cancel()
+        self._tarea = None
+
+    async def _sondear(self):
+        cond = self._cond  # la de este loop (si se rearranca en otro, esta tarea no toca la nueva)
+        while True:
+            try:
+                ultimo = await db.leer(store.ultimo_cambio)
+                if ultimo!=self.ultimo:
+                    async with cond: self.ultimo = ultimo; cond.notify_all()
+            except sqlite3.OperationalError:
+                pass  # base ocupada o en migración: se reintenta en el próximo sondeo
+            except Exception:
+                _log_feed.exception("Falló el sondeo del change log")  # se sigue intentando: el feed no se corta
+            await asyncio.sleep(FEED_INTERVALO)
+
+    async def esperar(self, since: int, timeout: float):
+        cond = self._activo()
+        async with cond:
+            await asyncio.wait_for(cond.wait_for(lambda: self.ultimo is not None and self.ultimo > since), timeout)
+
+feed = _FeedCambios()
+
+@asynccontextmanager
+async def lifespan(app):
+    feed.arrancar()
+    yield
+    await feed.detener(); db.cerrar(); store.cerrar_pool()
+
+app = FastAPI(title="ERP Support API (Portfolio)", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"],
 )
+# gzip solo si el cliente lo pide (Accept-Encoding) y la respuesta supera 1 KB; nivel 5: buen ratio sin penalizar CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# ====== MÉTRICAS (latencia y tamaños por ruta; /metrics en formato Prometheus) ======
+_M_HTTP = metricas.histograma("erp_http_segundos", "Latencia hasta el último byte (SSE: vida del stream)", ("metodo", "ruta", "estado"))
+_M_ENTRADA = metricas.histograma("erp_http_request_bytes", "Cuerpo recibido por request", ("metodo", "ruta"), metricas.BUCKETS_BYTES)
+_M_SALIDA = metricas.histograma("erp_http_response_bytes", "Cuerpo enviado por respuesta (ya comprimido)", ("metodo", "ruta"), metricas.BUCKETS_BYTES)
+
+class _MetricasHTTP:
+    """Middleware ASGI puro (BaseHTTPMiddleware bufferizaría los streams). Etiqueta por plantilla de ruta
+    (/tickets/{ticket_id}) y no por path, así la cantidad de series queda acotada."""
+    def __init__(self, app): self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"]!="http": return await self.app(scope, receive, send)
+        t = time.perf_counter(); medida = {"entrada": 0, "salida": 0, "estado": 500}
+        async def recibir():
+            msg = await receive()
+            if msg["type"]=="http.request": medida["entrada"] += len(msg.get("body", b""))
+            return msg
+        async def enviar(msg):
+            if msg["type"]=="http.response.start": medida["estado"] = msg["status"]
+            elif msg["type"]=="http.response.body": medida["salida"] += len(msg.get("body", b""))
+            await send(msg)
+        try:
+            await self.app(scope, recibir, enviar)
+        finally:
+            metodo, ruta = scope["method"], getattr(scope.get("route"), "path", "sin_ruta")
+            _M_HTTP.observar(time.perf_counter()-t, metodo=metodo, ruta=ruta, estado=medida["estado"])
+            _M_ENTRADA.observar(medida["entrada"], metodo=metodo, ruta=ruta); _M_SALIDA.observar(medida["salida"], metodo=metodo, ruta=ruta)
+
+# ====== PERFILADO A PEDIDO (X-Profile: text|pstats, o ?profile=, solo con la API key) ======
+PERFILADO = os.environ.get("ERP_PERFILADO", "1")=="1"
+PERFIL_LINEAS = int(os.environ.get("ERP_PERFIL_LINEAS", "40"))
+
+class _PerfilHTTP:
+    """En lugar de la respuesta devuelve el reporte cProfile del request: event loop (validación, serialización,
+    gzip) más los hilos de AsyncStore (SQLite, read_sql, armado de frames). Un request perfilado a la vez; los
+    requests concurrentes sin perfilar que corran en el event loop pueden aparecer en el reporte."""
+    def __init__(self, app): self.app = app; self._turno = None
+
+    @staticmethod
+    def _modo(scope)->str | None:
+        cabeceras = dict(scope["headers"])
+        modo = cabeceras.get(b"x-profile", b"").decode() or parse_qs(scope.get("query_string", b"").decode()).get("profile", [""])[0]
+        if not modo or cabeceras.get(b"x-api-key", b"").decode()!=API_KEY: return None  # sin key: request normal (401)
+        return "pstats" if modo=="pstats" else "text"
+
+    async def __call__(self, scope, receive, send):
+        modo = self._modo(scope) if scope["type"]=="http" else None
+        if modo is None: return await self.app(scope, receive, send)
+        if self._turno is None: self._turno = asyncio.Lock()
+        original = {"estado": 500, "bytes": 0, "error": ""}
+        async def descartar(msg):
+            if msg["type"]=="http.response.start": original["estado"] = msg["status"]
+            elif msg["type"]=="http.response.body": original["bytes"] += len(msg.get("body", b""))
+        async with self._turno:
+            perfil = perfilado.Perfil(); token = perfilado.actual.set(perfil)
+            try:
+                with perfil.activo(): await self.app(scope, receive, descartar)
+            except Exception as e:
+                original["error"] = repr(e)
+            finally:
+                perfilado.actual.reset(token)
+        ms = (time.perf_counter()-perfil.inicio)*1000
+        cabeceras = {"X-Profile-Status": str(original["estado"]), "X-Profile-Wall-Ms": f"{ms:.1f}", "Cache-Control": "no-store"}
+        if modo=="pstats":
+            resp = Response(perfil.volcado(), media_type="application/octet-stream", headers=cabeceras)
+        else:
+            titulo = f"# {scope['method']} {scope['path']} -> {original['estado']}{' ' + original['error'] if original['error'] else ''}, {original['bytes']:,} bytes, {ms:.1f} ms\n"
+            resp = Response(titulo + perfil.texto(lineas=PERFIL_LINEAS), media_type="text/plain; charset=utf-8", headers=cabeceras)
+        await resp(scope, receive, send)
+
+if PERFILADO: app.add_middleware(_PerfilHTTP)
+# la última agregada es la más externa: mide también el tiempo de gzip y los bytes que salen por la red
+if metricas.ACTIVAS: app.add_middleware(_MetricasHTTP)
 
 def _check_key(x_api_key: str | None):
     if x_api_key!=API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
+def firmar_export(pares)->str:
+    """Firma de un enlace de descarga (el navegador no manda x-api-key): HMAC con la API key de los parámetros
+    ordenados, incluido `expira` (epoch s). api_client.url_export arma el mismo texto."""
+    return hmac.new(API_KEY.encode(), urlencode(sorted(pares)).encode(), hashlib.sha256).hexdigest()
+
+def _check_key_o_firma(x_api_key: str | None, request: Request):
+    if x_api_key==API_KEY: return
+    q = request.query_params; pares = [(k, v) for k, v in q.multi_items() if k!="firma"]
+    vigente = q.get("expira", "").isdigit() and int(q["expira"]) >= time.time()
+    if not (vigente and hmac.compare_digest(q.get("firma", ""), firmar_export(pares))):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+def _json_df(df: pd.DataFrame)->str:
+    # serializador de pandas (C): NaN/NaT salen como null y evita el paso por dicts de Python
+    return df.to_json(orient="records", force_ascii=False, date_format="iso")
+
+def _json(texto: str)->Response:
+    # JSON ya serializado en el hilo que lo llama: en rutas async FastAPI serializaría en el event loop
+    return Response(content=texto, media_type="application/json")
+
+def _etag(resp: Response, if_none_match: str | None)->Response:
+    # Catálogos: ETag por contenido; si el cliente ya tiene esa versión, 304 sin cuerpo.
+    # Débil (W/) porque GZip cambia los bytes enviados pero no el contenido
+    etag = f'W/"{hashlib.blake2b(resp.body, digest_size=12).hexdigest()}"'
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if if_none_match and etag in (e.strip() for e in if_none_match.split(",")):
+        return Response(status_code=304, headers=cabeceras)
+    resp.headers.update(cabeceras); return resp
+
+ARROW_MEDIA, PARQUET_MEDIA = store.EXPORT_FORMATOS["arrow"], store.EXPORT_FORMATOS["parquet"]
+
+def _columnar(df: pd.DataFrame, accept: str, compresion: str | None):
+    """Respuesta columnar si el cliente la pide en Accept (Arrow IPC o Parquet, tipos preservados);
+    None para seguir con JSON (también si pyarrow no está instalado)."""
+    if ARROW_MEDIA not in accept and PARQUET_MEDIA not in accept: return None
+    try:
+        import pyarrow as pa, pyarrow.parquet as pq
+    except ImportError:
+        return None
+    tabla, sink = store.tabla_arrow(df), pa.BufferOutputStream()
+    if ARROW_MEDIA in accept:
+        opciones = pa.ipc.IpcWriteOptions(compression=compresion) if compresion else None
+        with pa.ipc.new_stream(sink, tabla.schema, options=opciones) as w: w.write_table(tabla)
+        media = ARROW_MEDIA
+    else:
+        pq.write_table(tabla, sink, compression=compresion or "snappy"); media = PARQUET_MEDIA
+    return Response(content=sink.getvalue().to_pybytes(), media_type=media)
+
+def _negociar(df: pd.DataFrame, accept: str | None, compresion: str | None, a_json=None)->Response:
+    """Arrow/Parquet o JSON (de a_json(df) si se pasa) según Accept. Vary: Accept en toda respuesta negociada,
+    también en el JSON: sin él un caché intermedio podría servir un cuerpo Arrow a quien pidió JSON."""
+    resp = _columnar(df, accept or "", compresion) or _json(_json_df(a_json(df) if a_json else df))
+    resp.headers["Vary"] = "Accept"; return resp
+
+def _fecha_texto(df: pd.DataFrame)->pd.DataFrame:
+    return df.assign(Fecha_Creación=df["Fecha_Creación"].astype(str))
+
 class Ticket(BaseModel):
     ID_Ticket: str
     Empresa: str
@@ -34,72 +227,383 @@ class Ticket(BaseModel):
     Comentarios: str | None = None
     Satisfacción: float | None = None
 
+class TicketNuevo(BaseModel):
+    # alta sin ID: lo asigna la secuencia del storage
+    Empresa: str
+    Usuario_Reportante: str
+    Agente_Soporte: str
+    Módulo_ERP: str
+    Prioridad: str
+    Categoría: str
+    SLA: str
+    Estado: str = "Abierto"
+    Fecha_Creación: str | None = None
+    Tiempo_Resolución_hs: float | None = None
+    Comentarios: str | None = None
+    Satisfacción: float | None = None
+    usuario: str = "api"
+    rol: str = ""
+
+class TicketCambios(BaseModel):
+    # solo se aplican los campos enviados (exclude_unset); rowversion = la leída con GET /tickets/{id}
+    Empresa: Optional[str] = None
+    Usuario_Reportante: Optional[str] = None
+    Agente_Soporte: Optional[str] = None
+    Módulo_ERP: Optional[str] = None
+    Prioridad: Optional[str] = None
+    Categoría: Optional[str] = None
+    Estado: Optional[str] = None
+    SLA: Optional[str] = None
+    Fecha_Creación: Optional[str] = None
+    Tiempo_Resolución_hs: Optional[float] = None
+    Comentarios: Optional[str] = None
+    Satisfacción: Optional[float] = None
+    rowversion: Optional[int] = None
+    usuario: str = "api"
+    rol: str = ""
+    motivo: str = "Edición"
+
 class BulkUpdate(BaseModel):
     ids: List[str]
     set_estado: Optional[str] = None
     set_prioridad: Optional[str] = None
     set_agente: Optional[str] = None
+    usuario: str = "api"
+    rol: str = ""
+    motivo: str = "Acción masiva"
 
 @app.get("/usuarios")
-def usuarios(x_api_key: Optional[str]=Header(default=None)):
+async def usuarios(accept: Optional[str]=Header(default=None), compresion: Optional[str]=Query(None, pattern="^(lz4|zstd)$"),
+             if_none_match: Optional[str]=Header(default=None), x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    return store.load_usuarios_df().to_dict(orient="records")
+    def _resp():
+        df = store.load_usuarios_df()
+        return _etag(_negociar(df, accept, compresion), if_none_match)
+    return await db.leer(_resp)
+
+def filtros_tickets(empresa: Optional[str]=None, modulo: Optional[str]=None, estado: Optional[str]=None,
+                    prioridad: Optional[str]=None, agente: Optional[str]=None,
+                    desde: Optional[date]=None, hasta: Optional[date]=None, id_prefijo: Optional[str]=None,
+                    id_contiene: Optional[str]=None, cambios_desde: Optional[int]=None):
+    return {"empresa":empresa, "modulo":modulo, "estado":estado, "prioridad":prioridad, "agente":agente,
+            "desde":desde, "hasta":hasta, "id_prefijo":id_prefijo, "id_contiene":id_contiene, "cambios_desde":cambios_desde}
 
 @app.get("/tickets")
-def tickets(x_api_key: Optional[str]=Header(default=None)):
+async def tickets(filtros: dict = Depends(filtros_tickets),
+            orden: str = Query("desc", pattern="^(asc|desc)$"), cursor: Optional[str] = None,
+            limit: Optional[int] = Query(None, ge=1, le=5000), accept: Optional[str]=Header(default=None),
+            compresion: Optional[str]=Query(None, pattern="^(lz4|zstd)$"), x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    def _resp():
+        # consulta + serialización en el hilo lector: el event loop queda libre para otras rutas
+        df = store.load_tickets_df(**filtros, orden=orden, cursor=cursor, limit=limit)
+        resp = _negociar(df, accept, compresion, _fecha_texto)
+        if df.attrs.get("cursor"): resp.headers["X-Next-Cursor"] = df.attrs["cursor"]
+        return resp
+    return await db.leer(_resp)
+
+@app.get("/tickets/search")
+async def tickets_search(q: str = Query(..., min_length=1), filtros: dict = Depends(filtros_tickets),
+                         cursor: Optional[int] = Query(None, ge=0), limit: int = Query(50, ge=1, le=500),
+                         accept: Optional[str]=Header(default=None), compresion: Optional[str]=Query(None, pattern="^(lz4|zstd)$"),
+                         x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    def _resp():
+        df = store.buscar_tickets(q, cursor=cursor, limit=limit, **filtros)
+        resp = _negociar(df, accept, compresion, _fecha_texto)
+        if df.attrs.get("cursor"): resp.headers["X-Next-Cursor"] = df.attrs["cursor"]
+        return resp
+    return await db.leer(_resp)
+
+@app.get("/tickets/conteo")
+async def tickets_conteo(filtros: dict = Depends(filtros_tickets), por: str = Query("estado", pattern="^(empresa|modulo|estado|prioridad|agente)$"),
+                         x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    return store.load_tickets_df().assign(
-        Fecha_Creación=lambda d: d["Fecha_Creación"].astype(str)
-    ).to_dict(orient="records")
+    return await db.leer(store.contar_tickets, por, **filtros)
+
+@app.get("/tickets/export")
+async def export_tickets(request: Request, filtros: dict = Depends(filtros_tickets), formato: str = Query("csv", pattern="^(csv|arrow|parquet)$"),
+                   orden: str = Query("desc", pattern="^(asc|desc)$"), expira: Optional[int] = None, firma: Optional[str] = None,
+                   x_api_key: Optional[str]=Header(default=None)):
+    # con x-api-key o con un enlace firmado vigente (descarga directa desde el navegador, ver firmar_export)
+    _check_key_o_firma(x_api_key, request)
+    if formato!="csv":
+        try: import pyarrow  # noqa: F401
+        except ImportError: raise HTTPException(status_code=406, detail="Formato no disponible: instalar pyarrow")
+    ext = {"csv":"csv", "arrow":"arrows", "parquet":"parquet"}[formato]
+    # cada lote se lee en los hilos lectores de AsyncStore con una conexión propia del export (no la del pool);
+    # si el cliente corta, el cursor y la conexión se cierran ahí
+    return StreamingResponse(db.iterar(store.iter_tickets_export, formato, orden=orden, **filtros),
+                             media_type=store.EXPORT_FORMATOS[formato],
+                             headers={"Content-Disposition": f'attachment; filename="tickets_filtrados.{ext}"'})
 
 @app.post("/tickets")
-def upsert(ticket: Ticket, x_api_key: Optional[str]=Header(default=None)):
+async def upsert(ticket: Ticket, x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    store.upsert_ticket(ticket.dict())
+    await db.escribir(store.upsert_ticket, ticket.dict())
     return {"ok": True}
 
+@app.post("/tickets/new", status_code=201)
+async def crear(ticket: TicketNuevo, x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    datos = ticket.dict(); usuario, rol = datos.pop("usuario"), datos.pop("rol")
+    return {"ok": True, "ID_Ticket": await db.escribir(store.crear_ticket, datos, usuario, rol)}
+
 @app.post("/tickets/bulk_update")
-def bulk_update(payload: BulkUpdate, x_api_key: Optional[str]=Header(default=None)):
-    _check_key(x_api_key)
-    df = store.load_tickets_df()
-    updated = 0
-    for tid in payload.ids:
-        m = df[df["ID_Ticket"]==tid]
-        if m.empty: continue
-        rec = m.iloc[0].to_dict()
-        if payload.set_estado:    rec["Estado"] = payload.set_estado
-        if payload.set_prioridad: rec["Prioridad"] = payload.set_prioridad
-        if payload.set_agente:    rec["Agente_Soporte"] = payload.set_agente
-        store.upsert_ticket(rec); updated += 1
-    return {"updated": updated}
+async def bulk_update(payload: BulkUpdate, x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    return {"updated": await db.escribir(store.bulk_update_tickets, **payload.dict())}
+
+# ====== INGESTA MASIVA (POST /tickets/batch: array JSON, JSONL o CSV en streaming, gzip opcional) ======
+INGESTA_FORMATOS = {"application/json": "json", "application/x-ndjson": "jsonl", "application/jsonl": "jsonl", "text/csv": "csv"}
+INGESTA_ERRORES_MAX = 1000  # errores detallados en la respuesta; `con_error` siempre trae el total
+
+class TicketIngesta(Ticket):
+    # además de los tipos, la fecha tiene que ser ISO 8601: de ella dependen rollups, SLA y el orden
+    @field_validator("Fecha_Creación")
+    @classmethod
+    def _fecha_iso(cls, v: str)->str:
+        datetime.fromisoformat(v); return v
+
+_TICKETS_INGESTA = TypeAdapter(List[TicketIngesta])
+_INGESTA_REQUERIDAS = [c for c, f in TicketIngesta.model_fields.items() if f.is_required()]
+
+async def _texto(request: Request):
+    gz = zlib.decompressobj(wbits=31) if request.headers.get("content-encoding", "").lower()=="gzip" else None
+    dec = codecs.getincrementaldecoder("utf-8-sig")()  # -sig: CSV exportados de Excel traen BOM
+    async for parte in request.stream():
+        if gz: parte = gz.decompress(parte)
+        if parte: yield dec.decode(parte)
+    yield dec.decode(gz.flush() if gz else b"", final=True)
+
+async def _registros(request: Request, formato: str):
+    """(n° de registro, registro crudo) a medida que llega el cuerpo: JSONL y CSV nunca se cargan enteros.
+    En CSV la cabecera es el registro 1 (coincide con la fila de la planilla)."""
+    if formato=="json":
+        try:
+            datos = await db.leer(json.loads, "".join([t async for t in _texto(request)]))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        if not isinstance(datos, list): raise HTTPException(status_code=400, detail="Se esperaba un array de tickets")
+        for n, d in enumerate(datos, 1): yield n, d
+        return
+    resto, registro, n = "", "", 0
+    async for texto in _texto(request):
+        *lineas, resto = (resto + texto).split("\n")
+        for linea in lineas:
+            registro = f"{registro}\n{linea}" if registro else linea
+            if formato=="csv" and registro.count('"') % 2: continue  # campo entre comillas con saltos de línea
+            if registro.strip(): n += 1; yield n, registro.rstrip("\r")
+            registro = ""
+    registro = f"{registro}\n{resto}" if registro else resto
+    if registro.strip(): yield n+1, registro.rstrip("\r")
+
+def _validar_ingesta(formato: str, cabecera, crudos: list)->tuple:
+    """En un hilo lector: parsea los registros crudos y valida el lote de una vez (pydantic-core).
+    Devuelve (dicts válidos, su n° de registro, errores por fila)."""
+    registros, numeros, errores = [], [], []
+    for n, crudo in crudos:
+        try:
+            if formato=="jsonl": crudo = json.loads(crudo)
+            elif formato=="csv":
+                valores = next(csv.reader([crudo]))
+                if len(valores)!=len(cabecera): raise ValueError(f"{len(valores)} columnas, se esperaban {len(cabecera)}")
+                crudo = {c: v if v!="" else None for c, v in zip(cabecera, valores)}
+        except (ValueError, csv.Error) as e:
+            errores.append({"fila": n, "ID_Ticket": None, "error": f"registro ilegible: {e}"}); continue
+        registros.append(crudo); numeros.append(n)
+    try:
+        validos = _TICKETS_INGESTA.validate_python(registros)
+    except ValidationError as e:
+        malos = {}
+        for err in e.errors(include_url=False):
+            i, *campo = err["loc"]; malos.setdefault(i, []).append(f"{'.'.join(map(str, campo)) or 'registro'}: {err['msg']}")
+        errores += [{"fila": numeros[i], "ID_Ticket": registros[i].get("ID_Ticket") if isinstance(registros[i], dict) else None,
+                     "error": "; ".join(m)} for i, m in malos.items()]
+        registros = [r for i, r in enumerate(registros) if i not in malos]; numeros = [x for i, x in enumerate(numeros) if i not in malos]
+        validos = _TICKETS_INGESTA.validate_python(registros)
+    return _TICKETS_INGESTA.dump_python(validos), numeros, errores
+
+@app.post("/tickets/batch")
+async def ingesta(request: Request, lote: int = Query(store.INGESTA_LOTE, ge=100, le=50_000),
+                  content_type: Optional[str]=Header(default=None), x_api_key: Optional[str]=Header(default=None)):
+    # upsert masivo para integraciones: cada `lote` registros se validan juntos y se guardan en una transacción;
+    # las filas válidas se guardan aunque otras fallen (errores por n° de registro). Los registros hasta
+    # `hasta_registro` ya están procesados: si el request falla a mitad, el error trae ese mismo resumen
+    _check_key(x_api_key)
+    formato = INGESTA_FORMATOS.get((content_type or "").split(";")[0].strip().lower())
+    if formato is None: raise HTTPException(status_code=415, detail=f"Content-Type soportados: {', '.join(INGESTA_FORMATOS)}")
+    res, errores, crudos, cabecera = {"recibidos": 0, "guardados": 0, "con_error": 0, "lotes": 0, "hasta_registro": 0}, [], [], None
+    guardando = fallo = None  # el lote anterior se escribe mientras se recibe y valida el siguiente
+    async def guardar(registros, numeros, malos, hasta):
+        # un lote validado entra en una sola transacción de upsert_tickets: si falla, no queda nada de él
+        rechazados = await db.escribir(store.upsert_tickets, registros, lote) if registros else []
+        malos += [{"fila": numeros[i], "ID_Ticket": registros[i]["ID_Ticket"], "error": e} for i, e in rechazados]
+        res["guardados"] += len(registros)-len(rechazados); res["con_error"] += len(malos); res["lotes"] += 1; res["hasta_registro"] = hasta
+        errores.extend(sorted(malos, key=lambda e: e["fila"])[:INGESTA_ERRORES_MAX-len(errores)])
+    async def volcar():
+        nonlocal guardando
+        hasta = crudos[-1][0]; validados = await db.leer(_validar_ingesta, formato, cabecera, list(crudos)); crudos.clear()
+        if guardando: await guardando
+        guardando = asyncio.ensure_future(guardar(*validados, hasta))
+    try:
+        async for n, crudo in _registros(request, formato):
+            if formato=="csv" and cabecera is None:
+                cabecera = [c.strip() for c in next(csv.reader([crudo]))]
+                faltan = [c for c in _INGESTA_REQUERIDAS if c not in cabecera]
+                if faltan: raise HTTPException(status_code=400, detail=f"Faltan columnas en la cabecera CSV: {', '.join(faltan)}")
+                continue
+            res["recibidos"] += 1; crudos.append((n, crudo))
+            if len(crudos) >= lote: await volcar()
+        if crudos: await volcar()
+        if guardando: await guardando
+    except UnicodeDecodeError:
+        fallo = (400, "El cuerpo no es UTF-8 válido")
+    except zlib.error:
+        fallo = (400, "Cuerpo gzip inválido")
+    except store.IngestaInterrumpida as e:
+        fallo = (503, f"La base no pudo guardar un lote: {e.__cause__}")
+    finally:
+        # si el request falla (o el cliente corta) con un lote escribiéndose, ese lote termina igual: cancelar la
+        # tarea no frena al hilo escritor. Se espera antes de responder, así el resumen dice lo que quedó guardado
+        if guardando:
+            await asyncio.wait([guardando])
+            if not guardando.cancelled(): guardando.exception()  # su error, si lo hubo, ya lo cubre el del request
+    if fallo: raise HTTPException(status_code=fallo[0], detail={"error": fallo[1], **res, "errores": errores})
+    return {**res, "errores": errores}
+
+# rutas con {ticket_id} después de las fijas (/tickets/search, /tickets/conteo, /tickets/export...)
+@app.get("/tickets/{ticket_id}")
+async def ticket(ticket_id: str, x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    fila = await db.leer(store.get_ticket, ticket_id)
+    if fila is None: raise HTTPException(status_code=404, detail="Ticket inexistente")
+    return fila
+
+@app.patch("/tickets/{ticket_id}")
+async def patch_ticket(ticket_id: str, payload: TicketCambios, x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    meta = {k: getattr(payload, k) for k in ("rowversion", "usuario", "rol", "motivo")}
+    cambios = {k: v for k, v in payload.dict(exclude_unset=True).items() if k not in meta}
+    try:
+        fila = await db.escribir(store.patch_ticket, ticket_id, cambios, **meta)
+    except store.ConflictoVersion as e:
+        raise HTTPException(status_code=409, detail={"error": "conflicto de versión", "actual": e.actual})
+    if fila is None: raise HTTPException(status_code=404, detail="Ticket inexistente")
+    return fila
+
+def _delta_json(delta: dict)->str:
+    return ('{"hasta":%d,"mas":%s,"recargar":%s,"borrados":%s,"tickets":%s}' % (
+        delta["hasta"], json.dumps(delta["mas"]), json.dumps(delta["recargar"]),
+        json.dumps(delta["borrados"], ensure_ascii=False), _json_df(delta["tickets"]) if len(delta["tickets"]) else "[]"))
+
+@app.get("/changes")
+async def changes(since: Optional[int]=None, limit: int = Query(1000, ge=1, le=10000), x_api_key: Optional[str]=Header(default=None)):
+    # sin since: solo el cursor actual (tomarlo antes de la carga completa y seguir desde ahí)
+    _check_key(x_api_key)
+    return await db.leer(lambda: _json(_delta_json(store.cambios_desde(since, limit))))
+
+@app.get("/changes/stream")
+async def changes_stream(request: Request, since: Optional[int]=None, last_event_id: Optional[str]=Header(default=None),
+                         x_api_key: Optional[str]=Header(default=None)):
+    # Server-Sent Events: un evento "cambios" por delta (id = cursor); al reconectar, Last-Event-ID retoma
+    _check_key(x_api_key)
+    # Last-Event-ID lo reenvía el navegador tal como lo recibió: si no es un cursor válido se sigue desde `since`
+    # (un 400 cortaría EventSource para siempre en lugar de dejarlo reconectar)
+    cursor = int(last_event_id) if last_event_id and last_event_id.isascii() and last_event_id.isdigit() else since
+    if cursor is None: cursor = await db.leer(store.ultimo_cambio)
+    async def eventos(cursor: int):
+        yield f"retry: 3000\n: desde {cursor}\n\n"
+        # la primera vuelta no espera: un cliente que reconecta se pone al día enseguida. Vida acotada para
+        # que uvicorn pueda apagarse (espera a que terminen las respuestas abiertas) y rebalancear conexiones
+        esperar, fin = False, asyncio.get_running_loop().time() + FEED_DURACION
+        while not await request.is_disconnected() and (resto := fin - asyncio.get_running_loop().time()) > 0:
+            if esperar:
+                try:
+                    await feed.esperar(cursor, min(FEED_LATIDO, resto))
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"; continue
+            esperar = mas = True
+            while mas:
+                delta = await db.leer(store.cambios_desde, cursor)
+                if delta["hasta"]==cursor and not delta["recargar"]: break
+                mas = delta["mas"]; cursor = delta["hasta"]
+                yield f"id: {cursor}\nevent: cambios\ndata: {_delta_json(delta)}\n\n"
+    return StreamingResponse(eventos(cursor), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stats")
+async def stats(desde: Optional[date]=None, hasta: Optional[date]=None, agente: Optional[str]=None,
+          x_api_key: Optional[str]=Header(default=None)):
+    # orient="split": cada frame viaja con sus columnas, así un rango sin tickets no llega como [] sin esquema
+    _check_key(x_api_key)
+    return await db.leer(lambda: _json("{" + ",".join(
+        f'"{k}":{v.to_json(orient="split", index=False, force_ascii=False, date_format="iso")}'
+        for k, v in store.load_stats(desde, hasta, agente).items()) + "}"))
 
 @app.get("/clientes")
-def clientes(x_api_key: Optional[str]=Header(default=None)):
+async def clientes(if_none_match: Optional[str]=Header(default=None), x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    return store.list_clientes()
+    return _etag(_json(json.dumps(await db.leer(store.list_clientes), ensure_ascii=False)), if_none_match)
 
 @app.post("/clientes")
-def add_cliente(nombre: str, x_api_key: Optional[str]=Header(default=None)):
+async def add_cliente(nombre: str, x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    store.add_cliente_si_no_existe(nombre)
+    await db.escribir(store.add_cliente_si_no_existe, nombre)
     return {"ok": True}
 
 @app.get("/reportantes")
-def reportantes(cliente: str = Query(...), x_api_key: Optional[str]=Header(default=None)):
+async def reportantes(cliente: str = Query(...), if_none_match: Optional[str]=Header(default=None),
+                      x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    return store.list_reportantes(cliente)
+    return _etag(_json(json.dumps(await db.leer(store.list_reportantes, cliente), ensure_ascii=False)), if_none_match)
 
 @app.post("/reportantes")
-def add_reportante(cliente: str, nombre: str, x_api_key: Optional[str]=Header(default=None)):
+async def add_reportante(cliente: str, nombre: str, x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    store.add_reportante_si_no_existe(cliente, nombre)
+    await db.escribir(store.add_reportante_si_no_existe, cliente, nombre)
     return {"ok": True}
 
 class Audit(BaseModel):
     usuario: str; rol: str; ticket: str; campo: str; antes: str; despues: str; motivo: str
 
+class AuditBatch(BaseModel):
+    registros: List[Audit]
+    ticket: Optional[Ticket] = None  # si viene, se guarda en la misma transacción que su auditoría
+
+@app.post("/auditoria/batch")
+async def auditoria_batch(payload: AuditBatch, x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    registros = [r.dict() for r in payload.registros]
+    ticket = payload.ticket.dict() if payload.ticket else None
+    return {"ok": True, "registrados": await db.escribir(store.registrar_auditoria_batch, registros, ticket)}
+
+@app.get("/auditoria")
+async def auditoria_listado(ticket: Optional[str]=None, usuario: Optional[str]=None, campo: Optional[str]=None,
+                            desde: Optional[date]=None, hasta: Optional[date]=None, cursor: Optional[str]=None,
+                            limit: int = Query(100, ge=1, le=1000), accept: Optional[str]=Header(default=None),
+                            compresion: Optional[str]=Query(None, pattern="^(lz4|zstd)$"), x_api_key: Optional[str]=Header(default=None)):
+    _check_key(x_api_key)
+    def _resp():
+        df = store.load_auditoria(ticket, usuario, campo, desde, hasta, cursor, limit)
+        resp = _negociar(df, accept, compresion)
+        if df.attrs.get("cursor"): resp.headers["X-Next-Cursor"] = df.attrs["cursor"]
+        return resp
+    return await db.leer(_resp)
+
 @app.post("/auditoria")
-def auditoria(reg: Audit, x_api_key: Optional[str]=Header(default=None)):
+async def auditoria(reg: Audit, x_api_key: Optional[str]=Header(default=None)):
     _check_key(x_api_key)
-    store.registrar_auditoria(**reg.dict())
+    await db.escribir(store.registrar_auditoria, **reg.dict())
     return {"ok": True}
+
+@app.get("/debug/consultas_lentas")
+async def consultas_lentas(limit: int = Query(50, ge=1, le=200), x_api_key: Optional[str]=Header(default=None)):
+    # sentencias SQL sobre ERP_SQL_LENTO_MS en este proceso, con su EXPLAIN QUERY PLAN
+    _check_key(x_api_key)
+    return store.consultas_lentas(limit)
+
+@app.get("/metrics")
+async def metrics(x_api_key: Optional[str]=Header(default=None)):
+    # formato de exposición de Prometheus (scrape con la cabecera x-api-key)
+    _check_key(x_api_key)
+    return Response(content=metricas.exponer(), media_type=metricas.MEDIA)
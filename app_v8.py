@@ -1,4 +1,4 @@
-import streamlit as st, pandas as pd, altair as alt, time
+import streamlit as st, pandas as pd, numpy as np, altair as alt, time, os, tempfile, functools
 from datetime import datetime, timedelta, date
 
 # ====== CONFIG - AÑADIR UN TÍTULO Y CONFIGURAR EL LAYOUT ======
@@ -26,23 +26,66 @@ EXPECTED_USER_COLS = ["usuario","contraseña","rol","nombre_agente"]
 SLA_OBJ_HORAS = {"Alta": 24, "Media": 48, "Baja": 72}
 UMBRAL_CSAT_BAJO = 3.0
 CRITICOS_POR_PRIORIDAD = {"Alta": True, "Media": False, "Baja": False}
+TICKETS_POR_PAGINA = [50, 100, 200, 500]
 
 # ====== DATASOURCE ======
 USE_API = st.sidebar.checkbox("Usar API (FastAPI) en lugar de SQLite local", value=False, help="Para demo de arquitectura desacoplada")
 if USE_API:
     from api_client import (
-        load_usuarios_df, load_tickets_df, upsert_ticket,
-        registrar_auditoria as registrar_auditoria_db,
+        load_usuarios_df, load_tickets_df, get_ticket, patch_ticket, ConflictoVersion,
         list_clientes, list_reportantes, create_cliente, create_reportante,
-        bulk_update_tickets
+        bulk_update_tickets, load_stats, export_tickets, crear_ticket, load_auditoria, contar_tickets, buscar_tickets,
+        seguir_cambios, url_export
     )
 else:
     from storage_sqlite import (
-        load_usuarios_df, load_tickets_df, upsert_ticket,
-        registrar_auditoria as registrar_auditoria_db,
-        list_clientes, list_reportantes, add_cliente_si_no_existe, add_reportante_si_no_existe, _conn
+        load_usuarios_df, load_tickets_df, get_ticket, patch_ticket, ConflictoVersion,
+        list_clientes, list_reportantes, add_cliente_si_no_existe, add_reportante_si_no_existe,
+        bulk_update_tickets, load_stats, export_tickets, crear_ticket, load_auditoria, contar_tickets, buscar_tickets
     )
 
+from ticket_cache import TicketCache
+
+# Un caché por proceso y por origen de datos, compartido por todas las sesiones: carga completa una vez,
+# luego solo filas con rowversion nuevo, consultadas como mucho cada REFRESCO_TICKETS segundos (las
+# escrituras de este proceso marcan el caché y se ven en el rerun siguiente)
+REFRESCO_TICKETS = float(os.environ.get("ERP_CACHE_REFRESCO", "2"))
+CATALOGO_TTL = float(os.environ.get("ERP_CATALOGO_TTL", "60"))
+# Con la API, el feed SSE (/changes/stream) empuja los cambios al caché; el sondeo queda como respaldo
+FEED_CAMBIOS = os.environ.get("ERP_FEED_CAMBIOS", "1")=="1"
+REFRESCO_CON_FEED = 60
+
+@st.cache_resource(show_spinner=False)
+def _ticket_cache(use_api: bool)->TicketCache:
+    if not (use_api and FEED_CAMBIOS):
+        return TicketCache(load_tickets_df, ensure_ticket_schema, refresco=REFRESCO_TICKETS)
+    cache = TicketCache(load_tickets_df, ensure_ticket_schema, refresco=REFRESCO_CON_FEED)
+    seguir_cambios(cache); return cache
+
+@st.cache_resource(show_spinner=False, ttl=CATALOGO_TTL)
+def _usuarios(use_api: bool)->pd.DataFrame:
+    return ensure_user_schema(load_usuarios_df())  # compartido y de solo lectura, como el frame de tickets
+
+def tickets_de(agente: str)->pd.DataFrame:
+    # vista por agente compartida entre sesiones: se arma una vez por cambio del frame, no en cada rerun
+    return _ticket_cache(USE_API).vista(("agente", agente), lambda df: df[df["Agente_Soporte"]==agente])
+
+def _datos_cambiados():
+    _ticket_cache(USE_API).marcar()
+
+# ====== MÉTRICAS (tiempo por pantalla y por rerun; ERP_METRICAS_PUERTO expone /metrics de este proceso) ======
+import metricas
+_M_PAGINA = metricas.histograma("erp_pagina_segundos", "Tiempo de render por pantalla de Streamlit", ("pagina",))
+if os.environ.get("ERP_METRICAS_PUERTO"):
+    metricas.servir(int(os.environ["ERP_METRICAS_PUERTO"]), os.environ.get("ERP_METRICAS_HOST", "127.0.0.1"))
+
+def cronometrada(fn):
+    # cuenta también las pantallas que cortan con st.rerun()/st.stop() (salen por excepción)
+    @functools.wraps(fn)
+    def medida(*args, **kwargs):
+        with _M_PAGINA.medir(pagina=fn.__name__): return fn(*args, **kwargs)
+    return medida
+
 # ====== UI THEME (Profesional V9.3) ======
 def aplicar_tema():
     # Colores profesionales
@@ -107,14 +150,34 @@ def do_login(df_users: pd.DataFrame):
             st.error("Credenciales inválidas o rol incorrecto.")
 
 # ====== SCHEMA HELPERS ======
+# Frame compacto: columnas de vocabulario acotado como Categorical (un código int8 por fila en lugar de un
+# string), fechas datetime64 y métricas float32. Las categorías son el vocabulario conocido + lo observado
+VOCABULARIOS = {"Módulo_ERP": MODULOS, "Prioridad": PRIORIDADES, "Categoría": CATEGORIAS, "Estado": ESTADOS,
+                "SLA": SLA_VALUES, "Empresa": [], "Agente_Soporte": [], "Usuario_Reportante": []}
+METRICAS = ["Tiempo_Resolución_hs", "Satisfacción"]
+
+def _categorica(s: pd.Series, vocabulario: list)->pd.Series:
+    if isinstance(s.dtype, pd.CategoricalDtype): return s
+    extra = sorted(set(s.dropna().unique()) - set(vocabulario))
+    return s.astype(pd.CategoricalDtype(vocabulario + extra))
+
 def ensure_ticket_schema(df: pd.DataFrame)->pd.DataFrame:
     if df.empty: df = pd.DataFrame(columns=EXPECTED_TICKET_COLS)
     for c in EXPECTED_TICKET_COLS:
         if c not in df.columns: df[c] = pd.Series(dtype="object")
-    df["Fecha_Creación"] = pd.to_datetime(df["Fecha_Creación"], errors="coerce")
-    df["Tiempo_Resolución_hs"] = pd.to_numeric(df["Tiempo_Resolución_hs"], errors="coerce")
-    df["Satisfacción"] = pd.to_numeric(df["Satisfacción"], errors="coerce")
-    return df[EXPECTED_TICKET_COLS]
+    df = df[EXPECTED_TICKET_COLS]
+    return df.assign(
+        **{c: _categorica(df[c], v) for c, v in VOCABULARIOS.items()},
+        **{c: pd.to_numeric(df[c], errors="coerce").astype("float32") for c in METRICAS},
+        Fecha_Creación=pd.to_datetime(df["Fecha_Creación"], errors="coerce"))
+
+def registros_ticket(df: pd.DataFrame)->list:
+    # filas como dicts para guardar: float32 -> float64 redondeado (10.9 y no 10.899999618...) para no escribir ruido
+    return df.astype({c: "float64" for c in METRICAS}).round({c: 4 for c in METRICAS}).to_dict(orient="records")
+
+def valores(s: pd.Series)->list:
+    # valores presentes (sin NaN); con categóricas se resuelve sobre los códigos, sin materializar un string por fila
+    return [str(v) for v in s.dropna().unique()]
 
 def ensure_user_schema(df: pd.DataFrame)->pd.DataFrame:
     if df.empty: df = pd.DataFrame(columns=EXPECTED_USER_COLS)
@@ -143,40 +206,79 @@ def es_vencido(r)->bool:
     if pd.isna(f): return False
     return (str(r.get("Estado","")) not in ["Resuelto","Cerrado"]) and ((pd.Timestamp.now()-f)>pd.Timedelta(days=10))
 
-def low_csat_clientes(df: pd.DataFrame)->pd.DataFrame:
-    c = df.groupby("Empresa")["Satisfacción"].mean().reset_index().rename(columns={"Satisfacción":"CSAT"})
+# Motor columnar: una sola pasada vectorizada contra un único "now" (reemplaza df.apply por fila)
+def sla_frame(df: pd.DataFrame, now=None)->pd.DataFrame:
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    f = pd.to_datetime(df["Fecha_Creación"], errors="coerce")
+    edad = now - f
+    horas = (edad.dt.total_seconds()/3600.0).fillna(0.0)
+    abierto = ~df["Estado"].isin(["Resuelto","Cerrado"])
+    fuera = df["SLA"].eq("Fuera de SLA")
+    breach = abierto & (horas > df["Prioridad"].map(SLA_OBJ_HORAS).fillna(999999).astype(float))
+    critico = df["Prioridad"].map(CRITICOS_POR_PRIORIDAD).fillna(False).astype(bool) | fuera | breach
+    vencido = fuera | (abierto & f.notna() & (edad > pd.Timedelta(days=10)))
+    return pd.DataFrame({
+        "horas_desde_creacion": horas, "edad_dias": edad.dt.days,
+        "sla_breached": breach, "es_critico": critico, "es_vencido": vencido,
+    }, index=df.index)
+
+def low_csat_clientes(c: pd.DataFrame)->pd.DataFrame:
+    # c: CSAT promedio por Empresa sobre resueltos/cerrados (stats["csat_empresa"])
     return c[c["CSAT"]<UMBRAL_CSAT_BAJO].sort_values("CSAT")
 
 # ====== FILTROS ======
-def filtros_tickets(df: pd.DataFrame, enable_agente_filter=False)->pd.DataFrame:
+# Devuelve los filtros como kwargs de load_tickets_df: se resuelven en SQL (local o vía API), no sobre el frame
+def filtros_tickets(df: pd.DataFrame, enable_agente_filter=False)->dict:
     empresas_list = sorted(list_clientes()) 
     with st.expander("🔎 Filtros", expanded=True):
         c1,c2,c3,c4,c5 = st.columns(5)
         codigo = c1.text_input("Código", placeholder="TCK-...")
         cliente = c2.selectbox("Cliente", ["Todos"] + empresas_list) 
-        filtro_mod = c3.selectbox("Módulo", ["Todos"]+sorted(list(set(MODULOS+df["Módulo_ERP"].dropna().astype(str).tolist()))))
-        filtro_est = c4.selectbox("Estado", ["Todos"]+[e for e in ESTADOS if e in df["Estado"].unique()])
-        filtro_pri = c5.selectbox("Prioridad", ["Todos"]+[p for p in PRIORIDADES if p in df["Prioridad"].unique()])
+        filtro_mod = c3.selectbox("Módulo", ["Todos"]+sorted(set(MODULOS+valores(df["Módulo_ERP"]))))
+        estados, prioridades = set(valores(df["Estado"])), set(valores(df["Prioridad"]))
+        filtro_est = c4.selectbox("Estado", ["Todos"]+[e for e in ESTADOS if e in estados])
+        filtro_pri = c5.selectbox("Prioridad", ["Todos"]+[p for p in PRIORIDADES if p in prioridades])
+        c6,c7,c8 = st.columns([1,2,2])
         if enable_agente_filter:
-            c6,_ = st.columns([1,4])
-            agente_sel = c6.selectbox("Agente", ["Todos"]+sorted(df["Agente_Soporte"].dropna().astype(str).unique().tolist()))
+            agente_sel = c6.selectbox("Agente", ["Todos"]+sorted(valores(df["Agente_Soporte"])))
         else:
-            agente_sel = "Todos"
-    q = df.copy()
-    if codigo: q = q[q["ID_Ticket"].astype(str).str.contains(codigo, case=False, na=False)]
-    if cliente!="Todos": q = q[q["Empresa"]==cliente]
-    if filtro_mod!="Todos": q = q[q["Módulo_ERP"]==filtro_mod]
-    if filtro_est!="Todos": q = q[q["Estado"]==filtro_est]
-    if filtro_pri!="Todos": q = q[q["Prioridad"]==filtro_pri]
-    if agente_sel!="Todos": q = q[q["Agente_Soporte"]==agente_sel]
-    return q
+            agente_sel = st.session_state["nombre_agente"] if st.session_state.get("rol")=="Agente" else "Todos"
+        rango = c7.date_input("Rango de fechas", value=[], key="filtro_fechas_tickets")
+        busqueda = c8.text_input("Buscar texto", placeholder="cliente, reportante, categoría, comentarios...", key="filtro_busqueda")
+    todos = lambda v: None if v=="Todos" else v
+    return {
+        "q": busqueda.strip() or None,
+        "id_contiene": codigo.strip() or None, "empresa": todos(cliente), "modulo": todos(filtro_mod),
+        "estado": todos(filtro_est), "prioridad": todos(filtro_pri), "agente": todos(agente_sel),
+        "desde": rango[0] if len(rango)>0 else None, "hasta": rango[1] if len(rango)>1 else None,
+    }
+
+def paginar_tickets(filtros: dict, q: str | None = None)->pd.DataFrame:
+    # Keyset: se guarda la pila de cursores para poder volver; se reinicia al cambiar filtros/orden/tamaño
+    c1,c2,c3,c4 = st.columns([1,1,2,1])
+    orden = c1.selectbox("Orden", ["Más recientes","Más antiguos"], key="tk_orden", disabled=bool(q))
+    por_pagina = c2.selectbox("Por página", TICKETS_POR_PAGINA, key="tk_por_pagina")
+    clave = repr((sorted(filtros.items()), q, orden, por_pagina))
+    if st.session_state.get("_tk_clave")!=clave:
+        st.session_state["_tk_clave"] = clave; st.session_state["_tk_cursores"] = [None]
+    cursores = st.session_state["_tk_cursores"]
+    if q:  # búsqueda de texto (FTS5): orden por relevancia
+        raw = buscar_tickets(q, cursor=cursores[-1], limit=por_pagina, **filtros)
+    else:
+        raw = load_tickets_df(**filtros, orden="desc" if orden=="Más recientes" else "asc", cursor=cursores[-1], limit=por_pagina)
+    siguiente = raw.attrs.get("cursor")
+    c3.caption(f"Página {len(cursores)}" + (" · por relevancia" if q else ""))
+    with c4:
+        if st.button("◀", key="tk_prev", disabled=len(cursores)==1): cursores.pop(); st.rerun()
+        if st.button("▶", key="tk_next", disabled=not siguiente): cursores.append(siguiente); st.rerun()
+    return ensure_ticket_schema(raw)
 
 def tabla_estilada_criticos(df: pd.DataFrame):
     if df.empty: return st.dataframe(df, use_container_width=True)
-    def _rowstyle(r):
-        if es_critico(r) or es_vencido(r): return ['background-color: rgba(255,0,0,0.15)']*len(r)
-        return ['']*len(r)
-    st.dataframe(df.style.apply(_rowstyle, axis=1), use_container_width=True, hide_index=True)
+    sla = sla_frame(df); marcar = (sla["es_critico"] | sla["es_vencido"]).to_numpy()
+    def _estilos(d):
+        return pd.DataFrame(np.where(np.broadcast_to(marcar[:,None], d.shape), 'background-color: rgba(255,0,0,0.15)', ''), index=d.index, columns=d.columns)
+    st.dataframe(df.style.apply(_estilos, axis=None), use_container_width=True, hide_index=True)
 
 def seleccionar_ticket(df: pd.DataFrame):
     ids = df["ID_Ticket"].astype(str).tolist()
@@ -186,12 +288,23 @@ def seleccionar_ticket(df: pd.DataFrame):
     return st.selectbox("Seleccioná un ticket para gestionar", ids)
 
 # ====== EDITAR TICKET ======
-def form_editar_ticket(ticket_id: str, df_tickets: pd.DataFrame, df_users: pd.DataFrame):
+
+def _ticket_en_edicion(ticket_id: str):
+    # lectura por PK al elegir el ticket; la foto y su rowversion quedan en la sesión hasta guardar, así un
+    # cambio ajeno en el medio se rechaza como conflicto en lugar de pisarse
+    foto = st.session_state.get("_edicion")
+    if not foto or foto[0]!=ticket_id:
+        fila = get_ticket(ticket_id)
+        if fila is None: return None, None
+        foto = st.session_state["_edicion"] = (ticket_id, registros_ticket(ensure_ticket_schema(pd.DataFrame([fila])))[0], fila["rowversion"])
+    return foto[1], foto[2]
+
+@cronometrada
+def form_editar_ticket(ticket_id: str, df_users: pd.DataFrame):
     st.markdown(f"### ✏️ Editando **{ticket_id}**")
-    idxs = df_tickets.index[df_tickets["ID_Ticket"]==ticket_id]
-    if len(idxs)==0:
+    row, version = _ticket_en_edicion(ticket_id)
+    if row is None:
         st.error("No se encontró el ticket."); return
-    idx = idxs[0]; row = df_tickets.loc[idx].copy()
     empresas = list_clientes()
 
     col1,col2,col3 = st.columns(3)
@@ -233,11 +346,10 @@ def form_editar_ticket(ticket_id: str, df_tickets: pd.DataFrame, df_users: pd.Da
         agente_soporte = row["Agente_Soporte"]
 
     if st.button("💾 Guardar cambios", use_container_width=True):
-        cambios = []
+        cambios = {}
         def _cmp(campo, nuevo):
-            nonlocal cambios; antes = row[campo]
-            if (str(antes) if not pd.isna(antes) else "") != (str(nuevo) if not pd.isna(nuevo) else ""):
-                df_tickets.at[idx, campo] = nuevo; cambios.append((campo, antes, nuevo))
+            antes = row[campo]
+            if (str(antes) if not pd.isna(antes) else "") != (str(nuevo) if not pd.isna(nuevo) else ""): cambios[campo] = nuevo
         _cmp("Empresa", empresa)
         _cmp("Usuario_Reportante", usuario_rep if usuario_rep!="Otro…" else row["Usuario_Reportante"])
         _cmp("Módulo_ERP", modulo); _cmp("Prioridad", prioridad); _cmp("Categoría", categoria)
@@ -245,14 +357,19 @@ def form_editar_ticket(ticket_id: str, df_tickets: pd.DataFrame, df_users: pd.Da
         _cmp("Comentarios", comentarios); _cmp("Satisfacción", csat)
         _cmp("Agente_Soporte", agente_soporte); _cmp("Fecha_Creación", pd.to_datetime(fecha_cre))
         if cambios:
-            upsert_ticket(df_tickets.loc[idx].to_dict())
-            for campo, antes, despues in cambios:
-                registrar_auditoria_db(st.session_state["usuario"], st.session_state["rol"], ticket_id, campo, antes, despues, "Edición completa")
+            # UPDATE por PK solo de los campos cambiados + su auditoría, en una transacción (o un PATCH)
+            st.session_state.pop("_edicion", None)
+            try:
+                patch_ticket(ticket_id, cambios, rowversion=version, usuario=st.session_state["usuario"], rol=st.session_state["rol"], motivo="Edición completa")
+            except ConflictoVersion:
+                st.error("Otro usuario modificó este ticket mientras lo editabas: se recargaron sus datos, revisá y volvé a guardar."); return
+            _datos_cambiados()
             st.success("Cambios guardados."); st.rerun()
         else:
             st.info("No hubo cambios para guardar.")
 
 # ====== ALTA TICKET ======
+@cronometrada
 def form_alta_ticket(df_tickets: pd.DataFrame, df_users: pd.DataFrame):
     st.subheader("➕ Crear nuevo ticket")
 
@@ -283,7 +400,7 @@ def form_alta_ticket(df_tickets: pd.DataFrame, df_users: pd.DataFrame):
 
     c1,c2,c3 = st.columns(3)
     with c1:
-        modulo = st.selectbox("Módulo ERP*", sorted(list(set(MODULOS + df_tickets["Módulo_ERP"].dropna().astype(str).tolist()))))
+        modulo = st.selectbox("Módulo ERP*", sorted(set(MODULOS + valores(df_tickets["Módulo_ERP"]))))
     with c2:
         prioridad = st.selectbox("Prioridad*", PRIORIDADES)
     with c3:
@@ -310,21 +427,15 @@ def form_alta_ticket(df_tickets: pd.DataFrame, df_users: pd.DataFrame):
             if USE_API: create_reportante(empresa.strip(), reportante_final)
             else:       add_reportante_si_no_existe(empresa.strip(), reportante_final)
 
-        existente = df_tickets["ID_Ticket"].dropna().astype(str).tolist(); pref, nums = "TCK-", []
-        for t in existente:
-            if t.startswith(pref):
-                try: nums.append(int(t.replace(pref,"")))
-                except: pass
-        nuevo_id = f"{pref}{((max(nums)+1) if nums else 1):05d}"
         nuevo = {
-            "ID_Ticket": nuevo_id, "Empresa": empresa.strip(), "Usuario_Reportante": reportante_final,
+            "Empresa": empresa.strip(), "Usuario_Reportante": reportante_final,
             "Agente_Soporte": agente_soporte, "Módulo_ERP": modulo, "Prioridad": prioridad,
             "Categoría": categoria, "Estado": "Abierto", "SLA": sla,
             "Fecha_Creación": datetime.now(), "Tiempo_Resolución_hs": None,
             "Comentarios": (comentarios or "").strip(), "Satisfacción": 3.0
         }
-        upsert_ticket(nuevo)
-        registrar_auditoria_db(st.session_state["usuario"], st.session_state["rol"], nuevo_id, "CREACION","-","-","Alta de ticket")
+        # el ID lo asigna el storage en la misma transacción del alta (con su auditoría)
+        nuevo_id = crear_ticket(nuevo, st.session_state["usuario"], st.session_state["rol"]); _datos_cambiados()
         st.success(f"Ticket **{nuevo_id}** creado correctamente."); st.rerun()
 
 # ====== CHART HELPERS ======
@@ -340,87 +451,108 @@ def _filter_by_date(df: pd.DataFrame, dfrom: date, dto: date)->pd.DataFrame:
     return df[(df["Fecha_Creación"]>=pd.to_datetime(dfrom)) & (df["Fecha_Creación"]<=pd.to_datetime(dto)+pd.Timedelta(days=1))]
 
 def _kpis(df: pd.DataFrame):
-    total = len(df); crit = df.apply(es_critico,axis=1).sum(); venc = df.apply(es_vencido,axis=1).sum()
-    sla_ok = (df.apply(lambda r: not sla_breached(r), axis=1) & (df["Estado"].isin(["Resuelto","Cerrado"])==False)).sum()
+    sla = sla_frame(df)
+    total = len(df); crit = sla["es_critico"].sum(); venc = sla["es_vencido"].sum()
+    sla_ok = (~sla["sla_breached"] & (df["Estado"].isin(["Resuelto","Cerrado"])==False)).sum()
     sla_rate = (sla_ok/total*100) if total else 0
     avg_res = df["Tiempo_Resolución_hs"].dropna().mean(); csat = df["Satisfacción"].dropna().mean()
     return total,crit,venc,sla_rate,avg_res,csat
 
 def chart_bar(data,x,y,title): return alt.Chart(data).mark_bar().encode(x=alt.X(x, sort='-y', title=None), y=alt.Y(y, title=None), tooltip=[x,y]).properties(height=300, title=title)
 def chart_line(data,x,y,title): return alt.Chart(data).mark_line(point=True).encode(x=alt.X(x,title=None), y=alt.Y(y,title=None), tooltip=[x,y]).properties(height=300, title=title)
-def _timeseries(df: pd.DataFrame, title="Tickets por día"):
-    tmp = df.copy(); tmp["Fecha"] = pd.to_datetime(tmp["Fecha_Creación"],errors="coerce").dt.date
-    ts = tmp.groupby("Fecha")["ID_Ticket"].count().reset_index().rename(columns={"ID_Ticket":"Tickets"})
+def _timeseries(ts: pd.DataFrame, title="Tickets por día"):
+    # ts: tickets por día de creación (stats["por_dia"])
     return chart_line(ts,"Fecha:T","Tickets:Q",title)
 
-def backlog_aging_chart(df: pd.DataFrame, title="Backlog Aging (días)"):
-    if df.empty: st.caption("Sin datos para backlog."); return
-    tmp = df.copy(); tmp = tmp[~tmp["Estado"].isin(["Resuelto","Cerrado"])].copy()
-    if tmp.empty: st.caption("No hay tickets abiertos para backlog."); return
-    tmp["Edad_dias"] = (pd.Timestamp.now() - pd.to_datetime(tmp["Fecha_Creación"], errors="coerce")).dt.days
-    bins = pd.cut(tmp["Edad_dias"], bins=[-1,2,7,14,30,9999], labels=["0-2","3-7","8-14","15-30",">30"])
-    dfb = bins.value_counts().sort_index().reset_index(); dfb.columns = ["Rango", "Tickets"]
+def backlog_aging_chart(backlog: pd.DataFrame, title="Backlog Aging (días)"):
+    # backlog: tickets abiertos por día de creación (stats["backlog_dia"]); edad en días calendario
+    if backlog.empty: st.caption("No hay tickets abiertos para backlog."); return
+    edad = (pd.Timestamp(date.today()) - pd.to_datetime(backlog["Fecha"], errors="coerce")).dt.days
+    bins = pd.cut(edad, bins=[-1,2,7,14,30,9999], labels=["0-2","3-7","8-14","15-30",">30"])
+    dfb = backlog["Tickets"].groupby(bins, observed=False).sum().reset_index(); dfb.columns = ["Rango", "Tickets"]
     st.altair_chart(chart_bar(dfb, "Rango:N", "Tickets:Q", title), use_container_width=True)
 
 # ====== KANBAN ======
-def render_kanban(df: pd.DataFrame, df_users: pd.DataFrame):
+KANBAN_POR_COLUMNA = 10
+
+def _badges(df: pd.DataFrame)->pd.Series:
+    sla = sla_frame(df)
+    return pd.Series(np.where(sla["es_critico"] | sla["es_vencido"], "🔴", np.where(sla["sla_breached"], "⏱️", "🟢")), index=df.index)
+
+@cronometrada
+def render_kanban(filtros: dict):
+    # Conteos por estado en SQL; cada columna carga sus primeras tarjetas (ampliables con "Ver más") y
+    # las tarjetas son texto: los widgets de acción existen solo para el ticket elegido
     st.markdown("#### 🗂️ Vista Kanban por estado (acciones rápidas)")
-    estados = ["Abierto","Priorizado","En Progreso","En Espera","Resuelto","Cerrado"]
-    cols = st.columns(len(estados))
-    for i, est in enumerate(estados):
-        col = cols[i]
-        subset = df[df["Estado"]==est].sort_values("Fecha_Creación", ascending=False).head(50)
+    conteos = contar_tickets("estado", **filtros)
+    clave = repr(sorted(filtros.items()))
+    if st.session_state.get("_kb_clave")!=clave:
+        st.session_state["_kb_clave"] = clave; st.session_state["_kb_limites"] = {}
+    limites = st.session_state["_kb_limites"]; tarjetas = {}
+    for col, est in zip(st.columns(len(ESTADOS)), ESTADOS):
+        total = conteos.get(est, 0)
         with col:
-            st.markdown(f"**{est}** ({len(subset)})")
-            for _, r in subset.iterrows():
-                tid = r["ID_Ticket"]
-                badge = "🔴" if (es_critico(r) or es_vencido(r)) else ("⏱️" if sla_breached(r) else "🟢")
-                st.caption(f"{badge} {tid} • {r['Empresa']} • {r['Módulo_ERP']} • {r['Prioridad']}")
-                with st.expander("Acciones", expanded=False):
-                    nuevo_estado = st.selectbox(f"Estado {tid}", ESTADOS, index=ESTADOS.index(est), key=f"kb_est_{tid}")
-                    if st.button("Actualizar estado", key=f"kb_upd_{tid}"):
-                        row = r.to_dict(); row["Estado"] = nuevo_estado
-                        upsert_ticket(row)
-                        registrar_auditoria_db(st.session_state["usuario"], st.session_state["rol"], tid, "Estado", est, nuevo_estado, "Kanban")
-                        st.success("Estado actualizado."); st.rerun()
+            st.markdown(f"**{est}** ({total})")
+            if not total: continue
+            raw = load_tickets_df(**{**filtros, "estado": est}, limit=limites.get(est, KANBAN_POR_COLUMNA)); sub = ensure_ticket_schema(raw)
+            badges = _badges(sub)
+            st.markdown("\n".join(f"- {b} `{r.ID_Ticket}` • {r.Empresa} • {r.Módulo_ERP} • {r.Prioridad}"
+                                   for b, r in zip(badges, sub.itertuples(index=False))))
+            tarjetas.update(zip(sub["ID_Ticket"], zip(registros_ticket(sub), raw["rowversion"].tolist())))
+            if len(sub) < total and st.button("Ver más", key=f"kb_mas_{est}"):
+                limites[est] = len(sub) + KANBAN_POR_COLUMNA; st.rerun()
+    if not tarjetas: return
+    c1,c2,c3 = st.columns([2,2,1])
+    tid = c1.selectbox("Mover ticket", [""] + list(tarjetas), key="kb_sel", format_func=lambda t: t or "Elegí un ticket…")
+    if not tid: return
+    row, version = tarjetas[tid]; est = row["Estado"]
+    nuevo_estado = c2.selectbox("Nuevo estado", ESTADOS, index=ESTADOS.index(est) if est in ESTADOS else 0, key="kb_est")
+    if c3.button("Actualizar estado", key="kb_upd", disabled=nuevo_estado==est):
+        try:
+            patch_ticket(tid, {"Estado": nuevo_estado}, rowversion=version, usuario=st.session_state["usuario"], rol=st.session_state["rol"], motivo="Kanban")
+        except ConflictoVersion:
+            st.error(f"{tid} cambió mientras tanto: volvé a intentarlo con el tablero actualizado."); return
+        _datos_cambiados()
+        st.success("Estado actualizado."); st.rerun()
 
 # ====== DASHBOARD AGENTE ======
+@cronometrada
 def page_dashboard_agent(df_t: pd.DataFrame, df_u: pd.DataFrame):
     ag = st.session_state["nombre_agente"]
     st.subheader("📊 Dashboard – Mi desempeño")
     fmin,fmax = _date_range(df_t); dfrom,dto = st.date_input("Rango de fechas",(fmin,fmax))
-    mine = _filter_by_date(df_t[df_t["Agente_Soporte"]==ag], dfrom, dto)
+    mine = _filter_by_date(tickets_de(ag), dfrom, dto)
     total,crit,venc,sla_rate,avg_res,csat = _kpis(mine)
     m1,m2,m3,m4,m5 = st.columns(5)
     m1.metric("Mis tickets", total); m2.metric("Críticos 🔴", int(crit)); m3.metric("Vencidos ⏱️", int(venc))
     m4.metric("SLA %", f"{sla_rate:,.1f}%"); m5.metric("CSAT", f"{csat:,.2f}" if pd.notna(csat) else "—")
-    pri = mine["Prioridad"].fillna("Desconocido").value_counts().reset_index(); pri.columns=["Prioridad","Cantidad"]
-    mod = mine["Módulo_ERP"].fillna("Desconocido").value_counts().reset_index(); mod.columns=["Módulo_ERP","Cantidad"]
-    low = low_csat_clientes(mine[mine["Estado"].isin(["Resuelto","Cerrado"])])
+    stats = load_stats(dfrom, dto, ag)
+    pri = stats["por_prioridad"]; mod = stats["por_modulo"]
+    low = low_csat_clientes(stats["csat_empresa"])
     cA,cB = st.columns(2)
     with cA: st.altair_chart(chart_bar(pri,"Prioridad:N","Cantidad:Q","Prioridades de mis casos"), use_container_width=True)
     with cB: st.altair_chart(chart_bar(mod,"Módulo_ERP:N","Cantidad:Q","Módulos más atendidos (yo)"), use_container_width=True)
     if not low.empty: st.altair_chart(chart_bar(low,"Empresa:N","CSAT:Q","Clientes con calificación baja (mis resoluciones)"), use_container_width=True)
-    st.altair_chart(_timeseries(mine, "Tickets por día (yo)"), use_container_width=True)
-    backlog_aging_chart(mine, "Backlog Aging (yo)")
+    st.altair_chart(_timeseries(stats["por_dia"], "Tickets por día (yo)"), use_container_width=True)
+    backlog_aging_chart(stats["backlog_dia"], "Backlog Aging (yo)")
 
 # ====== DASHBOARD COORDINACIÓN ======
+@cronometrada
 def page_dashboard_coord(df_t: pd.DataFrame):
     st.subheader("📊 Dashboard – Coordinación")
     fmin,fmax = _date_range(df_t)
     c1,c2 = st.columns(2)
     with c1: dfrom,dto = st.date_input("Rango de fechas",(fmin,fmax), key="fechas_coord_dash")
-    with c2: ag_sel = st.selectbox("Filtrar por agente", ["Todos"]+sorted(df_t["Agente_Soporte"].dropna().astype(str).unique().tolist()))
-    q = _filter_by_date(df_t, dfrom, dto); 
-    if ag_sel!="Todos": q = q[q["Agente_Soporte"]==ag_sel]
+    with c2: ag_sel = st.selectbox("Filtrar por agente", ["Todos"]+sorted(valores(df_t["Agente_Soporte"])))
+    q = _filter_by_date(df_t if ag_sel=="Todos" else tickets_de(ag_sel), dfrom, dto)
     total,crit,venc,sla_rate,avg_res,csat = _kpis(q)
     m1,m2,m3,m4,m5 = st.columns(5)
     m1.metric("Tickets", total); m2.metric("Críticos 🔴", int(crit)); m3.metric("Vencidos ⏱️", int(venc))
     m4.metric("SLA %", f"{sla_rate:,.1f}%"); m5.metric("CSAT", f"{csat:,.2f}" if pd.notna(csat) else "—")
-    agent = q.groupby("Agente_Soporte")["ID_Ticket"].count().reset_index().rename(columns={"ID_Ticket":"Tickets"}).sort_values("Tickets", ascending=False).head(12)
-    mod = q["Módulo_ERP"].fillna("Desconocido").value_counts().reset_index(); mod.columns=["Módulo_ERP","Cantidad"]
-    cli = q["Empresa"].fillna("Desconocido").value_counts().reset_index(); cli.columns=["Empresa","Cantidad"]
-    sla_mod = q.groupby(["Módulo_ERP","SLA"])["ID_Ticket"].count().reset_index().rename(columns={"ID_Ticket":"Cantidad"})
+    # gráficos desde los rollups (milisegundos, independiente del volumen histórico); KPIs SLA desde el frame
+    stats = load_stats(dfrom, dto, None if ag_sel=="Todos" else ag_sel)
+    agent = stats["por_agente"].sort_values("Tickets", ascending=False).head(12)
+    mod = stats["por_modulo"]; cli = stats["por_empresa"]; sla_mod = stats["sla_modulo"]
     c1,c2 = st.columns(2)
     with c1:
         if not agent.empty: st.altair_chart(chart_bar(agent,"Agente_Soporte:N","Tickets:Q","Tickets por agente"), use_container_width=True)
@@ -433,10 +565,10 @@ def page_dashboard_coord(df_t: pd.DataFrame):
             color=alt.Color("SLA:N"),
             tooltip=["Módulo_ERP","SLA","Cantidad"]).properties(height=300, title="SLA por módulo"),
             use_container_width=True)
-    low = low_csat_clientes(q[q["Estado"].isin(["Resuelto","Cerrado"])])
+    low = low_csat_clientes(stats["csat_empresa"])
     if not low.empty: st.altair_chart(chart_bar(low,"Empresa:N","CSAT:Q","Clientes con calificación baja"), use_container_width=True)
-    st.altair_chart(_timeseries(q, "Tickets por día (global / filtrado)"), use_container_width=True)
-    backlog_aging_chart(q, "Backlog Aging (global / filtrado)")
+    st.altair_chart(_timeseries(stats["por_dia"], "Tickets por día (global / filtrado)"), use_container_width=True)
+    backlog_aging_chart(stats["backlog_dia"], "Backlog Aging (global / filtrado)")
 
 # ====== ACCIONES MASIVAS ======
 def acciones_masivas(df_filtrado: pd.DataFrame, df_users: pd.DataFrame):
@@ -450,25 +582,16 @@ def acciones_masivas(df_filtrado: pd.DataFrame, df_users: pd.DataFrame):
         agentes = df_users[df_users["rol"]=="Agente"]["nombre_agente"].dropna().unique().tolist()
         nuevo_agente = st.selectbox("Reasignar a…", ["Sin cambio"] + sorted(agentes))
     if st.button("Aplicar a seleccionados", use_container_width=True, type="primary", disabled=(not seleccion)):
-        if USE_API:
-            payload = {}
-            if nuevo_estado!="Sin cambio": payload["set_estado"]=nuevo_estado
-            if nueva_prioridad!="Sin cambio": payload["set_prioridad"]=nueva_prioridad
-            if nuevo_agente!="Sin cambio": payload["set_agente"]=nuevo_agente
-            if not payload: st.info("No hay cambios para aplicar."); return
-            payload["ids"]=seleccion
-            from api_client import bulk_update_tickets as _bulk; res = _bulk(**payload); st.success(f"Actualizados: {res.get('updated',0)}"); st.rerun()
-        else:
-            df_local = st.session_state.get("_df_tickets_full", df_filtrado); changed=0
-            for tid in seleccion:
-                idxs = df_local.index[df_local["ID_Ticket"]==tid]
-                if len(idxs)==0: continue
-                idx = idxs[0]
-                if nuevo_estado!="Sin cambio": df_local.at[idx,"Estado"] = nuevo_estado
-                if nueva_prioridad!="Sin cambio": df_local.at[idx,"Prioridad"] = nueva_prioridad
-                if nuevo_agente!="Sin cambio": df_local.at[idx,"Agente_Soporte"] = nuevo_agente
-                upsert_ticket(df_local.loc[idx].to_dict()); changed += 1
-            st.success(f"Actualizados: {changed}"); st.rerun()
+        payload = {}
+        if nuevo_estado!="Sin cambio": payload["set_estado"]=nuevo_estado
+        if nueva_prioridad!="Sin cambio": payload["set_prioridad"]=nueva_prioridad
+        if nuevo_agente!="Sin cambio": payload["set_agente"]=nuevo_agente
+        if not payload: st.info("No hay cambios para aplicar."); return
+        # una sola transacción (UPDATE ... IN + auditoría) tanto local como vía API
+        res = bulk_update_tickets(seleccion, **payload, usuario=st.session_state["usuario"], rol=st.session_state["rol"], motivo="Acción masiva")
+        _datos_cambiados()
+        changed = res.get("updated",0) if USE_API else res
+        st.success(f"Actualizados: {changed}"); st.rerun()
 
 # ====== SELECCIÓN TICKET PARA EDICIÓN DETALLADA ======
 def seleccionar_ticket_data_editor(df: pd.DataFrame):
@@ -491,23 +614,70 @@ def seleccionar_ticket_data_editor(df: pd.DataFrame):
     return seleccion
 
 # ====== PÁGINA DE TICKETS ======
+@cronometrada
 def page_tickets(df_t: pd.DataFrame, df_u: pd.DataFrame, enable_agente_filter=False):
     st.subheader("📋 Gestión de Tickets")
-    df_f = filtros_tickets(df_t, enable_agente_filter=enable_agente_filter)
+    filtros = filtros_tickets(df_t, enable_agente_filter=enable_agente_filter)
+    q = filtros.pop("q")  # la búsqueda de texto aplica a la tabla; export y Kanban usan los filtros
+    df_f = paginar_tickets(filtros, q)
     cols = ["ID_Ticket","Empresa","Usuario_Reportante","Agente_Soporte","Módulo_ERP","Prioridad","Categoría","Estado","SLA","Fecha_Creación","Tiempo_Resolución_hs","Satisfacción","Comentarios"]
-    tabla_estilada_criticos(df_f[cols].sort_values("Fecha_Creación", ascending=False))
-    csv = df_f[cols].to_csv(index=False).encode("utf-8-sig")
-    st.download_button("⬇️ Exportar CSV", data=csv, file_name="tickets_filtrados.csv", mime="text/csv", use_container_width=True)
+    tabla_estilada_criticos(df_f[cols])
+    if USE_API:
+        # el navegador baja GET /tickets/export directo de la API (enlace firmado): streaming, nada pasa por Streamlit
+        st.link_button("⬇️ Exportar CSV (todos los filtrados)", url_export("csv", **filtros), use_container_width=True)
+    else:
+        def _csv_filtrado()->bytes:
+            # se genera recién al hacer clic (en otro hilo): cursor SQLite en streaming a un temporal, pero
+            # Streamlit sirve la descarga desde memoria (también si recibe el archivo abierto): pasa una vez por RAM
+            fd, ruta = tempfile.mkstemp(suffix=".csv"); os.close(fd)
+            try:
+                export_tickets(ruta, "csv", **filtros)
+                with open(ruta, "rb") as fh: return fh.read()
+            finally:
+                os.remove(ruta)
+        st.download_button("⬇️ Exportar CSV (todos los filtrados)", data=_csv_filtrado, file_name="tickets_filtrados.csv",
+                           mime="text/csv", on_click="ignore", key="exportar_csv", use_container_width=True)
     with st.expander("🗂️ Vista Kanban", expanded=False):
-        render_kanban(df_f, df_u)
+        render_kanban(filtros)
     if st.session_state["rol"]=="Coordinación": acciones_masivas(df_f, df_u)
     sel = seleccionar_ticket_data_editor(df_f)
-    if sel: form_editar_ticket(sel, df_t, df_u)
+    if sel: form_editar_ticket(sel, df_u)
+
+# ====== AUDITORÍA ======
+AUDITORIA_POR_PAGINA = 50
+
+@cronometrada
+def visor_auditoria():
+    # Carga diferida: no se consulta nada hasta activar el visor; después páginas por keyset (timestamp, id DESC)
+    if not st.checkbox("Mostrar auditoría", key="aud_activo"): return
+    c1,c2,c3,c4 = st.columns(4)
+    rango = c4.date_input("Rango de fechas", value=[], key="aud_fechas")
+    filtros = {
+        "ticket": c1.text_input("Ticket", key="aud_ticket").strip().upper() or None,
+        "usuario": c2.text_input("Usuario", key="aud_usuario").strip() or None,
+        "campo": c3.text_input("Campo", key="aud_campo", placeholder="Estado, Prioridad, CREACION...").strip() or None,
+        "desde": rango[0] if len(rango)>0 else None, "hasta": rango[1] if len(rango)>1 else None,
+    }
+    clave = repr(sorted(filtros.items()))
+    if st.session_state.get("_aud_clave")!=clave:
+        st.session_state["_aud_clave"] = clave
+        st.session_state["_aud_paginas"] = [load_auditoria(**filtros, limit=AUDITORIA_POR_PAGINA)]
+    paginas = st.session_state["_aud_paginas"]
+    aud = pd.concat(paginas, ignore_index=True) if len(paginas)>1 else paginas[0]
+    if aud.empty: st.caption("Sin registros de auditoría para estos filtros."); return
+    st.dataframe(aud.drop(columns=["id"]), use_container_width=True, hide_index=True)
+    b1,b2,_ = st.columns([1,1,3])
+    siguiente = paginas[-1].attrs.get("cursor")
+    if b1.button("Cargar más", key="aud_mas", disabled=not siguiente):
+        paginas.append(load_auditoria(**filtros, cursor=siguiente, limit=AUDITORIA_POR_PAGINA)); st.rerun()
+    if b2.button("🔄 Recargar", key="aud_recargar"):
+        st.session_state.pop("_aud_clave", None); st.rerun()
 
 # ====== MAIN APP LOOP ======
+@cronometrada
 def main():
     st.sidebar.selectbox("Tema", ["Claro","Oscuro"], key="tema", on_change=aplicar_tema); aplicar_tema(); check_session_timeout()
-    df_users = ensure_user_schema(load_usuarios_df()); df_tickets = ensure_ticket_schema(load_tickets_df())
+    df_users = _usuarios(USE_API); df_tickets = _ticket_cache(USE_API).refrescar()
     st.sidebar.markdown(
         """
         <h1 style='color: white; font-size: 24px; margin-bottom: 0px;'>⚙️ <span style='font-weight: 300;'>Gestión de</span> Tickets v9.3</h1>
@@ -524,8 +694,6 @@ def main():
     with cC:
         if st.button("🚪 Cerrar sesión", use_container_width=True):
             for k in ["logged","usuario","rol","nombre_agente","last_activity"]: st.session_state.pop(k,None); st.rerun()
-    if not USE_API:
-        st.session_state["_df_tickets_full"] = df_tickets.copy()
     set_activity()
     if st.session_state["rol"]=="Coordinación":
         pagina = st.sidebar.radio("Navegación", ["Dashboard","Tickets","Crear ticket","Estadísticas & Análisis"])
@@ -536,20 +704,13 @@ def main():
     else:
         pagina = st.sidebar.radio("Navegación", ["Dashboard","Tickets","Crear ticket"])
         if pagina=="Dashboard": page_dashboard_agent(df_tickets, df_users)
-        elif pagina=="Tickets": page_tickets(df_tickets[df_tickets["Agente_Soporte"]==st.session_state["nombre_agente"]].copy(), df_users)
+        elif pagina=="Tickets": page_tickets(tickets_de(st.session_state["nombre_agente"]), df_users)
         elif pagina=="Crear ticket": form_alta_ticket(df_tickets, df_users)
 
     st.markdown("<hr/>", unsafe_allow_html=True)
     st.caption("© 2025 – Soporte ERP Portfolio (v9.3). Desarrollado para portafolio profesional.")
 
     with st.expander("📝 Ver auditoría de cambios"):
-        if USE_API:
-            st.caption("La auditoría se registra vía API (ver servidor).")
-        else:
-            with _conn() as cn:
-                import pandas as _pd
-                aud = _pd.read_sql("SELECT timestamp, usuario, rol, ticket, campo, antes, despues, motivo FROM Auditoria ORDER BY id DESC", cn)
-            if aud.empty: st.caption("Aún no hay registros de auditoría.")
-            else: st.dataframe(aud, use_container_width=True, hide_index=True)
+        visor_auditoria()
 
 if __name__=="__main__": main()
@@ -0,0 +1,47 @@
+import os, sys, time, socket, subprocess, tempfile
+import numpy as np, pandas as pd
+
+# Los benchmarks nunca tocan erp_mock.db: usan una base temporal salvo que se indique ERP_SQLITE_PATH
+os.environ.setdefault("ERP_SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="erp_bench_"), "bench.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODULOS = ["Ventas","Facturación","Inventario","Producción","Logística","Compras","Tesorería","Contabilidad"]
+PRIORIDADES = ["Alta","Media","Baja"]
+CATEGORIAS = ["Error crítico","Consulta funcional","Mejora","Reporte caído","Integración"]
+ESTADOS = ["Abierto","Priorizado","En Progreso","En Espera","Resuelto","Cerrado"]
+EMPRESAS = ["MetalPlus SRL","AgroAndes SA","LogiWare","TextilNova","SolarTech"]
+AGENTES = ["Sofía López","Carlos Pérez"]
+
+def frame_sintetico(n: int, seed: int = 7)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    fechas = pd.Timestamp.now() - pd.to_timedelta(rng.integers(0, 60*24*3600, n), unit="s")
+    return pd.DataFrame({
+        "ID_Ticket": [f"TCK-{i:07d}" for i in range(1, n+1)],
+        "Empresa": rng.choice(EMPRESAS, n), "Usuario_Reportante": "Demo",
+        "Agente_Soporte": rng.choice(AGENTES, n), "Módulo_ERP": rng.choice(MODULOS, n),
+        "Prioridad": rng.choice(PRIORIDADES, n), "Categoría": rng.choice(CATEGORIAS, n),
+        "Estado": rng.choice(ESTADOS, n), "SLA": rng.choice(["Dentro de SLA","Fuera de SLA"], n, p=[.85,.15]),
+        "Fecha_Creación": fechas, "Tiempo_Resolución_hs": rng.uniform(1, 24, n).round(1),
+        "Comentarios": "Comentario demo", "Satisfacción": rng.uniform(2.5, 5.0, n).round(1),
+    })
+
+def cronometrar(fn, repeticiones: int = 3)->float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter(); fn(); mejor = min(mejor, time.perf_counter()-t0)
+    return mejor
+
+def servidor_api():
+    """uvicorn sobre la misma base (ERP_SQLITE_PATH) en un proceso aparte: los hilos de quien lo usa no compiten
+    por el GIL con el servidor. Devuelve (proceso, url); terminar con proc.terminate(); proc.wait()."""
+    import requests
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); puerto = s.getsockname()[1]
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "api_server:app", "--port", str(puerto), "--log-level", "warning",
+                             "--timeout-graceful-shutdown", "2"], cwd=raiz, env=os.environ.copy())
+    url = f"http://127.0.0.1:{puerto}"
+    for _ in range(200):
+        try: requests.get(f"{url}/clientes", headers={"x-api-key": os.environ.get("ERP_API_KEY", "dev-key")}, timeout=1); break
+        except requests.ConnectionError: time.sleep(0.1)
+    return proc, url
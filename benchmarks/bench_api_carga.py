@@ -0,0 +1,52 @@
+"""Prueba de carga de la API: tráfico mixto concurrente (listados completos lentos, /clientes rápidos,
+páginas de 50 y escrituras) contra uvicorn en un proceso aparte. Reporta p50/p99 por tipo de request.
+
+Uso: python benchmarks/bench_api_carga.py [n_tickets] [clientes] [segundos]
+"""
+import sys, random, threading, time
+import numpy as np, requests
+from _comun import frame_sintetico, servidor_api
+import storage_sqlite as store
+import api_server
+
+def poblar(n: int):
+    df = frame_sintetico(n); df["Fecha_Creación"] = df["Fecha_Creación"].map(lambda t: t.isoformat())
+    with store._conn() as cn:
+        cn.executemany("INSERT OR REPLACE INTO Tickets(" + ",".join(df.columns) + ") VALUES (" + ",".join("?"*len(df.columns)) + ")",
+                       df.itertuples(index=False, name=None))
+        cn.commit()
+    return df.to_dict(orient="records")
+
+def carga(url: str, registros, clientes: int, segundos: float):
+    head = {"x-api-key": api_server.API_KEY}; lat = {}; lock = threading.Lock(); fin = time.perf_counter()+segundos
+    tipos = [("tickets_completo", .1), ("tickets_pagina", .3), ("clientes", .4), ("upsert", .2)]
+    def worker(i):
+        rnd = random.Random(i); ses = requests.Session()
+        while time.perf_counter() < fin:
+            tipo = rnd.choices([t for t, _ in tipos], [p for _, p in tipos])[0]; t0 = time.perf_counter()
+            if tipo=="tickets_completo": r = ses.get(f"{url}/tickets", headers=head)
+            elif tipo=="tickets_pagina": r = ses.get(f"{url}/tickets", params={"limit": 50, "agente": "Sofía López"}, headers=head)
+            elif tipo=="clientes": r = ses.get(f"{url}/clientes", headers=head)
+            else:
+                rec = dict(rnd.choice(registros)); rec["Estado"] = rnd.choice(["Abierto","En Progreso","Resuelto"])
+                r = ses.post(f"{url}/tickets", json=rec, headers=head)
+            r.raise_for_status()
+            with lock: lat.setdefault(tipo, []).append(time.perf_counter()-t0)
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(clientes)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return lat
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    clientes = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    segundos = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    registros = poblar(n); proc, url = servidor_api()
+    try:
+        lat = carga(url, registros, clientes, segundos)
+    finally:
+        proc.terminate(); proc.wait()
+    print(f"{'request':<18} {'n':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    for tipo, v in sorted(lat.items()):
+        v = np.array(v)*1000
+        print(f"{tipo:<18} {len(v):>6} {np.percentile(v, 50):>9.1f} {np.percentile(v, 99):>9.1f}")
@@ -0,0 +1,31 @@
+"""Latencia y bytes por request del cliente HTTP contra uvicorn local: request suelto (conexión nueva,
+sin compresión, como antes) vs. la sesión de api_client (keep-alive + gzip).
+
+Uso: python benchmarks/bench_api_cliente.py [n_tickets] [repeticiones]
+"""
+import sys, time
+import requests
+from _comun import servidor_api
+from bench_api_carga import poblar
+import api_client
+
+def medir(get, url, path, params, rep):
+    t0 = time.perf_counter(); total = 0
+    for _ in range(rep):
+        r = get(f"{url}{path}", params=params, timeout=30); r.raise_for_status()
+        total += int(r.headers.get("content-length") or len(r.content))
+    return (time.perf_counter()-t0)/rep*1000, total/rep/1024
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rep = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    poblar(n); proc, url = servidor_api()
+    suelto = lambda u, **kw: requests.get(u, headers={**api_client.HEAD, "Accept-Encoding": "identity", "Connection": "close"}, **kw)
+    casos = [("/clientes", None), ("/usuarios", None), ("/tickets", {"limit": 500}), ("/stats", None)]
+    try:
+        print(f"{'endpoint':<22} {'suelto ms':>10} {'KB':>8} {'sesión ms':>10} {'KB':>8}")
+        for path, params in casos:
+            a = medir(suelto, url, path, params, rep); b = medir(api_client._sesion.get, url, path, params, rep)
+            print(f"{path + ('?limit=500' if params else ''):<22} {a[0]:>10.2f} {a[1]:>8.1f} {b[0]:>10.2f} {b[1]:>8.1f}")
+    finally:
+        proc.terminate(); proc.wait()
@@ -0,0 +1,62 @@
+"""Throughput (req/s) con lecturas mixtas + upsert_ticket concurrentes: pool WAL vs. conexión nueva por llamada.
+
+Uso: python benchmarks/bench_concurrencia.py [hilos] [segundos] [pct_escrituras]
+"""
+import os, sys, random, sqlite3, threading, time
+from contextlib import contextmanager
+from _comun import frame_sintetico
+import storage_sqlite as store
+
+def _conn_sin_pool():
+    # comportamiento previo: connect/close por sentencia, journal en modo rollback
+    @contextmanager
+    def _conn():
+        cn = sqlite3.connect(store.DB_PATH)
+        try: yield cn
+        finally: cn.close()
+    return _conn
+
+def preparar(path: str, wal: bool, n: int = 20_000):
+    store.DB_PATH = path; store._init_db()
+    df = frame_sintetico(n); df["Fecha_Creación"] = df["Fecha_Creación"].map(lambda t: t.isoformat())
+    with store._conn() as cn:
+        cn.executemany("INSERT OR REPLACE INTO Tickets(" + ",".join(df.columns) + ") VALUES (" + ",".join("?"*len(df.columns)) + ")",
+                       df.itertuples(index=False, name=None))
+        cn.commit()
+        if not wal: cn.execute("PRAGMA journal_mode=DELETE")
+    store.cerrar_pool()
+    return df.to_dict(orient="records")
+
+def correr(registros, hilos: int, segundos: float, pct_escrituras: float):
+    ops, errores, fin = [0]*hilos, [0]*hilos, time.perf_counter()+segundos
+    def worker(i):
+        rnd = random.Random(i)
+        while time.perf_counter() < fin:
+            try:
+                if rnd.random() < pct_escrituras:
+                    rec = dict(rnd.choice(registros)); rec["Estado"] = rnd.choice(["Abierto","En Progreso","Resuelto"])
+                    store.upsert_ticket(rec)
+                elif rnd.random() < 0.5:
+                    store.load_tickets_df(agente=rnd.choice(["Sofía López","Carlos Pérez"]), limit=50)
+                else:
+                    store.list_clientes(); store.list_reportantes("LogiWare")
+                ops[i] += 1
+            except sqlite3.OperationalError:
+                errores[i] += 1
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(hilos)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return sum(ops)/segundos, sum(errores)
+
+if __name__ == "__main__":
+    hilos = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    segundos = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    pct = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+    base = os.path.dirname(os.environ["ERP_SQLITE_PATH"])
+    conn_pool = store._conn
+    for nombre, wal, conn in (("sin pool (rollback journal)", False, _conn_sin_pool()), ("pool + WAL", True, conn_pool)):
+        store._conn = conn_pool
+        registros = preparar(os.path.join(base, f"{'wal' if wal else 'legacy'}.db"), wal)
+        store._conn = conn
+        rps, err = correr(registros, hilos, segundos, pct)
+        print(f"{nombre:<30} {rps:>9.0f} req/s   errores 'database is locked': {err}")
@@ -0,0 +1,37 @@
+"""Búsqueda de texto: FTS5 (buscar_tickets, top 50 por relevancia) vs. escaneo de substrings con pandas
+sobre el frame completo (lo que hacía el filtro por código, extendido a todas las columnas de texto).
+
+Uso: python benchmarks/bench_fts.py [n_tickets]
+"""
+import sys, time
+import numpy as np
+from _comun import frame_sintetico, cronometrar
+import storage_sqlite as store
+
+PALABRAS = ("error al facturar remito pendiente stock negativo asiento contable cierre mensual "
+            "integración banco usuario bloqueado reporte lento impresora fiscal orden compra").split()
+
+def poblar(n: int):
+    df = frame_sintetico(n); rng = np.random.default_rng(3)
+    df["Comentarios"] = [" ".join(rng.choice(PALABRAS, 6)) for _ in range(n)]
+    df.loc[rng.choice(n, 20, replace=False), "Comentarios"] = "timeout webservice AFIP"  # término raro
+    df["Fecha_Creación"] = df["Fecha_Creación"].map(lambda t: t.isoformat())
+    with store._tx() as cn:
+        cn.executemany("INSERT INTO Tickets(" + ",".join(df.columns) + ") VALUES (" + ",".join("?"*len(df.columns)) + ")",
+                       df.itertuples(index=False, name=None))
+    return df
+
+def pandas_contiene(df, q):
+    mascara = np.zeros(len(df), dtype=bool)
+    for c in store._FTS_COLS:
+        mascara |= df[c].astype(str).str.contains(q, case=False, regex=False).to_numpy()
+    return df[mascara].head(50)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    t = time.perf_counter(); df = poblar(n)
+    print(f"{n} tickets insertados (con triggers FTS) en {time.perf_counter()-t:.1f}s")
+    print(f"{'consulta':<22} {'pandas ms':>10} {'FTS5 ms':>9} {'aciertos':>9}")
+    for q in ("afip", "impresora fiscal", "LogiWare", "TCK-0000123"):
+        a = cronometrar(lambda: pandas_contiene(df, q)); b = cronometrar(lambda: store.buscar_tickets(q, limit=50))
+        print(f"{q:<22} {a*1000:>10.1f} {b*1000:>9.1f} {len(store.buscar_tickets(q, limit=50)):>9}")
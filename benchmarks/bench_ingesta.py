@@ -0,0 +1,26 @@
+"""Ingesta de tickets históricos contra uvicorn local: un POST /tickets por ticket (como empujan hoy las
+integraciones; se mide una muestra y se extrapola) vs. api_client.upsert_tickets_bulk (JSONL gzip a
+POST /tickets/batch, una transacción por lote). Repite el lote completo como actualización.
+
+Uso: python benchmarks/bench_ingesta.py [n_tickets] [muestra_uno_a_uno]
+"""
+import sys, time
+from _comun import frame_sintetico, servidor_api
+import api_client
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    muestra = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    df = frame_sintetico(n); df["ID_Ticket"] = "HIS-" + df["ID_Ticket"]
+    proc, url = servidor_api(); api_client.API_URL = url
+    try:
+        t = time.perf_counter()
+        for rec in df.iloc[:muestra].to_dict("records"): api_client.upsert_ticket(rec)
+        uno = (time.perf_counter()-t)/muestra
+        print(f"uno a uno: {uno*1000:.2f} ms/ticket -> {n:,} tickets en ~{uno*n:,.0f}s (extrapolado de {muestra:,})")
+        for nombre, frame in (("alta", df), ("actualización", df.assign(Estado="Cerrado"))):
+            t = time.perf_counter(); res = api_client.upsert_tickets_bulk(frame); seg = time.perf_counter()-t
+            print(f"batch {nombre}: {res['guardados']:,} tickets en {seg:.1f}s ({res['guardados']/seg:,.0f}/s, "
+                  f"{res['lotes']} lotes, {res['con_error']} con error) -> {uno*n/seg:.0f}x")
+    finally:
+        proc.terminate(); proc.wait()
@@ -0,0 +1,54 @@
+"""Memoria del frame de tickets: representación anterior (strings object, float64) vs. compacta de
+ensure_ticket_schema (categóricas, float32), pico de la pasada de filtros/KPIs de cada rerun y RSS por
+sesión de Streamlit (sesiones de AppTest sobre app_v8 en este proceso).
+
+Uso: python benchmarks/bench_memoria.py [n_tickets] [sesiones]
+"""
+import os, sys, tracemalloc
+from _comun import cronometrar
+import storage_sqlite as store
+import app_v8 as app
+from streamlit.testing.v1 import AppTest
+
+def anterior(raw):
+    # como quedaba antes el frame: un objeto str por celda y métricas float64
+    df = raw[app.EXPECTED_TICKET_COLS].astype({c: object for c in app.VOCABULARIOS} | {"ID_Ticket": object, "Comentarios": object})
+    return df.assign(Fecha_Creación=app.pd.to_datetime(df["Fecha_Creación"]), **{c: df[c].astype("float64") for c in app.METRICAS})
+
+def rerun(df):
+    # lo que hace cada rerun sobre el frame compartido: vista del agente, KPIs, SLA y opciones de filtros
+    mio = df[df["Agente_Soporte"]=="Sofía López"]
+    app._kpis(mio); app.sla_frame(df)
+    return [app.valores(df[c]) for c in ("Módulo_ERP", "Estado", "Prioridad", "Agente_Soporte")]
+
+def pico(fn)->int:
+    tracemalloc.start(); fn(); _, p = tracemalloc.get_traced_memory(); tracemalloc.stop()
+    return p
+
+def rss()->int:
+    with open("/proc/self/status") as fh:
+        return next(int(l.split()[1])*1024 for l in fh if l.startswith("VmRSS"))
+
+def sesion(rol="Agente"):
+    at = AppTest.from_file(os.path.join(os.path.dirname(store.__file__), "app_v8.py"), default_timeout=300)
+    at.session_state["logged"] = True; at.session_state["usuario"] = "slopez"; at.session_state["rol"] = rol
+    at.session_state["nombre_agente"] = "Sofía López"
+    at.run(); at.sidebar.radio[0].set_value("Tickets").run()
+    return at
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    sesiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with store._tx() as cn: store.poblar_tickets(cn, n, seed=7, n_clientes=40)
+    raw = store.load_tickets_df()
+    frames = {"anterior": anterior(raw), "compacto": app.ensure_ticket_schema(raw)}
+    print(f"{n:,} tickets")
+    print(f"{'frame':<10} {'memoria MB':>11} {'pico rerun MB':>14} {'rerun ms':>9}")
+    for nombre, df in frames.items():
+        mb = df.memory_usage(deep=True).sum()/2**20
+        print(f"{nombre:<10} {mb:>11.1f} {pico(lambda: rerun(df))/2**20:>14.1f} {cronometrar(lambda: rerun(df))*1000:>9.1f}")
+    del raw, frames
+    base = rss(); vivas = [sesion()]  # la primera sesión carga el caché compartido del proceso
+    compartido = rss()
+    vivas += [sesion() for _ in range(sesiones)]
+    print(f"RSS caché compartido: {(compartido-base)/2**20:.1f} MB | por sesión adicional: {(rss()-compartido)/sesiones/2**20:.1f} MB")
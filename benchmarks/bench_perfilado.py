@@ -0,0 +1,39 @@
+"""Perfilado a pedido y log de consultas lentas sobre una base sintética grande: reporte cProfile (X-Profile)
+de GET /tickets completo, una página filtrada y un bulk_update de 500 tickets; después las sentencias que
+pasaron el umbral con su EXPLAIN QUERY PLAN. Verifica además que sin API key el perfil no se entregue.
+
+Uso: python benchmarks/bench_perfilado.py [n_tickets] [umbral_ms]
+"""
+import os, sys, time
+from _comun import cronometrar
+# el registro de consultas lentas es opcional y se decide al abrir cada conexión: antes de importar storage
+os.environ["ERP_SQL_LENTO_MS"] = sys.argv[2] if len(sys.argv) > 2 else "100"
+import storage_sqlite as store
+import api_server
+from fastapi.testclient import TestClient
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    t = time.perf_counter()
+    with store._tx() as cn: store.poblar_tickets(cn, n, seed=7, n_clientes=40)
+    print(f"{n:,} tickets en {time.perf_counter()-t:.1f}s | umbral consultas lentas {store.SQL_LENTO_MS:.0f} ms")
+    ids = store.load_tickets_df(estado="Abierto", limit=500)["ID_Ticket"].tolist()
+    with TestClient(api_server.app, headers={"x-api-key": api_server.API_KEY}) as api:
+        assert TestClient(api_server.app).get("/tickets", params={"limit": 5}, headers={"X-Profile": "1"}).status_code==401
+        casos = {
+            "GET /tickets completo": lambda h: api.get("/tickets", headers=h),
+            "GET /tickets página filtrada": lambda h: api.get("/tickets", params={"estado": "Abierto", "modulo": "Ventas", "limit": 50}, headers=h),
+            "POST /tickets/bulk_update 500": lambda h: api.post("/tickets/bulk_update", headers=h, json={
+                "ids": ids, "set_estado": "En Progreso", "usuario": "bench", "rol": "Coordinación", "motivo": "bench"}),
+        }
+        for nombre, llamar in casos.items():
+            sin = cronometrar(lambda: llamar({}).raise_for_status(), 1)
+            r = llamar({"X-Profile": "text"}); r.raise_for_status()
+            print(f"\n== {nombre}: {sin*1000:.0f} ms sin perfilar, {r.headers['X-Profile-Wall-Ms']} ms perfilado "
+                  f"(respuesta original {r.headers['X-Profile-Status']}) ==")
+            print("\n".join(r.text.splitlines()[:30]))
+        lentas = api.get("/debug/consultas_lentas", params={"limit": 20}).json()
+    print(f"\n== {len(lentas)} consulta(s) lenta(s) ==")
+    for c in lentas:
+        print(f"{c['ms']:>8.1f} ms  {c['funcion']}: {c['sql'][:150]}")
+        for paso in c["plan"]: print(f"{'':>14}{paso}")
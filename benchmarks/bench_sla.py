@@ -0,0 +1,25 @@
+"""Compara el motor SLA vectorizado (sla_frame) contra las funciones por fila de app_v8.
+
+Uso: python benchmarks/bench_sla.py [n1 n2 ...]
+"""
+import sys
+from _comun import frame_sintetico, cronometrar
+import app_v8 as app
+
+def _por_fila(df):
+    return (df.apply(app.es_critico, axis=1).sum(), df.apply(app.es_vencido, axis=1).sum(),
+            df.apply(lambda r: not app.sla_breached(r), axis=1).sum())
+
+def _vectorizado(df):
+    sla = app.sla_frame(df)
+    return sla["es_critico"].sum(), sla["es_vencido"].sum(), (~sla["sla_breached"]).sum()
+
+if __name__ == "__main__":
+    tamaños = [int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    print(f"{'filas':>10} {'por fila (s)':>14} {'vectorizado (s)':>16} {'speedup':>9}")
+    for n in tamaños:
+        df = frame_sintetico(n)
+        assert _por_fila(df.head(2000)) == _vectorizado(df.head(2000))
+        t_fila = cronometrar(lambda: _por_fila(df), repeticiones=1)
+        t_vec = cronometrar(lambda: _vectorizado(df))
+        print(f"{n:>10} {t_fila:>14.3f} {t_vec:>16.4f} {t_fila/t_vec:>8.0f}x")
@@ -0,0 +1,89 @@
+"""Corre EXPLAIN QUERY PLAN sobre cada consulta que emite la capa de storage y falla (exit 1)
+si alguna cae en un full scan, o si una paginada (LIMIT) ordena aparte en lugar de seguir un índice,
+sobre una base sintética grande.
+
+Uso: python benchmarks/check_query_plans.py [n_tickets]
+"""
+import re, sys
+from _comun import frame_sintetico
+
+import storage_sqlite as store
+
+# Se capturan las sentencias reales (con sus parámetros) encadenadas a la traza de storage
+_capturadas = []
+store.observar_sentencias(_capturadas.append)
+
+# Lecturas completas por diseño (carga inicial del frame) y tablas de catálogo chicas
+PERMITIDAS = [re.compile(p) for p in (
+    r"^SELECT \* FROM Tickets ORDER BY Fecha_Creación (ASC|DESC), ID_Ticket (ASC|DESC)$",
+    r"FROM (Usuarios|Clientes)\b",
+)]
+FULL_SCAN = re.compile(r"^SCAN (TABLE )?(\w+)$")
+# una página por keyset que ordena con un B-tree temporal relee y ordena todo el rango en cada página;
+# salvo la búsqueda FTS, que ordena por relevancia (bm25) y no puede seguir un índice
+ORDEN_APARTE = re.compile(r"^USE TEMP B-TREE FOR .*ORDER BY")
+ORDEN_PERMITIDO = re.compile(r"\bMATCH\b")
+
+def poblar(n: int):
+    df = frame_sintetico(n)
+    df["Fecha_Creación"] = df["Fecha_Creación"].map(lambda t: t.isoformat())
+    with store._conn() as cn:
+        cn.execute("DELETE FROM Tickets")
+        cn.executemany("INSERT INTO Tickets(" + ",".join(df.columns) + ") VALUES (" + ",".join("?"*len(df.columns)) + ")",
+                       df.itertuples(index=False, name=None))
+        cn.executemany("INSERT INTO Auditoria(timestamp,usuario,rol,ticket,campo,antes,despues,motivo) VALUES (?,?,?,?,?,?,?,?)",
+                       (("2025-01-01T00:00:00","admin","Coordinación",t,"Estado","Abierto","Cerrado","bench") for t in df["ID_Ticket"]))
+        cn.commit()
+    return df
+
+def consultas_app(df):
+    # Las mismas llamadas que hacen app_v8 y api_server
+    t = df.iloc[len(df)//2]
+    store.list_clientes(); store.list_reportantes("LogiWare"); store.load_usuarios_df()
+    store.load_tickets_df()
+    pagina = store.load_tickets_df(limit=50); store.load_tickets_df(limit=50, cursor=pagina.attrs["cursor"])
+    store.load_tickets_df(limit=50, orden="asc")
+    for k in store.FILTROS_TICKETS: store.load_tickets_df(**{k: t[store.FILTROS_TICKETS[k]]}, limit=50)
+    store.load_tickets_df(agente=t["Agente_Soporte"])
+    store.load_tickets_df(agente=t["Agente_Soporte"], estado="Abierto", limit=50)
+    store.load_tickets_df(desde="2025-01-01", hasta="2025-01-31", limit=50)
+    store.load_tickets_df(id_prefijo="TCK-00001")
+    store.load_tickets_df(id_contiene="0001", limit=50)
+    # tramo de los tickets sin fecha (al final en DESC, al principio en ASC)
+    store.load_tickets_df(limit=50, cursor=f"{store._NULO}|{t['ID_Ticket']}")
+    store.load_tickets_df(limit=50, orden="asc", cursor=f"{store._NULO}|{t['ID_Ticket']}")
+    store.load_tickets_df(estado="Abierto", limit=50, cursor=f"{store._NULO}|{t['ID_Ticket']}")
+    store.contar_tickets("estado"); store.contar_tickets("estado", agente=t["Agente_Soporte"])
+    store.buscar_tickets("logiware"); store.buscar_tickets("demo", estado="Abierto", cursor="50")
+    aud = store.load_auditoria(limit=50); store.load_auditoria(limit=50, cursor=aud.attrs["cursor"])
+    store.load_auditoria(ticket=t["ID_Ticket"]); store.load_auditoria(usuario="admin", limit=50)
+    store.load_auditoria(campo="Estado", limit=50)
+    aud = store.load_auditoria(desde="2025-01-01", hasta="2025-01-31", limit=50)
+    store.load_auditoria(desde="2025-01-01", hasta="2025-01-31", limit=50, cursor=aud.attrs["cursor"])
+    store.load_auditoria(usuario="admin", desde="2025-01-01", limit=50, cursor=aud.attrs["cursor"])
+
+def revisadas()->list:
+    return [sql for sql in dict.fromkeys(_capturadas)
+            if sql.lstrip().upper().startswith("SELECT") and not any(p.search(sql) for p in PERMITIDAS)]
+
+def planes():
+    fallas = []
+    with store._conn() as cn:
+        cn.set_trace_callback(None)
+        for sql in revisadas():
+            plan = [r[3] for r in cn.execute("EXPLAIN QUERY PLAN " + sql)]
+            scans = [d for d in plan if FULL_SCAN.match(d)]
+            if re.search(r"\bLIMIT\b", sql) and not ORDEN_PERMITIDO.search(sql): scans += [d for d in plan if ORDEN_APARTE.match(d)]
+            print(("FULL SCAN " if scans else "ok        ") + sql[:110].replace("\n"," "))
+            for d in plan: print("            " + d)
+            if scans: fallas.append(sql)
+    return fallas
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    df = poblar(n); _capturadas.clear()
+    consultas_app(df)
+    fallas, n_revisadas = planes(), len(revisadas())
+    print(f"\n{len(fallas)} consulta(s) con full scan u orden aparte sobre {n} tickets ({n_revisadas} revisadas)")
+    if not n_revisadas: print("ERROR: no se capturó ninguna consulta (¿se perdió la traza?)")
+    sys.exit(1 if fallas or not n_revisadas else 0)
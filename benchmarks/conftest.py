@@ -0,0 +1,40 @@
+"""pytest en benchmarks/: base temporal (nunca erp_mock.db) y líneas base de pytest-benchmark en
+benchmarks/lineas_base (locales, no versionadas), sin importar desde qué directorio se corra."""
+import os
+import pytest
+import _comun  # noqa: F401  (fija ERP_SQLITE_PATH antes de que un test importe storage)
+
+LINEAS_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lineas_base")
+
+def pytest_configure(config):
+    if getattr(config.option, "benchmark_storage", None)=="file://./.benchmarks":
+        config.option.benchmark_storage = "file://" + LINEAS_BASE
+
+@pytest.fixture(scope="session")
+def api_url():
+    """URL de una API real (uvicorn aparte) sobre la base temporal de los tests, con api_client apuntando ahí."""
+    import api_client
+    proc, url = _comun.servidor_api(); previa, api_client.API_URL = api_client.API_URL, url
+    try:
+        yield url
+    finally:
+        api_client.API_URL = previa; proc.terminate(); proc.wait()
+
+@pytest.fixture
+def base(tmp_path):
+    """storage_sqlite sobre una base nueva (migrada, con los 60 tickets demo) solo para este test."""
+    import storage_sqlite as store
+    previa, store.DB_PATH = store.DB_PATH, str(tmp_path / "erp.db")
+    store._init_db(); store._catalogos.invalidar()
+    try:
+        yield store
+    finally:
+        store.cerrar_pool(); store.DB_PATH = previa; store._catalogos.invalidar()
+
+@pytest.fixture
+def api(base):
+    """TestClient de la API (en este proceso, con lifespan) sobre la base del fixture `base`."""
+    import api_server
+    from fastapi.testclient import TestClient
+    with TestClient(api_server.app, headers={"x-api-key": api_server.API_KEY}) as cliente:
+        yield cliente
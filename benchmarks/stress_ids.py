@@ -0,0 +1,42 @@
+"""Stress de altas concurrentes: varios procesos x hilos llaman a crear_ticket a la vez y se verifica
+que no haya IDs repetidos ni tickets pisados. Exit 1 si hay colisiones.
+
+Uso: python benchmarks/stress_ids.py [procesos] [hilos] [altas_por_hilo]
+"""
+import sys, time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from _comun import frame_sintetico
+import storage_sqlite as store
+
+def proceso(args):
+    p, hilos, altas = args
+    recs = frame_sintetico(hilos*altas, seed=p).drop(columns=["ID_Ticket", "Fecha_Creación"]).to_dict(orient="records")
+    with ThreadPoolExecutor(hilos) as ex:
+        return list(ex.map(lambda rec: store.crear_ticket(rec, usuario=f"stress{p}"), recs))
+
+def contar():
+    with store._conn() as cn:
+        return (cn.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0],
+                cn.execute("SELECT COUNT(*) FROM Auditoria WHERE campo='CREACION'").fetchone()[0])
+
+if __name__ == "__main__":
+    procesos, hilos, altas = (int(a) for a in (sys.argv[1:] + ["4", "8", "50"][len(sys.argv[1:]):]))
+    total = procesos*hilos*altas
+    # un ID explícito por delante de la secuencia (como una importación): el alta debe saltearlo, no pisarlo
+    with store._conn() as cn: sig = cn.execute("SELECT valor FROM Secuencias WHERE nombre='tickets'").fetchone()[0] + 3
+    store.upsert_ticket({**frame_sintetico(1).iloc[0].to_dict(), "ID_Ticket": f"{store.TICKET_PREFIJO}{sig:05d}", "Comentarios": "importado"})
+    tickets0, auditoria0 = contar(); store.cerrar_pool()
+
+    t = time.perf_counter()
+    with Pool(procesos) as pool:
+        ids = [tid for lote in pool.map(proceso, [(p, hilos, altas) for p in range(procesos)]) for tid in lote]
+    seg = time.perf_counter() - t
+    tickets1, auditoria1 = contar()
+    with store._conn() as cn:
+        importado = cn.execute("SELECT Comentarios FROM Tickets WHERE ID_Ticket=?", (f"{store.TICKET_PREFIJO}{sig:05d}",)).fetchone()[0]
+
+    print(f"{total} altas ({procesos} procesos x {hilos} hilos) en {seg:.2f}s -> {total/seg:.0f} altas/s")
+    print(f"IDs únicos: {len(set(ids))}/{total} | filas nuevas: {tickets1-tickets0} | auditorías: {auditoria1-auditoria0} | importado intacto: {importado=='importado'}")
+    ok = len(set(ids))==total==tickets1-tickets0==auditoria1-auditoria0 and importado=="importado"
+    print("OK" if ok else "COLISIÓN"); sys.exit(0 if ok else 1)
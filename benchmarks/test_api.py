@@ -0,0 +1,90 @@
+"""Endpoints de api_server en el mismo proceso (TestClient) sobre una base nueva por test.
+
+Uso: python -m pytest benchmarks/test_api.py
+"""
+import json, pstats
+from concurrent.futures import ThreadPoolExecutor
+import api_client, api_server
+from _comun import frame_sintetico
+
+def _jsonl(n: int, desde=1)->bytes:
+    df = frame_sintetico(n).assign(ID_Ticket=[f"ING-{i:05d}" for i in range(desde, desde+n)])
+    return df.to_json(orient="records", lines=True, date_format="iso", force_ascii=False).encode()
+
+def test_ingesta_interrumpida_informa_lo_guardado(api, base):
+    # la base rechaza el tercer lote: los dos primeros quedan confirmados y el error lo dice
+    with base._tx() as cn:
+        cn.execute("CREATE TRIGGER t_rechazo BEFORE INSERT ON Tickets WHEN NEW.ID_Ticket='ING-00250' BEGIN SELECT RAISE(ABORT, 'rechazado'); END")
+    r = api.post("/tickets/batch", params={"lote": 100}, content=_jsonl(300), headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code==503
+    detalle = r.json()["detail"]
+    assert (detalle["guardados"], detalle["hasta_registro"], detalle["lotes"]) == (200, 200, 2) and "rechazado" in detalle["error"]
+    with base._conn() as cn: assert cn.execute("SELECT COUNT(*) FROM Tickets WHERE ID_Ticket LIKE 'ING-%'").fetchone()[0]==200
+
+def test_respuestas_negociadas_llevan_vary_accept(api, base):
+    api.post("/tickets/batch", content=_jsonl(5), headers={"Content-Type": "application/x-ndjson"}).raise_for_status()
+    for path, params in [("/tickets", {}), ("/tickets", {"limit": 2}), ("/tickets/search", {"q": "ING"}), ("/auditoria", {})]:
+        for accept in ["application/json", api_server.ARROW_MEDIA]:
+            r = api.get(path, params=params, headers={"Accept": accept})
+            assert r.status_code==200 and "Accept" in r.headers["Vary"].split(", "), (path, accept)
+
+def test_export_por_enlace_firmado(api, base, monkeypatch):
+    # el navegador no manda x-api-key: basta el enlace de api_client.url_export, que no se puede alterar ni reusar vencido
+    sin_key = {"x-api-key": ""}
+    url = api_client.url_export("csv", estado="Abierto")
+    r = api.get(url, headers=sin_key)
+    assert r.status_code==200 and len(r.content.decode("utf-8-sig").splitlines())==base.contar_tickets("estado").get("Abierto", 0)+1
+    assert api.get(url.replace("estado=Abierto", "estado=Cerrado"), headers=sin_key).status_code==401
+    assert api.get(url.split("&firma=")[0], headers=sin_key).status_code==401
+    monkeypatch.setattr(api_client, "EXPORT_ENLACE_TTL", -1)
+    assert api.get(api_client.url_export("csv"), headers=sin_key).status_code==401
+
+def test_patch_con_rowversion_vieja_da_409(api, base):
+    leido = api.get("/tickets/TCK-00001").json()
+    r = api.patch("/tickets/TCK-00001", json={"Estado": "En Progreso", "rowversion": leido["rowversion"], "usuario": "ana"})
+    assert r.status_code==200 and r.json()["rowversion"]!=leido["rowversion"]
+    # otro usuario editaba sobre la misma lectura: no pisa el cambio y recibe la fila actual
+    r = api.patch("/tickets/TCK-00001", json={"Estado": "Cerrado", "rowversion": leido["rowversion"], "usuario": "beto"})
+    assert r.status_code==409 and r.json()["detail"]["actual"]["Estado"]=="En Progreso"
+    assert api.get("/tickets/TCK-00001").json()["Estado"]=="En Progreso"
+    assert api.patch("/tickets/NO-EXISTE", json={"Estado": "Cerrado"}).status_code==404
+
+def test_bulk_update_registra_auditoria(api, base):
+    ids = ["TCK-00001", "TCK-00002", "NO-EXISTE"]
+    r = api.post("/tickets/bulk_update", json={"ids": ids, "set_prioridad": "Alta", "set_agente": "Auditor QA",
+                                                "usuario": "coord", "rol": "Coordinación", "motivo": "reasignación"})
+    assert r.json()=={"updated": 2}
+    for tid in ids[:2]:
+        filas = api.get("/auditoria", params={"ticket": tid, "usuario": "coord"}).json()
+        assert {f["campo"] for f in filas} >= {"Agente_Soporte"} and all(f["motivo"]=="reasignación" for f in filas)
+        assert next(f for f in filas if f["campo"]=="Agente_Soporte")["despues"]=="Auditor QA"
+
+def test_ingesta_errores_por_fila(api, base):
+    # las filas válidas se guardan; cada inválida vuelve con su n° de registro y su ID
+    lineas = _jsonl(6).decode().splitlines()
+    lineas[1] = "{no es json"
+    lineas[3] = json.dumps({**json.loads(lineas[3]), "Fecha_Creación": "ayer"})
+    lineas[4] = json.dumps({k: v for k, v in json.loads(lineas[4]).items() if k!="Empresa"})
+    r = api.post("/tickets/batch", content="\n".join(lineas).encode(), headers={"Content-Type": "application/x-ndjson"})
+    res = r.json()
+    assert r.status_code==200 and (res["recibidos"], res["guardados"], res["con_error"])==(6, 3, 3)
+    assert [(e["fila"], e["ID_Ticket"]) for e in res["errores"]]==[(2, None), (4, "ING-00004"), (5, "ING-00005")]
+    with base._conn() as cn:
+        assert [r[0] for r in cn.execute("SELECT ID_Ticket FROM Tickets WHERE ID_Ticket LIKE 'ING-%' ORDER BY 1")]==["ING-00001", "ING-00003", "ING-00006"]
+
+def test_altas_concurrentes_por_api(api, base):
+    rec = {k: v for k, v in json.loads(_jsonl(1).decode()).items() if k not in ("ID_Ticket", "Fecha_Creación")}
+    with ThreadPoolExecutor(8) as ex:
+        respuestas = list(ex.map(lambda _: api.post("/tickets/new", json={**rec, "usuario": "api"}), range(40)))
+    assert all(r.status_code==201 for r in respuestas) and len({r.json()["ID_Ticket"] for r in respuestas})==40
+
+def test_perfil_a_pedido_solo_con_api_key(api, base, tmp_path):
+    r = api.get("/tickets", params={"limit": 5}, headers={"X-Profile": "text"})
+    assert r.status_code==200 and r.headers["X-Profile-Status"]=="200" and r.headers["Cache-Control"]=="no-store"
+    assert r.text.startswith("# GET /tickets -> 200") and "load_tickets_df" in r.text
+    r = api.get("/tickets", params={"limit": 5, "profile": "pstats"})
+    (tmp_path / "perfil.pstats").write_bytes(r.content)
+    assert any(f[2]=="load_tickets_df" for f in pstats.Stats(str(tmp_path / "perfil.pstats")).stats)
+    # sin la key el pedido de perfil se ignora y el request sigue su curso normal (401)
+    r = api.get("/tickets", params={"limit": 5}, headers={"X-Profile": "text", "x-api-key": ""})
+    assert r.status_code==401 and "X-Profile-Status" not in r.headers
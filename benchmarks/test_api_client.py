@@ -0,0 +1,29 @@
+"""api_client contra la API real (uvicorn aparte): los frames llegan con el mismo esquema que el storage local.
+
+Uso: python -m pytest benchmarks/test_api_client.py
+"""
+import storage_sqlite as store
+import api_client
+
+def test_stats_rango_vacio_conserva_columnas(api_url):
+    # sin tickets en el rango los frames vienen vacíos, pero con sus columnas: los dashboards ordenan y filtran por ellas
+    remotos = api_client.load_stats(desde="1990-01-01", hasta="1990-01-31")
+    locales = store.load_stats(desde="1990-01-01", hasta="1990-01-31")
+    assert remotos.keys()==locales.keys()
+    for nombre, df in remotos.items():
+        assert list(df.columns)==list(locales[nombre].columns), nombre
+        assert df.empty or nombre=="totales", nombre
+    remotos["por_agente"].sort_values("Tickets"); remotos["csat_empresa"][remotos["csat_empresa"]["CSAT"] < 3]
+
+def test_stats_con_datos(api_url):
+    remotos, locales = api_client.load_stats(), store.load_stats()
+    assert remotos["por_agente"]["Tickets"].sum()==locales["por_agente"]["Tickets"].sum() > 0
+
+def test_stream_con_last_event_id_invalido_sigue_desde_since(api_url):
+    # el navegador reenvía el último id tal cual: uno ilegible no debe dar 500 sino seguir desde `since`
+    cursor = api_client.cambios()["hasta"]
+    with api_client._sesion.get(f"{api_url}/changes/stream", params={"since": cursor}, stream=True, timeout=10,
+                                headers={"Last-Event-ID": "no-es-un-cursor", "Accept-Encoding": "identity"}) as r:
+        assert r.status_code==200
+        lineas = r.iter_lines(chunk_size=1, decode_unicode=True)
+        assert [next(lineas), next(lineas)]==["retry: 3000", f": desde {cursor}"]
@@ -0,0 +1,71 @@
+"""Suite de escala (pytest-benchmark): por cada volumen de ERP_BENCH_ESCALA (por defecto 10000; p. ej.
+"10000,100000,1000000") carga N tickets sintéticos en una base propia y mide storage, app (KPIs, filtros)
+y cada endpoint de la API; cada operación es un benchmark del grupo "<N> tickets".
+
+Línea base:  python -m pytest benchmarks/test_escala.py --benchmark-save=base   (en el commit de referencia)
+Regresiones: python -m pytest benchmarks/test_escala.py --benchmark-compare --benchmark-compare-fail=min:20%
+             (exit 1 si el mínimo de alguna operación empeora más de 20% contra la última línea base guardada)
+Las líneas base dependen de la máquina y no se versionan (benchmarks/lineas_base/<máquina>/): se generan en la
+misma máquina y sesión que la comparación (en CI, dos pasos del mismo job: referencia y cambio). En una VM
+compartida el ruido supera el 20%: para compararlas ahí, subir --benchmark-min-rounds o el umbral.
+"""
+import itertools, os, tempfile, time
+import pytest
+pytest.importorskip("pytest_benchmark")
+import storage_sqlite as store
+import app_v8 as app
+import api_server
+from fastapi.testclient import TestClient
+
+ESCALA = [int(n) for n in os.environ.get("ERP_BENCH_ESCALA", "10000").split(",")]
+
+def _get(path, **params):
+    return lambda c: c["api"].get(path, params=params).raise_for_status()
+
+OPERACIONES = {
+    "load_tickets_df completo": lambda c: store.load_tickets_df(),
+    "load_tickets_df página": lambda c: store.load_tickets_df(limit=50),
+    "load_tickets_df filtrado": lambda c: store.load_tickets_df(empresa=c["empresa"], estado="Abierto", limit=50),
+    "ensure_ticket_schema": lambda c: app.ensure_ticket_schema(c["df"].copy()),
+    "_kpis": lambda c: app._kpis(c["df"]),
+    "filtros_tickets": lambda c: app.filtros_tickets(c["df"], enable_agente_filter=True),
+    "load_stats": lambda c: store.load_stats(),
+    "contar_tickets": lambda c: store.contar_tickets("estado"),
+    "buscar_tickets": lambda c: store.buscar_tickets("facturar"),
+    "bulk_update_tickets 200": lambda c: store.bulk_update_tickets(c["ids"], set_estado=next(c["estados"]), usuario="bench"),
+    "GET /tickets completo": _get("/tickets"),
+    "GET /tickets página": _get("/tickets", limit=50),
+    "GET /tickets/search": _get("/tickets/search", q="facturar"),
+    "GET /tickets/conteo": _get("/tickets/conteo", por="empresa"),
+    "GET /stats": _get("/stats"),
+    "GET /usuarios": _get("/usuarios"),
+    "GET /clientes": _get("/clientes"),
+    "GET /auditoria": _get("/auditoria", limit=100),
+}
+
+@pytest.fixture(scope="module", params=ESCALA, ids=str)
+def escala(request):
+    n, previa = request.param, store.DB_PATH
+    store.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="erp_escala_"), f"escala_{n}.db"); store._init_db(); store._catalogos.invalidar()
+    t = time.perf_counter()
+    with store._tx() as cn: store.poblar_tickets(cn, n, seed=7, n_clientes=max(5, min(200, n//5000)))
+    carga = time.perf_counter() - t
+    df = app.ensure_ticket_schema(store.load_tickets_df())
+    contexto = {"n": n, "carga_s": round(carga, 2), "df": df,
+                "empresa": max(store.contar_tickets("empresa").items(), key=lambda kv: kv[1])[0],
+                "ids": df["ID_Ticket"].sample(min(200, len(df)), random_state=1).tolist(),
+                "estados": itertools.cycle(["En Espera", "En Progreso"])}
+    try:
+        with TestClient(api_server.app, headers={"x-api-key": api_server.API_KEY}) as api:
+            yield {**contexto, "api": api}
+    finally:
+        store.cerrar_pool(); store.DB_PATH = previa; store._catalogos.invalidar()
+
+@pytest.mark.parametrize("op", list(OPERACIONES))
+def test_escala(benchmark, escala, op):
+    n = escala["n"]
+    benchmark.group = f"{n:,} tickets"; benchmark.extra_info.update(tickets=n, carga_s=escala["carga_s"])
+    if n <= 100_000:
+        benchmark(OPERACIONES[op], escala)
+    else:  # los listados completos a 1M+ tardan segundos: una sola ronda
+        benchmark.pedantic(OPERACIONES[op], args=(escala,), rounds=1)
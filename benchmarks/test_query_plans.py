@@ -0,0 +1,12 @@
+"""Guardia de planes de consulta (check_query_plans) como test: ninguna consulta de storage cae en full
+scan y, sobre todo, la traza sigue capturando consultas (sin ellas el chequeo pasaría siempre).
+
+Uso: python -m pytest benchmarks/test_query_plans.py
+"""
+def test_sin_full_scans():
+    # importado acá: registra un observador de la traza y no debe pesar en los otros tests de benchmarks/
+    import check_query_plans as chequeo
+    df = chequeo.poblar(5000); chequeo._capturadas.clear()
+    chequeo.consultas_app(df)
+    assert len(chequeo.revisadas()) >= 10, "la traza no capturó las consultas de storage"
+    assert chequeo.planes()==[]
@@ -0,0 +1,152 @@
+"""Comportamiento de storage_sqlite sobre una base nueva por test (fixture `base`).
+
+Uso: python -m pytest benchmarks/test_storage.py
+"""
+import collections, os, queue, shutil, sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from _comun import frame_sintetico
+
+def test_exportaciones_no_retienen_conexiones_del_pool(base):
+    # más descargas a medio leer que conexiones en el pool: las lecturas y el escritor siguen obteniendo una
+    abiertas = [base.iter_tickets_export("csv", chunk=1) for _ in range(base.POOL_SIZE+2)]
+    try:
+        for it in abiertas: next(it)
+        pool = base._get_pool(); cn = pool.acquire(timeout=2); pool.release(cn)
+        assert len(base.load_tickets_df(limit=5))==5
+    finally:
+        for it in abiertas: it.close()
+
+def test_cerrar_pool_con_conexiones_prestadas(base):
+    # cerrar con conexiones en uso no libera su cupo antes de tiempo: al devolverse se cierran y recién ahí cuentan
+    pool = base._get_pool()
+    prestadas = [pool.acquire() for _ in range(pool.size)]
+    base.cerrar_pool()
+    assert pool._creadas==pool.size
+    with pytest.raises(queue.Empty): pool.acquire(timeout=0.1)
+    for cn in prestadas: pool.release(cn)
+    assert pool._creadas==0 and pool._libres.empty()
+    with pytest.raises(sqlite3.ProgrammingError): prestadas[0].execute("SELECT 1")
+    assert len(base.load_tickets_df(limit=5))==5 and pool._creadas==1
+
+def _rollups(store)->dict:
+    # los triggers dejan en 0 las claves que se vaciaron (load_stats las descarta) y las sumas REAL arrastran redondeo
+    with store._conn() as cn:
+        return {t: sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in fila)
+                          for fila in cn.execute(f"SELECT * FROM {t} WHERE tickets<>0")) for t in store._ROLLUPS}
+
+def _tablas(store)->set:
+    with store._conn() as cn:
+        return {r[0] for r in cn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+def test_migraciones_base_nueva(base):
+    with base._conn() as cn: assert cn.execute("PRAGMA user_version").fetchone()[0]==base.SCHEMA_VERSION
+    assert set(base._ROLLUPS) <= _tablas(base) and "Rollup_Diario" not in _tablas(base)
+    with base._conn() as cn:
+        assert cn.execute("SELECT SUM(tickets) FROM Rollup_Agente").fetchone()[0]==cn.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0]
+
+def test_migraciones_sobre_base_existente(base, tmp_path):
+    # erp_mock.db está en user_version 0 con tickets: al migrar, los rollups se llenan desde Tickets
+    origen = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "erp_mock.db")
+    base.cerrar_pool(); base.DB_PATH = shutil.copy(origen, tmp_path / "vieja.db"); base._init_db()
+    with base._conn() as cn:
+        assert cn.execute("PRAGMA user_version").fetchone()[0]==base.SCHEMA_VERSION
+        n = cn.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0]
+        assert n > 0 and cn.execute("SELECT SUM(tickets) FROM Rollup_Agente").fetchone()[0]==n
+    migrados = _rollups(base)
+    with base._tx() as cn: base.reconstruir_derivados(cn)
+    assert _rollups(base)==migrados
+
+def test_rollups_por_triggers_igual_a_reconstruir(base):
+    df = base.load_tickets_df(); ids = df["ID_Ticket"].tolist()
+    base.bulk_update_tickets(ids[:10], set_estado="Cerrado", set_agente="Carlos Pérez")
+    base.patch_ticket(ids[10], {"Módulo_ERP": "Compras", "Satisfacción": 1.5})
+    base.upsert_ticket({**df.iloc[11].to_dict(), "Prioridad": "Baja", "SLA": "Fuera de SLA"})
+    base.crear_ticket({"Empresa": "LogiWare", "Agente_Soporte": "Sofía López", "Módulo_ERP": "Ventas"})
+    with base._tx() as cn: cn.execute("DELETE FROM Tickets WHERE ID_Ticket=?", (ids[12],))
+    por_triggers = _rollups(base)
+    with base._tx() as cn: base.reconstruir_derivados(cn)
+    assert _rollups(base)==por_triggers
+
+def _todas_las_paginas(cargar, **kw)->list:
+    paginas = [cargar(**kw)]
+    while paginas[-1].attrs["cursor"]: paginas.append(cargar(**kw, cursor=paginas[-1].attrs["cursor"]))
+    return paginas
+
+def test_auditoria_keyset_por_fecha_sin_saltos(base):
+    # timestamps repetidos y NULL: recorrer por páginas devuelve cada fila una vez, en el mismo orden que un ORDER BY
+    filas = [(f"2025-01-{1 + i % 5:02d}T10:00:00" if i % 7 else None, "admin", f"TCK-{i:05d}") for i in range(40)]
+    with base._tx() as cn:
+        cn.execute("DELETE FROM Auditoria")
+        cn.executemany("INSERT INTO Auditoria(timestamp, usuario, rol, ticket, campo, antes, despues, motivo) VALUES (?,?,'',?,'Estado','a','b','')", filas)
+        esperado = [r[0] for r in cn.execute("SELECT id FROM Auditoria ORDER BY timestamp DESC, id DESC")]
+        en_rango = [r[0] for r in cn.execute("""SELECT id FROM Auditoria WHERE timestamp>='2025-01-02' AND timestamp<'2025-01-04'
+                                                 ORDER BY timestamp DESC, id DESC""")]
+    paginas = _todas_las_paginas(base.load_auditoria, limit=3)
+    assert [i for p in paginas for i in p["id"]]==esperado and len(paginas)==len(esperado)//3 + 1
+    paginas = _todas_las_paginas(base.load_auditoria, desde="2025-01-02", hasta="2025-01-03", usuario="admin", limit=4)
+    assert [i for p in paginas for i in p["id"]]==en_rango
+
+def test_tickets_keyset_incluye_los_sin_fecha(base):
+    # los tickets sin Fecha_Creación van al final (DESC) o al principio (ASC): las páginas los recorren igual
+    with base._tx() as cn: cn.execute("UPDATE Tickets SET Fecha_Creación=NULL WHERE ID_Ticket IN ('TCK-00003','TCK-00010','TCK-00020','TCK-00041')")
+    for orden in ("desc", "asc"):
+        completo = base.load_tickets_df(orden=orden)["ID_Ticket"].tolist()
+        paginas = _todas_las_paginas(base.load_tickets_df, orden=orden, limit=7)
+        assert [i for p in paginas for i in p["ID_Ticket"]]==completo and len(completo)==60, orden
+        assert paginas[-1 if orden=="desc" else 0]["Fecha_Creación"].isna().any(), orden
+    # con filtro, el tramo sin fecha también respeta el filtro
+    abiertos = base.load_tickets_df(estado="Abierto")["ID_Ticket"].tolist()
+    assert [i for p in _todas_las_paginas(base.load_tickets_df, estado="Abierto", limit=3) for i in p["ID_Ticket"]]==abiertos
+
+def test_tickets_filtro_codigo_por_parte_del_id(base):
+    assert set(base.load_tickets_df(id_contiene="0001")["ID_Ticket"])=={"TCK-00001", *(f"TCK-0001{i}" for i in range(10))}
+    assert base.load_tickets_df(id_contiene="tck-0000")["ID_Ticket"].tolist()==base.load_tickets_df(id_prefijo="tck-0000")["ID_Ticket"].tolist()
+    assert base.load_tickets_df(id_contiene="_")["ID_Ticket"].empty and base.load_tickets_df(id_contiene="%")["ID_Ticket"].empty
+
+def test_cambios_retencion_y_cursor_viejo(base):
+    desde = base.ultimo_cambio()
+    with base._tx() as cn:
+        cn.executemany("INSERT INTO Cambios(ticket, op) VALUES (?, 'U')", (("TCK-00001",) for _ in range(base.CAMBIOS_RETENCION + 2*base.CAMBIOS_PODA)))
+        conservadas, primero = cn.execute("SELECT COUNT(*), MIN(id) FROM Cambios").fetchone()
+    assert base.CAMBIOS_RETENCION <= conservadas < base.CAMBIOS_RETENCION + base.CAMBIOS_PODA
+    assert base.cambios_desde(desde)["recargar"]  # lo que había entre `desde` y la primera fila conservada ya no está
+    assert not base.cambios_desde(primero-1)["recargar"] and not base.cambios_desde(base.ultimo_cambio()-5)["recargar"]
+
+def test_upsert_tickets_errores_y_lote_interrumpido(base):
+    recs = [{"ID_Ticket": f"UPS-{i:03d}", "Empresa": "LogiWare"} for i in range(10)]
+    assert base.upsert_tickets([*recs[:3], {"Empresa": "sin ID"}, *recs[3:]], lote=4)==[(3, "ID_Ticket vacío")]
+    with base._tx() as cn:
+        cn.execute("CREATE TRIGGER t_rechazo BEFORE INSERT ON Tickets WHEN NEW.ID_Ticket='NUE-007' BEGIN SELECT RAISE(ABORT, 'rechazado'); END")
+    with pytest.raises(base.IngestaInterrumpida) as e:
+        base.upsert_tickets([{"ID_Ticket": f"NUE-{i:03d}"} for i in range(10)], lote=4)
+    assert e.value.procesados==4  # el lote 4..7 se deshizo entero
+    with base._conn() as cn: assert cn.execute("SELECT COUNT(*) FROM Tickets WHERE ID_Ticket LIKE 'NUE-%'").fetchone()[0]==4
+
+def test_altas_concurrentes_sin_colisiones(base):
+    # varios hilos dando altas a la vez, con un ID importado por delante de la secuencia: ni repetidos ni pisados
+    # (benchmarks/stress_ids.py hace lo mismo con varios procesos)
+    with base._conn() as cn: sig = cn.execute("SELECT valor FROM Secuencias WHERE nombre='tickets'").fetchone()[0] + 3
+    importado = f"{base.TICKET_PREFIJO}{sig:05d}"
+    base.upsert_ticket({**frame_sintetico(1).iloc[0].to_dict(), "ID_Ticket": importado, "Comentarios": "importado"})
+    with base._conn() as cn: antes = cn.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0]
+    recs = frame_sintetico(200).drop(columns=["ID_Ticket", "Fecha_Creación"]).to_dict(orient="records")
+    with ThreadPoolExecutor(8) as ex: ids = list(ex.map(lambda rec: base.crear_ticket(rec, usuario="stress"), recs))
+    assert len(set(ids))==200 and importado not in ids
+    with base._conn() as cn:
+        assert cn.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0]==antes+200
+        assert cn.execute("SELECT COUNT(*) FROM Auditoria WHERE campo='CREACION' AND usuario='stress'").fetchone()[0]==200
+        assert cn.execute("SELECT Comentarios FROM Tickets WHERE ID_Ticket=?", (importado,)).fetchone()[0]=="importado"
+
+def test_consultas_lentas_con_plan_sobre_base_grande(base, monkeypatch):
+    # el umbral se evalúa por conexión al abrirla: se cierran las del pool para que las nuevas midan
+    monkeypatch.setattr(base, "SQL_LENTO_MS", 50.0); monkeypatch.setattr(base, "_lentas", collections.deque(maxlen=200))
+    base.cerrar_pool()
+    with base._tx() as cn: base.poblar_tickets(cn, 50_000, seed=7, n_clientes=20)
+    alta = next(c for c in base.consultas_lentas(200) if c["sql"].startswith("INSERT INTO Tickets("))
+    assert alta["funcion"]=="poblar_tickets" and alta["params"] is None and not any(p.startswith("(sin plan") for p in alta["plan"])
+    base._lentas.clear()
+    base.load_tickets_df(); base.get_ticket("TCK-00001"); base.load_tickets_df(limit=50)
+    lentas = base.consultas_lentas()
+    assert [c["funcion"] for c in lentas]==["load_tickets_df"] and lentas[0]["ms"] >= 50
+    assert lentas[0]["plan"]==["SCAN Tickets USING INDEX ix_tickets_fecha"]
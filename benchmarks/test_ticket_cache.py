@@ -0,0 +1,42 @@
+"""TicketCache sobre storage_sqlite: después de cada delta el frame es el mismo que una carga completa.
+
+Uso: python -m pytest benchmarks/test_ticket_cache.py
+"""
+import pandas as pd
+from _comun import frame_sintetico
+from ticket_cache import TicketCache
+
+def _categorias(df: pd.DataFrame)->pd.DataFrame:
+    return df.astype({"Estado": "category", "Prioridad": "category"})
+
+def _igual_a_carga_completa(cache: TicketCache, store):
+    completo = _categorias(store.load_tickets_df()).sort_values("ID_Ticket", ignore_index=True)
+    actual = cache.df.sort_values("ID_Ticket", ignore_index=True)
+    pd.testing.assert_frame_equal(actual.astype(str), completo[actual.columns].astype(str))
+
+def test_deltas_fusionan_altas_cambios_y_categorias_nuevas(base):
+    cache = TicketCache(base.load_tickets_df, preparar=_categorias)
+    df0 = cache.refrescar(); abiertos0 = cache.vista("abiertos", lambda d: d[d["Estado"]=="Abierto"])
+    filas0 = df0.copy()
+    base.patch_ticket("TCK-00001", {"Estado": "Reabierto", "Comentarios": "delta"})  # fuera de las categorías del frame
+    nuevo = base.crear_ticket(frame_sintetico(1).drop(columns=["ID_Ticket", "Fecha_Creación"]).iloc[0].to_dict())
+    cache.marcar(); df1 = cache.refrescar()
+    assert df1 is not df0 and len(df1)==len(df0)+1 and nuevo in set(df1["ID_Ticket"])
+    assert df1.loc[df1["ID_Ticket"]=="TCK-00001", "Estado"].item()=="Reabierto"
+    pd.testing.assert_frame_equal(df0, filas0)  # copy-on-write: quien tenía el frame anterior no ve el delta
+    assert cache.vista("abiertos", lambda d: d[d["Estado"]=="Abierto"]) is not abiertos0
+    _igual_a_carga_completa(cache, base)
+    assert cache.refrescar() is df1  # sin cambios ni marca, dentro del intervalo: no consulta
+
+def test_aplicar_delta_del_feed(base):
+    cache = TicketCache(base.load_tickets_df, preparar=_categorias)
+    cache.refrescar(); desde = base.ultimo_cambio()
+    base.bulk_update_tickets(["TCK-00002", "TCK-00003"], set_prioridad="Baja")
+    with base._tx() as cn: cn.execute("DELETE FROM Tickets WHERE ID_Ticket='TCK-00004'")
+    delta = base.cambios_desde(desde)
+    assert not delta["recargar"] and delta["borrados"]==["TCK-00004"]
+    cache.aplicar_delta(delta)
+    assert "TCK-00004" not in set(cache.df["ID_Ticket"])
+    _igual_a_carga_completa(cache, base)
+    assert cache.aplicar_delta({"recargar": True}) is None and cache.df is None
+    cache.refrescar(); _igual_a_carga_completa(cache, base)
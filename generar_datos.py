@@ -0,0 +1,85 @@
+"""Generador de tickets sintéticos con distribuciones realistas (clientes con peso Zipf, módulos y
+categorías sesgados, días hábiles, antigüedad -> probabilidad de resolución, SLA y CSAT coherentes).
+
+Uso: python generar_datos.py N [--db ruta.db] [--dias 365] [--clientes 20] [--seed 7]
+La carga la hace storage_sqlite.poblar_tickets: executemany por lotes dentro de una sola transacción.
+"""
+import argparse, os, time
+from datetime import datetime
+import numpy as np
+
+MODULOS = {"Facturación": .22, "Ventas": .18, "Inventario": .15, "Contabilidad": .12,
+           "Compras": .10, "Logística": .09, "Tesorería": .08, "Producción": .06}
+PRIORIDADES = {"Alta": .2, "Media": .5, "Baja": .3}
+CATEGORIAS = {"Consulta funcional": .35, "Integración": .20, "Reporte caído": .18, "Mejora": .15, "Error crítico": .12}
+ESTADOS_ABIERTOS = {"Abierto": .35, "En Progreso": .30, "En Espera": .20, "Priorizado": .15}
+ESTADOS_CERRADOS = {"Cerrado": .6, "Resuelto": .4}
+SLA_OBJ_HORAS = {"Alta": 24, "Media": 48, "Baja": 72}          # mismos objetivos que app_v8
+RESOLUCION_MEDIANA_HS = {"Alta": 6, "Media": 16, "Baja": 30}
+DIAS_RESOLUCION = 5   # antigüedad media (días) a la que un ticket suele estar resuelto
+
+NOMBRES = ["Ana","Pablo","Lucía","Marcos","Valeria","Diego","Sofía","Carlos","Julieta","Martín","Paula","Jorge"]
+APELLIDOS = ["Silva","Ruiz","Peña","Medina","Ortiz","Gómez","López","Pérez","Romero","Castro","Díaz","Sosa"]
+PALABRAS = ("error al facturar remito pendiente stock negativo asiento contable cierre mensual integración banco "
+            "usuario bloqueado reporte lento impresora fiscal orden de compra percepciones retenciones lote "
+            "vencido cuenta corriente conciliación exportar excel permisos perfil timeout servicio").split()
+
+COLUMNAS = ("ID_Ticket","Empresa","Usuario_Reportante","Agente_Soporte","Módulo_ERP","Prioridad","Categoría",
+            "Estado","SLA","Fecha_Creación","Tiempo_Resolución_hs","Comentarios","Satisfacción","updated_at","rowversion")
+
+def _elegir(rng, pesos: dict, n: int)->np.ndarray:
+    p = np.array(list(pesos.values()), dtype=float)
+    return np.array(list(pesos), dtype=object)[rng.choice(len(p), n, p=p/p.sum())]
+
+def nombres_reportantes(rng, k: int)->list:
+    return [f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}" for _ in range(k)]
+
+def lote_tickets(rng, n: int, primer_id: int, primera_version: int, clientes: dict, agentes: list,
+                 ahora: datetime, dias: int = 365):
+    """Filas (tuplas en el orden de COLUMNAS) para n tickets; `clientes` = {cliente: [reportantes]}."""
+    # fecha: días hábiles pesan 4x más que fines de semana, horario centrado en las 13 h
+    hoy = np.datetime64(ahora.date(), "D")
+    offsets = np.arange(dias)
+    habil = np.is_busday(hoy - offsets)
+    dia = rng.choice(offsets, n, p=np.where(habil, 1.0, .25)/np.where(habil, 1.0, .25).sum())
+    minutos = np.clip(rng.normal(13*60, 180, n), 8*60, 20*60).astype("int64")
+    fecha = (hoy - dia).astype("datetime64[m]") + minutos + rng.integers(0, 60_000_000, n).astype("timedelta64[us]")
+    fecha = np.minimum(fecha, np.datetime64(ahora, "us") - np.timedelta64(1, "m"))
+    edad_hs = (np.datetime64(ahora, "us") - fecha) / np.timedelta64(1, "h")
+
+    prioridad = _elegir(rng, PRIORIDADES, n)
+    objetivo = np.vectorize(SLA_OBJ_HORAS.get, otypes=[float])(prioridad)
+    cerrado = rng.random(n) < 1 - np.exp(-edad_hs/24/DIAS_RESOLUCION)
+    estado = np.where(cerrado, _elegir(rng, ESTADOS_CERRADOS, n), _elegir(rng, ESTADOS_ABIERTOS, n))
+    mediana = np.vectorize(RESOLUCION_MEDIANA_HS.get, otypes=[float])(prioridad)
+    horas = np.minimum(rng.lognormal(np.log(mediana), .8), np.maximum(edad_hs, .5)).round(1)
+    fuera = np.where(cerrado, horas > objetivo, edad_hs > objetivo)
+    csat = np.clip(rng.normal(np.where(fuera, 3.6, 4.5), .6), 1, 5).round(1)
+
+    # clientes con peso Zipf (pocos concentran la mayoría) y reportante entre los del cliente
+    nombres = list(clientes); zipf = 1/np.arange(1, len(nombres)+1)**.8
+    ic = rng.choice(len(nombres), n, p=zipf/zipf.sum())
+    reportante = np.empty(n, dtype=object)
+    for i, cli in enumerate(nombres):
+        m = ic==i; reps = clientes[cli] or ["Sin reportante"]
+        reportante[m] = np.array(reps, dtype=object)[rng.integers(0, len(reps), m.sum())]
+    frases = np.array([" ".join(rng.choice(PALABRAS, rng.integers(4, 9))) for _ in range(min(n, 5000))], dtype=object)
+
+    iso = np.datetime_as_string(fecha, unit="us")
+    return zip([f"TCK-{i:05d}" for i in range(primer_id, primer_id+n)], np.array(nombres, dtype=object)[ic], reportante,
+               np.array(agentes, dtype=object)[rng.integers(0, len(agentes), n)], _elegir(rng, MODULOS, n), prioridad,
+               _elegir(rng, CATEGORIAS, n), estado, np.where(fuera, "Fuera de SLA", "Dentro de SLA"), iso,
+               np.where(cerrado, horas, None), frases[rng.integers(0, len(frases), n)], np.where(cerrado, csat, None),
+               iso, range(primera_version, primera_version+n))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Carga masiva de tickets sintéticos")
+    ap.add_argument("n", type=int); ap.add_argument("--db"); ap.add_argument("--dias", type=int, default=365)
+    ap.add_argument("--clientes", type=int); ap.add_argument("--seed", type=int)
+    args = ap.parse_args()
+    if args.db: os.environ["ERP_SQLITE_PATH"] = args.db
+    import storage_sqlite as store  # después de fijar la ruta de la base
+    t = time.perf_counter()
+    with store._tx() as cn:
+        store.poblar_tickets(cn, args.n, seed=args.seed, dias=args.dias, n_clientes=args.clientes)
+    print(f"{args.n} tickets en {store.DB_PATH} en {time.perf_counter()-t:.1f}s")
@@ -0,0 +1,134 @@
+"""Métricas en el formato de exposición de Prometheus, sin dependencias: contadores e histogramas con
+etiquetas, medidores calculados al exponer (tamaño de la base, estado del pool) y un servidor HTTP
+opcional para procesos sin API propia (Streamlit). Un registro por proceso; ERP_METRICAS=0 las apaga.
+"""
+import bisect, os, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACTIVAS = os.environ.get("ERP_METRICAS", "1")=="1"
+MEDIA = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS_S = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+def _escapar(v: str)->str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v)->str:
+    return "+Inf" if v==float("inf") else repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Metrica:
+    tipo = "untyped"
+    def __init__(self, nombre: str, ayuda: str, etiquetas=()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self._series = {}; self._lock = threading.Lock()
+
+    def _clave(self, valores: dict)->tuple:
+        return tuple(str(valores.get(e, "")) for e in self.etiquetas)
+
+    def _etiquetas(self, clave: tuple, extra="")->str:
+        partes = [f'{e}="{_escapar(v)}"' for e, v in zip(self.etiquetas, clave)] + ([extra] if extra else [])
+        return "{" + ",".join(partes) + "}" if partes else ""
+
+    def exponer(self)->list:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}", *self._lineas()]
+
+class Contador(_Metrica):
+    tipo = "counter"
+    def inc(self, n=1, **etiquetas):
+        k = self._clave(etiquetas)
+        with self._lock: self._series[k] = self._series.get(k, 0) + n
+
+    def _lineas(self):
+        with self._lock: series = list(self._series.items())
+        return [f"{self.nombre}{self._etiquetas(k)} {_num(v)}" for k, v in series]
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+    def __init__(self, nombre: str, ayuda: str, etiquetas=(), buckets=BUCKETS_S):
+        super().__init__(nombre, ayuda, etiquetas); self.buckets = tuple(buckets)
+
+    def observar(self, valor: float, **etiquetas):
+        k = self._clave(etiquetas); i = bisect.bisect_left(self.buckets, valor)  # le es inclusivo
+        with self._lock:
+            s = self._series.get(k)
+            if s is None: s = self._series[k] = [[0]*(len(self.buckets)+1), 0.0]
+            s[0][i] += 1; s[1] += valor
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter()-t, **etiquetas)
+
+    def _lineas(self):
+        with self._lock: series = [(k, list(cubos), suma) for k, (cubos, suma) in self._series.items()]
+        lineas = []
+        for k, cubos, suma in series:
+            acumulado = 0
+            for le, n in zip(self.buckets + (float("inf"),), cubos):
+                acumulado += n; cota = 'le="%s"' % _num(le)
+                lineas.append(f"{self.nombre}_bucket{self._etiquetas(k, cota)} {acumulado}")
+            lineas += [f"{self.nombre}_sum{self._etiquetas(k)} {_num(suma)}", f"{self.nombre}_count{self._etiquetas(k)} {acumulado}"]
+        return lineas
+
+class Medidor(_Metrica):
+    """Gauge calculado al exponer: `fn()` devuelve un número o {valores de etiquetas (tupla): número}."""
+    tipo = "gauge"
+    def __init__(self, nombre: str, ayuda: str, fn, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas); self.fn = fn
+
+    def _lineas(self):
+        try:
+            v = self.fn()
+        except Exception:
+            return []  # p. ej. la base todavía no existe
+        series = v.items() if isinstance(v, dict) else [((), v)]
+        return [f"{self.nombre}{self._etiquetas(tuple(map(str, k)))} {_num(n)}" for k, n in series]
+
+# ====== REGISTRO ======
+_registro: dict = {}
+_registro_lock = threading.Lock()
+
+def _registrar(cls, nombre: str, *args, **kwargs):
+    # idempotente: módulos recargados (reruns de Streamlit) reciben la misma métrica, no un duplicado
+    with _registro_lock:
+        if nombre not in _registro: _registro[nombre] = cls(nombre, *args, **kwargs)
+        return _registro[nombre]
+
+def contador(nombre: str, ayuda: str, etiquetas=())->Contador:
+    return _registrar(Contador, nombre, ayuda, etiquetas)
+
+def histograma(nombre: str, ayuda: str, etiquetas=(), buckets=BUCKETS_S)->Histograma:
+    return _registrar(Histograma, nombre, ayuda, etiquetas, buckets)
+
+def medidor(nombre: str, ayuda: str, etiquetas=(), *, fn)->Medidor:
+    return _registrar(Medidor, nombre, ayuda, fn, etiquetas)
+
+def exponer()->str:
+    with _registro_lock: metricas = list(_registro.values())
+    return "\n".join(l for m in metricas for l in m.exponer()) + "\n"
+
+# ====== SERVIDOR HTTP (procesos sin API: la app Streamlit) ======
+_servidor = None
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0]!="/metrics": self.send_error(404); return
+        cuerpo = exponer().encode()
+        self.send_response(200); self.send_header("Content-Type", MEDIA); self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers(); self.wfile.write(cuerpo)
+
+    def log_message(self, *args): pass
+
+def servir(puerto: int, host="127.0.0.1"):
+    """Expone /metrics en un hilo aparte; una sola vez por proceso (llamadas siguientes no hacen nada).
+    Por defecto solo en loopback: /metrics no pide API key."""
+    global _servidor
+    with _registro_lock:
+        if _servidor is not None: return _servidor
+        _servidor = ThreadingHTTPServer((host, puerto), _Handler); _servidor.daemon_threads = True
+    threading.Thread(target=_servidor.serve_forever, name="metricas-http", daemon=True).start()
+    return _servidor
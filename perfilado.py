@@ -0,0 +1,50 @@
+"""Perfilado a pedido de un request de la API con cProfile. El middleware de api_server abre un Perfil y lo
+deja en la variable de contexto `actual`; el hilo del event loop y cada llamada que AsyncStore despacha a
+sus hilos lector/escritor se perfilan por separado y al final se combinan en un único pstats.
+"""
+import contextvars, cProfile, io, marshal, pstats, threading, time
+from contextlib import contextmanager
+
+actual: contextvars.ContextVar = contextvars.ContextVar("perfil", default=None)
+
+class Perfil:
+    def __init__(self):
+        self._perfiles = []; self._lock = threading.Lock(); self.inicio = time.perf_counter()
+
+    def _guardar(self, p: cProfile.Profile):
+        with self._lock: self._perfiles.append(p)
+
+    @contextmanager
+    def activo(self):
+        # perfila el hilo actual; desde Python 3.12 cProfile es global (sys.monitoring) y un segundo
+        # perfilador no puede activarse: ahí el que ya corre cubre también a los otros hilos
+        p = cProfile.Profile()
+        try:
+            p.enable()
+        except ValueError:
+            yield; return
+        try:
+            yield
+        finally:
+            p.disable(); self._guardar(p)
+
+    def correr(self, fn, *args, **kwargs):
+        with self.activo(): return fn(*args, **kwargs)
+
+    def stats(self)->pstats.Stats | None:
+        with self._lock: perfiles = [p for p in self._perfiles if p.getstats()]
+        if not perfiles: return None
+        st = pstats.Stats(perfiles[0], stream=io.StringIO())
+        for p in perfiles[1:]: st.add(p)
+        return st
+
+    def texto(self, orden="cumulative", lineas=40)->str:
+        st = self.stats()
+        if st is None: return "(sin datos de perfil)\n"
+        st.stream = buf = io.StringIO(); st.strip_dirs().sort_stats(orden).print_stats(lineas)
+        return buf.getvalue()
+
+    def volcado(self)->bytes:
+        # mismo formato que pstats.Stats.dump_stats: se abre con pstats.Stats(archivo) o snakeviz
+        st = self.stats()
+        return marshal.dumps(st.stats if st else {})
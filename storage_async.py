@@ -0,0 +1,59 @@
+import asyncio, functools, threading
+from concurrent.futures import ThreadPoolExecutor
+import storage_sqlite as store
+import perfilado
+
+class AsyncStore:
+    """Fachada async sobre storage_sqlite para la API.
+
+    Las lecturas corren en un pool de hilos lectores propio (no compiten con el threadpool de Starlette)
+    y todas las escrituras se encolan en un único hilo escritor: con WAL los lectores nunca esperan al
+    escritor y los escritores nunca compiten entre sí por el lock ("database is locked").
+    """
+    def __init__(self, lectores: int | None = None):
+        # lectores + escritor <= tamaño del pool de conexiones, así nadie espera una conexión (las exportaciones
+        # en streaming abren la suya: no retienen una del pool mientras el cliente descarga)
+        self.n_lectores = lectores or max(1, store.POOL_SIZE-1)
+        self._lectores = self._escritor = None
+
+    def _ejecutor(self, escritura: bool)->ThreadPoolExecutor:
+        # se crean al primer uso (y de nuevo después de cerrar(), p. ej. entre ciclos de lifespan)
+        if escritura:
+            if self._escritor is None: self._escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-escritor")
+            return self._escritor
+        if self._lectores is None: self._lectores = ThreadPoolExecutor(max_workers=self.n_lectores, thread_name_prefix="sqlite-lector")
+        return self._lectores
+
+    async def _correr(self, escritura: bool, fn, *args, **kwargs):
+        llamada = functools.partial(fn, *args, **kwargs)
+        # run_in_executor no propaga el contexto: si el request se está perfilando, el hilo perfila su parte
+        perfil = perfilado.actual.get()
+        if perfil is not None: llamada = functools.partial(perfil.correr, llamada)
+        return await asyncio.get_running_loop().run_in_executor(self._ejecutor(escritura), llamada)
+
+    async def leer(self, fn, *args, **kwargs):
+        return await self._correr(False, fn, *args, **kwargs)
+
+    async def escribir(self, fn, *args, **kwargs):
+        return await self._correr(True, fn, *args, **kwargs)
+
+    async def iterar(self, fn, *args, **kwargs):
+        """Recorre un generador de storage (exportaciones) en los hilos lectores, un elemento por vez. Al
+        terminar, o si quien consume corta (cliente desconectado), el generador se cierra en un hilo lector
+        después del next() en curso: así libera su cursor y su conexión del pool."""
+        it, lock, fin = fn(*args, **kwargs), threading.Lock(), object()
+        def siguiente():
+            with lock: return next(it, fin)
+        def cerrar():
+            with lock: it.close()
+        try:
+            while (item := await self.leer(siguiente)) is not fin:
+                yield item
+        finally:
+            # sin await: en una cancelación no se puede esperar, y el cierre igual queda detrás del next() en curso
+            self._ejecutor(False).submit(cerrar)
+
+    def cerrar(self):
+        for ejecutor in (self._lectores, self._escritor):
+            if ejecutor is not None: ejecutor.shutdown(wait=True)
+        self._lectores = self._escritor = None
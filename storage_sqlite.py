@@ -1,15 +1,487 @@
-import sqlite3, os, pandas as pd
-from contextlib import contextmanager
-from datetime import datetime, timedelta
+import sqlite3, os, re, csv, io, queue, threading, time, functools, inspect, collections, logging, pandas as pd
+from contextlib import closing, contextmanager
+from datetime import datetime
+import metricas
 DB_PATH = os.environ.get("ERP_SQLITE_PATH", "erp_mock.db")
+POOL_SIZE = int(os.environ.get("ERP_SQLITE_POOL", "8"))
+
+# Pragmas por conexión: WAL deja leer mientras se escribe; NORMAL es seguro con WAL (sin fsync por commit)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA mmap_size={256*1024*1024}",
+    "PRAGMA cache_size=-65536",      # KiB -> 64 MiB
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA recursive_triggers=ON",  # INSERT OR REPLACE dispara los triggers de DELETE (rollups)
+)
+
+# ====== POOL DE CONEXIONES ======
+class _Pool:
+    """Pool thread-safe de conexiones SQLite reutilizables (LIFO: la más reciente tiene la caché caliente).
+    Cada conexión trae su propia caché de sentencias preparadas (`cached_statements`)."""
+    def __init__(self, path: str, size: int):
+        self.path, self.size = path, size
+        self._libres = queue.LifoQueue(); self._lock = threading.Lock(); self._creadas = 0; self._pid = os.getpid()
+        # close() sube la generación: las conexiones prestadas de antes se cierran al devolverse, no vuelven al pool
+        self._gen = 0; self._gen_de = {}
+
+    def _nueva(self):
+        cn = _abrir(self.path)
+        with self._lock: self._gen_de[cn] = self._gen
+        return cn
+
+    def _descartar(self, cn):
+        cn.close()
+        with self._lock: self._creadas -= 1; self._gen_de.pop(cn, None)
+
+    def acquire(self, timeout: float = 30):
+        t = time.perf_counter()
+        try:
+            cn = self._libres.get_nowait(); _M_ESPERA.observar(time.perf_counter()-t); return cn
+        except queue.Empty:
+            pass
+        with self._lock:
+            crear = self._creadas < self.size
+            if crear: self._creadas += 1
+        if crear:
+            try:
+                return self._nueva()
+            except Exception:
+                with self._lock: self._creadas -= 1
+                raise
+        cn = self._libres.get(timeout=timeout); _M_ESPERA.observar(time.perf_counter()-t)
+        return cn
+
+    def release(self, cn):
+        if cn.in_transaction: cn.rollback()
+        cn.row_factory = None
+        with self._lock:
+            vigente = self._gen_de.get(cn)==self._gen
+            if vigente: self._libres.put(cn)
+        if not vigente: self._descartar(cn)
+
+    def close(self):
+        # solo las libres se cierran ya; _creadas baja con cada una y con cada prestada al devolverse,
+        # así el tope de POOL_SIZE sigue contando las que todavía están en uso
+        with self._lock: self._gen += 1
+        while True:
+            try: self._descartar(self._libres.get_nowait())
+            except queue.Empty: break
+
+def _abrir(path: str)->sqlite3.Connection:
+    cn = sqlite3.connect(path, check_same_thread=False, timeout=5, cached_statements=256,
+                         factory=_ConexionMedida if SQL_LENTO_MS > 0 else sqlite3.Connection)
+    for p in PRAGMAS: cn.execute(p)
+    if _con_traza(): cn.set_trace_callback(_traza)
+    return cn
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool()->_Pool:
+    global _pool
+    # se recrea si cambió la ruta o si el proceso fue forkeado (las conexiones no cruzan fork)
+    if _pool is None or _pool.path!=DB_PATH or _pool._pid!=os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.path!=DB_PATH or _pool._pid!=os.getpid():
+                _pool = _Pool(DB_PATH, POOL_SIZE)
+    return _pool
+
+@contextmanager
+def _tx():
+    # Transacción de escritura única: BEGIN IMMEDIATE toma el lock al inicio (sin upgrade de lectura a escritura)
+    with _conn() as cn:
+        cn.execute("BEGIN IMMEDIATE")
+        try:
+            yield cn
+            cn.commit()
+        except Exception:
+            cn.rollback(); raise
+
+def cerrar_pool():
+    if _pool is not None: _pool.close()
 
 @contextmanager
 def _conn():
-    cn = sqlite3.connect(DB_PATH)
+    pool = _get_pool(); cn = pool.acquire()
     try:
         yield cn
     finally:
-        cn.close()
+        pool.release(cn)
+
+# ====== MÉTRICAS (tiempo y sentencias por función pública, espera de conexión, tamaño de la base) ======
+_M_FUNCION = metricas.histograma("erp_storage_segundos", "Duración de las funciones de storage_sqlite", ("funcion",))
+_M_ERRORES = metricas.contador("erp_storage_errores_total", "Excepciones por función de storage_sqlite", ("funcion", "error"))
+_M_SENTENCIAS = metricas.contador("erp_sqlite_sentencias_total",
+                                  "Sentencias SQL por función, con ERP_SQL_TRAZA=1 (executemany cuenta una por fila)", ("funcion",))
+_M_ESPERA = metricas.histograma("erp_sqlite_espera_conexion_segundos", "Espera para obtener una conexión del pool")
+metricas.medidor("erp_sqlite_bytes", "Tamaño en disco de la base y del WAL", ("archivo",),
+                 fn=lambda: {(a,): os.path.getsize(DB_PATH+suf) if os.path.exists(DB_PATH+suf) else 0 for a, suf in (("db", ""), ("wal", "-wal"))})
+metricas.medidor("erp_sqlite_conexiones", "Conexiones del pool (creadas y libres)", ("estado",),
+                 fn=lambda: {("creadas",): _pool._creadas, ("libres",): _pool._libres.qsize()} if _pool else {})
+
+# funciones envueltas al final del módulo; las sentencias se atribuyen a la que corre en el hilo
+_INSTRUMENTADAS = ("load_usuarios_df", "load_tickets_df", "ultimo_cambio", "cambios_desde", "buscar_tickets", "contar_tickets",
+                   "list_clientes", "list_reportantes", "add_cliente_si_no_existe", "add_reportante_si_no_existe",
+                   "iter_tickets", "iter_tickets_export", "export_tickets", "load_stats", "upsert_ticket", "get_ticket",
+                   "patch_ticket", "crear_ticket", "upsert_tickets", "bulk_update_tickets", "registrar_auditoria_batch", "registrar_auditoria",
+                   "load_auditoria", "poblar_tickets", "reconstruir_derivados")
+_en_curso = threading.local()
+
+def _instrumentada(nombre: str, fn):
+    def paso(llamar):
+        previa, _en_curso.funcion = getattr(_en_curso, "funcion", None), nombre
+        try:
+            return llamar()
+        except StopIteration:
+            raise
+        except Exception as e:
+            _M_ERRORES.inc(funcion=nombre, error=type(e).__name__); raise
+        finally:
+            _en_curso.funcion = previa
+    if inspect.isgeneratorfunction(fn):
+        # generadores (exportaciones): solo cuenta el tiempo dentro de next(), no el del consumidor
+        @functools.wraps(fn)
+        def generador(*args, **kwargs):
+            it, total = fn(*args, **kwargs), 0.0
+            try:
+                while True:
+                    t = time.perf_counter()
+                    try:
+                        item = paso(lambda: next(it))
+                    except StopIteration:
+                        return
+                    finally:
+                        total += time.perf_counter()-t
+                    yield item
+            finally:
+                it.close(); _M_FUNCION.observar(total, funcion=nombre)
+        return generador
+    @functools.wraps(fn)
+    def medida(*args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return paso(lambda: fn(*args, **kwargs))
+        finally:
+            _M_FUNCION.observar(time.perf_counter()-t, funcion=nombre)
+    return medida
+
+# ====== TRAZA Y CONSULTAS LENTAS (opcionales: nada corre por sentencia salvo que se pida) ======
+SQL_TRAZA = os.environ.get("ERP_SQL_TRAZA", "0")=="1"          # trace callback: erp_sqlite_sentencias_total
+SQL_LENTO_MS = float(os.environ.get("ERP_SQL_LENTO_MS", "0"))  # > 0: registra las sentencias más lentas que esto
+_log_lento = logging.getLogger("erp.sql_lento")
+_lentas = collections.deque(maxlen=200)
+_INSTRUMENTAR = metricas.ACTIVAS or SQL_TRAZA or SQL_LENTO_MS > 0
+_EXPLICABLES = {"SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE"}
+
+_observadores = []
+
+def observar_sentencias(fn):
+    """Llama fn(sql) por cada sentencia que ejecute storage (con los parámetros expandidos), p. ej. para
+    revisar sus planes. sqlite3 admite un solo trace callback por conexión: los observadores van encadenados
+    detrás del propio en lugar de reemplazarlo. Rige para las conexiones nuevas (se cierran las libres del pool)."""
+    _observadores.append(fn); cerrar_pool()
+
+def _con_traza()->bool:
+    return SQL_TRAZA or bool(_observadores)
+
+def _traza(sql: str):
+    # trace de sqlite3: una llamada por sentencia (executemany: una por fila), con los parámetros ya expandidos
+    for fn in _observadores: fn(sql)
+    if SQL_TRAZA: _M_SENTENCIAS.inc(funcion=getattr(_en_curso, "funcion", None) or "otra")
+
+class _CursorMedido(sqlite3.Cursor):
+    """Cursor de las conexiones del pool con ERP_SQL_LENTO_MS > 0: cada sentencia suma solo el tiempo dentro
+    de execute y de los fetch (no lo que hace quien llama entre uno y otro, p. ej. pandas armando el frame) y
+    se evalúa al agotarse, al ejecutar la siguiente o al cerrar el cursor."""
+    _abierta = None  # [sql, parámetros, ms]
+
+    def _sumar(self, t: float):
+        if self._abierta: self._abierta[2] += (time.perf_counter()-t)*1000
+
+    def _cerrar(self):
+        abierta, self._abierta = self._abierta, None
+        if abierta and abierta[2] >= SQL_LENTO_MS: _registrar_lenta(*abierta)
+
+    def execute(self, sql, params=()):
+        self._cerrar(); t = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._abierta = [sql, params, (time.perf_counter()-t)*1000]
+
+    def executemany(self, sql, filas):
+        self._cerrar(); t = time.perf_counter()
+        try:
+            return super().executemany(sql, filas)
+        finally:
+            self._abierta = [sql, None, (time.perf_counter()-t)*1000]; self._cerrar()
+
+    def _fetch(self, fetch, agotado):
+        t = time.perf_counter()
+        try:
+            filas = fetch()
+        finally:
+            self._sumar(t)
+        if agotado(filas): self._cerrar()
+        return filas
+
+    def fetchone(self):
+        return self._fetch(super().fetchone, lambda f: f is None)
+
+    def fetchmany(self, size=None):
+        n = self.arraysize if size is None else size
+        return self._fetch(functools.partial(super().fetchmany, n), lambda f: len(f) < n)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall, lambda f: True)
+
+    def __next__(self):
+        t = time.perf_counter()
+        try:
+            return super().__next__()
+        except StopIteration:
+            self._sumar(t); t = None; self._cerrar(); raise
+        finally:
+            if t is not None: self._sumar(t)
+
+    def close(self):
+        self._cerrar(); super().close()
+
+    def __del__(self):
+        self._cerrar()  # cursores que nadie agota ni cierra (p. ej. execute(...).fetchone())
+
+class _ConexionMedida(sqlite3.Connection):
+    # Connection.execute no pasa por cursor(): se redefinen los atajos para que usen _CursorMedido
+    def cursor(self, factory=_CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, filas):
+        return self.cursor().executemany(sql, filas)
+
+def _plan(sql: str, params=())->list:
+    if sql.lstrip().split(None, 1)[0].upper() not in _EXPLICABLES: return []
+    try:
+        # conexión aparte de solo lectura: la del pool está a mitad de una sentencia o transacción
+        # executemany no guarda parámetros: NULL en cada `?` (el plan no depende de los valores)
+        if params is None: params = [None]*sql.count("?")
+        with closing(sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)) as cn:
+            nivel, plan = {0: -1}, []
+            for id_, padre, _, detalle in cn.execute("EXPLAIN QUERY PLAN " + sql, params):
+                nivel[id_] = nivel.get(padre, -1) + 1; plan.append("  "*nivel[id_] + detalle)
+        return plan
+    except sqlite3.Error as e:
+        return [f"(sin plan: {e})"]
+
+def _registrar_lenta(sql: str, params, ms: float):
+    params = [p if p is None or isinstance(p, (int, float, str)) else str(p) for p in params] if isinstance(params, (list, tuple)) else None
+    reg = {"timestamp": datetime.now().isoformat(timespec="seconds"), "funcion": getattr(_en_curso, "funcion", None),
+           "ms": round(ms, 1), "sql": sql[:2000], "params": params, "plan": _plan(sql, params)}
+    _lentas.append(reg)
+    _log_lento.warning("%.0f ms en %s: %s %s | plan: %s", ms, reg["funcion"], " ".join(reg["sql"][:300].split()),
+                       params or "", " / ".join(p.strip() for p in reg["plan"]))
+
+@contextmanager
+def _sin_traza(cn, filas: int):
+    # executemany grandes: la traza llamaría a Python por cada fila y por cada sentencia de sus triggers
+    if not _con_traza():
+        yield; return
+    cn.set_trace_callback(None)
+    try:
+        yield
+    finally:
+        cn.set_trace_callback(_traza)
+        if SQL_TRAZA: _M_SENTENCIAS.inc(filas, funcion=getattr(_en_curso, "funcion", None) or "otra")
+
+def consultas_lentas(limit=50)->list:
+    """Últimas sentencias lentas de este proceso (la más reciente primero)."""
+    return list(_lentas)[::-1][:int(limit)]
+
+# ====== ROLLUPS (contadores diarios angostos, uno por gráfico del dashboard) ======
+# rollup -> (dimensiones además de fecha y agente: (columna, columna de Tickets), medidas: columna -> expresión
+# por ticket sobre la fila {r}). Todos llevan fecha y agente porque el dashboard filtra por ambos: el tamaño
+# queda acotado por días×agentes×valores de la dimensión, no por la cantidad de tickets
+_CERRADO = "COALESCE({r}.Estado,'') IN ('Resuelto','Cerrado')"
+_ROLLUPS = {
+    "Rollup_Agente": ((), {"tickets": "1", "abiertos": f"NOT {_CERRADO}",
+                           "suma_resolucion_hs": "COALESCE({r}.Tiempo_Resolución_hs,0)", "n_resolucion": "{r}.Tiempo_Resolución_hs IS NOT NULL",
+                           "suma_csat": "COALESCE({r}.Satisfacción,0)", "n_csat": "{r}.Satisfacción IS NOT NULL"}),
+    "Rollup_Modulo": ((("modulo", "Módulo_ERP"), ("sla", "SLA")), {"tickets": "1"}),
+    "Rollup_Empresa": ((("empresa", "Empresa"),), {"tickets": "1", "cerrados": _CERRADO,
+                       "suma_csat_cerrados": f"CASE WHEN {_CERRADO} THEN COALESCE({{r}}.Satisfacción,0) ELSE 0 END",
+                       "n_csat_cerrados": f"{_CERRADO} AND {{r}}.Satisfacción IS NOT NULL"}),
+    "Rollup_Prioridad": ((("prioridad", "Prioridad"),), {"tickets": "1"}),
+}
+
+def _rollup_clave(tabla: str, r: str)->dict:
+    # NULL en una dimensión se guarda como '' para que la PK (y el upsert) la trate como un valor más
+    return {"fecha": f"substr(COALESCE({r}.Fecha_Creación,''),1,10)", "agente": f"COALESCE({r}.Agente_Soporte,'')",
+            **{d: f"COALESCE({r}.{c},'')" for d, c in _ROLLUPS[tabla][0]}}
+
+def _rollup_ddl(tabla: str)->str:
+    clave, medidas = _rollup_clave(tabla, "r"), _ROLLUPS[tabla][1]
+    cols = [f"{c} TEXT" for c in clave] + [f"{m} {'REAL' if m.startswith('suma_') else 'INTEGER'} NOT NULL DEFAULT 0" for m in medidas]
+    return f"CREATE TABLE IF NOT EXISTS {tabla}({', '.join(cols)}, PRIMARY KEY({', '.join(clave)})) WITHOUT ROWID"
+
+def _rollup_suma(tabla: str, r: str, signo: str)->str:
+    clave, medidas = _rollup_clave(tabla, r), _ROLLUPS[tabla][1]
+    return f"""INSERT INTO {tabla}({", ".join([*clave, *medidas])})
+               VALUES ({", ".join(clave.values())}, {", ".join(f"{signo}({e.format(r=r)})" for e in medidas.values())})
+               ON CONFLICT({", ".join(clave)}) DO UPDATE SET {", ".join(f"{m}={m}+excluded.{m}" for m in medidas)};"""
+
+def _rollup_backfill(tabla: str)->str:
+    clave, medidas = _rollup_clave(tabla, "Tickets"), _ROLLUPS[tabla][1]
+    return f"""INSERT INTO {tabla}({", ".join([*clave, *medidas])})
+               SELECT {", ".join(clave.values())}, {", ".join(f"SUM({e.format(r='Tickets')})" for e in medidas.values())}
+               FROM Tickets GROUP BY {", ".join(map(str, range(1, len(clave)+1)))}"""
+
+def _rollup_triggers(tabla: str)->list:
+    # el de UPDATE solo corre si cambió alguna columna de Tickets que el rollup usa
+    nombre = tabla.split("_", 1)[1].lower()
+    usadas = dict.fromkeys(re.findall(r"\{r\}\.(\w+)", " ".join([*_rollup_clave(tabla, "{r}").values(), *_ROLLUPS[tabla][1].values()])))
+    return [f"CREATE TRIGGER IF NOT EXISTS trg_rollup_{nombre}_ins AFTER INSERT ON Tickets BEGIN {_rollup_suma(tabla, 'NEW', '+')} END",
+            f"CREATE TRIGGER IF NOT EXISTS trg_rollup_{nombre}_del AFTER DELETE ON Tickets BEGIN {_rollup_suma(tabla, 'OLD', '-')} END",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_rollup_{nombre}_upd AFTER UPDATE ON Tickets
+                WHEN {" OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in usadas)}
+                BEGIN {_rollup_suma(tabla, 'OLD', '-')} {_rollup_suma(tabla, 'NEW', '+')} END"""]
+
+# ====== BÚSQUEDA DE TEXTO (FTS5) ======
+_FTS_COLS = ("ID_Ticket","Empresa","Usuario_Reportante","Módulo_ERP","Categoría","Comentarios")
+_FTS_PESOS = (10.0, 5.0, 3.0, 2.0, 2.0, 1.0)  # bm25 por columna: un match en el código pesa más que en comentarios
+
+def _fts_fila(r: str, borrar=False)->str:
+    # con contenido externo, borrar = insertar el comando 'delete' con los valores viejos
+    cols = ", ".join(_FTS_COLS); vals = ", ".join(f"{r}.{c}" for c in _FTS_COLS)
+    if borrar: return f"INSERT INTO Tickets_fts(Tickets_fts, rowid, {cols}) VALUES ('delete', {r}.rowid, {vals});"
+    return f"INSERT INTO Tickets_fts(rowid, {cols}) VALUES ({r}.rowid, {vals});"
+
+# ====== FEED DE CAMBIOS: retención del change log ======
+CAMBIOS_RETENCION = 100_000  # filas de Cambios que se conservan; un cliente más atrasado recibe `recargar`
+CAMBIOS_PODA = 1000          # cada cuántas altas en Cambios se borra lo que excede la retención
+
+# ====== MIGRACIONES (versionadas con PRAGMA user_version) ======
+# Cada entrada es una versión: lista de sentencias SQL o callables(cn). Nunca editar una ya publicada; agregar al final.
+_MIGRACIONES = [
+    # v1: índices para los filtros de pantalla + orden/keyset por (Fecha_Creación, ID_Ticket)
+    [
+        "CREATE INDEX IF NOT EXISTS ix_tickets_fecha ON Tickets(Fecha_Creación, ID_Ticket)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_agente ON Tickets(Agente_Soporte, Fecha_Creación, ID_Ticket)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_estado ON Tickets(Estado, Fecha_Creación, ID_Ticket)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_empresa ON Tickets(Empresa, Fecha_Creación, ID_Ticket)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_modulo ON Tickets(Módulo_ERP, Fecha_Creación, ID_Ticket)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_prioridad ON Tickets(Prioridad, Fecha_Creación, ID_Ticket)",
+        "CREATE INDEX IF NOT EXISTS ix_auditoria_ticket ON Auditoria(ticket, timestamp, id)",
+    ],
+    # v2: seguimiento de cambios. rowversion es global y creciente (MAX+1 dentro del lock de escritura):
+    # sirve como high-water mark para refrescos incrementales
+    [
+        "ALTER TABLE Tickets ADD COLUMN updated_at TEXT",
+        "ALTER TABLE Tickets ADD COLUMN rowversion INTEGER NOT NULL DEFAULT 0",
+        "UPDATE Tickets SET rowversion=rowid, updated_at=Fecha_Creación",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_rowversion ON Tickets(rowversion)",
+    ],
+    # v3: rollups diarios angostos (uno por gráfico) mantenidos por triggers: cubren upsert, bulk y cualquier otra escritura
+    [paso for tabla in _ROLLUPS for paso in (_rollup_ddl(tabla), _rollup_backfill(tabla), *_rollup_triggers(tabla))],
+    # v4: secuencia de IDs de ticket (contador O(1)); arranca en el mayor TCK-nnnnn existente
+    [
+        "CREATE TABLE IF NOT EXISTS Secuencias(nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL) WITHOUT ROWID",
+        """INSERT OR IGNORE INTO Secuencias(nombre, valor)
+            SELECT 'tickets', COALESCE(MAX(CAST(substr(ID_Ticket, 5) AS INTEGER)), 0)
+            FROM Tickets WHERE ID_Ticket LIKE 'TCK-%'""",
+    ],
+    # v5: índices del visor de auditoría; todos terminan en (timestamp, id) para paginar por keyset
+    # (timestamp DESC, id DESC) también con rango de fechas, sin ordenar aparte
+    [
+        "CREATE INDEX IF NOT EXISTS ix_auditoria_usuario ON Auditoria(usuario, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_auditoria_campo ON Auditoria(campo, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_auditoria_timestamp ON Auditoria(timestamp, id)",
+    ],
+    # v6: búsqueda de texto (FTS5, contenido externo = Tickets) sincronizada por triggers
+    [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS Tickets_fts USING fts5({", ".join(_FTS_COLS)},
+            content='Tickets', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')""",
+        "INSERT INTO Tickets_fts(Tickets_fts) VALUES('rebuild')",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_fts_ins AFTER INSERT ON Tickets BEGIN {_fts_fila("NEW")} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_fts_del AFTER DELETE ON Tickets BEGIN {_fts_fila("OLD", borrar=True)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_fts_upd AFTER UPDATE ON Tickets
+            WHEN {" OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in _FTS_COLS)}
+            BEGIN {_fts_fila("OLD", borrar=True)} {_fts_fila("NEW")} END""",
+    ],
+    # v7: change log para el feed de cambios (/changes, SSE). op: I/U/D por ticket, R = recargar todo. Conserva las
+    # últimas CAMBIOS_RETENCION filas: cada CAMBIOS_PODA altas un trigger borra las anteriores por rango de PK
+    # (AUTOINCREMENT: los id nunca se reusan, así un cursor anterior a la primera fila indica un hueco)
+    [
+        """CREATE TABLE IF NOT EXISTS Cambios(
+            id INTEGER PRIMARY KEY AUTOINCREMENT, ticket TEXT NOT NULL, op TEXT NOT NULL, rowversion INTEGER)""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cambios_retencion AFTER INSERT ON Cambios WHEN NEW.id % {CAMBIOS_PODA} = 0
+            BEGIN DELETE FROM Cambios WHERE id <= NEW.id - {CAMBIOS_RETENCION}; END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_cambios_ins AFTER INSERT ON Tickets
+            BEGIN INSERT INTO Cambios(ticket, op, rowversion) VALUES (NEW.ID_Ticket, 'I', NEW.rowversion); END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_cambios_upd AFTER UPDATE ON Tickets
+            BEGIN INSERT INTO Cambios(ticket, op, rowversion) VALUES (NEW.ID_Ticket, 'U', NEW.rowversion); END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_cambios_del AFTER DELETE ON Tickets
+            BEGIN INSERT INTO Cambios(ticket, op, rowversion) VALUES (OLD.ID_Ticket, 'D', OLD.rowversion); END""",
+    ],
+]
+SCHEMA_VERSION = len(_MIGRACIONES)
+
+def _migrar(cn):
+    actual = cn.execute("PRAGMA user_version").fetchone()[0]
+    for version, pasos in enumerate(_MIGRACIONES[actual:], start=actual+1):
+        cn.execute("BEGIN IMMEDIATE")
+        try:
+            for paso in pasos:
+                paso(cn) if callable(paso) else cn.execute(paso)
+            cn.execute(f"PRAGMA user_version={version}")
+            cn.commit()
+        except Exception:
+            cn.rollback(); raise
+
+# ====== CARGA MASIVA (datos sintéticos de generar_datos) ======
+CARGA_MASIVA_MIN = 10_000  # desde acá conviene suspender triggers y reconstruir derivados al final
+
+def reconstruir_derivados(cn):
+    # rollups e índice FTS recalculados desde Tickets (tras cargar con los triggers suspendidos)
+    for tabla in _ROLLUPS: cn.execute(f"DELETE FROM {tabla}"); cn.execute(_rollup_backfill(tabla))
+    cn.execute("INSERT INTO Tickets_fts(Tickets_fts) VALUES('rebuild')")
+
+def poblar_tickets(cn, n: int, seed=None, dias=365, n_clientes=None, lote=100_000)->int:
+    """Alta de n tickets sintéticos dentro de la transacción abierta en `cn` (executemany por lotes).
+    Con n_clientes se completan clientes/reportantes hasta esa cantidad."""
+    import numpy as np, generar_datos as gen
+    rng = np.random.default_rng(seed); clientes = {}
+    for cli, rep in cn.execute("SELECT c.nombre, r.nombre FROM Clientes c LEFT JOIN Reportantes r ON r.cliente=c.nombre ORDER BY c.id, r.id"):
+        clientes.setdefault(cli, []).extend([rep] if rep else [])
+    for i in range(len(clientes)+1, (n_clientes or 0)+1):
+        cli = f"Cliente {i:03d}"; clientes[cli] = sorted(set(gen.nombres_reportantes(rng, int(rng.integers(1, 5)))))
+        cn.execute("INSERT OR IGNORE INTO Clientes(nombre) VALUES (?)", (cli,))
+        cn.executemany("INSERT OR IGNORE INTO Reportantes(cliente,nombre) VALUES (?,?)", [(cli, r) for r in clientes[cli]])
+    agentes = [r[0] for r in cn.execute("SELECT nombre_agente FROM Usuarios WHERE rol='Agente' ORDER BY usuario")] or ["Sin asignar"]
+    masivo = n >= max(CARGA_MASIVA_MIN, cn.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0] // 2)
+    # IDs reservados de una vez en la secuencia: las altas concurrentes (crear_ticket) siguen después
+    primero = cn.execute("UPDATE Secuencias SET valor=valor+? WHERE nombre='tickets' RETURNING valor", (n,)).fetchone()[0] - n + 1
+    version = cn.execute("SELECT COALESCE(MAX(rowversion),0)+1 FROM Tickets").fetchone()[0]
+    # carga masiva: sin triggers de derivados/change log ni índices secundarios; al final se reconstruyen de una
+    # (ordenando) y el log recibe una sola marca R: los clientes del feed recargan en lugar de recibir n filas
+    suspendidos = cn.execute("""SELECT type, name, sql FROM sqlite_master WHERE tbl_name='Tickets' AND sql IS NOT NULL
+                                AND (name LIKE 'trg_rollup_%' OR name LIKE 'trg_fts_%' OR name LIKE 'trg_cambios_%'
+                                     OR name LIKE 'ix_tickets_%')""").fetchall() if masivo else []
+    for tipo, nombre, _ in suspendidos: cn.execute(f"DROP {tipo.upper()} {nombre}")
+    sql = f"INSERT INTO Tickets({','.join(gen.COLUMNAS)}) VALUES ({','.join('?'*len(gen.COLUMNAS))})"
+    ahora = datetime.now()
+    with _sin_traza(cn, n):
+        for desde in range(0, n, lote):
+            cn.executemany(sql, gen.lote_tickets(rng, min(lote, n-desde), primero+desde, version+desde, clientes, agentes, ahora, dias))
+    if suspendidos:
+        reconstruir_derivados(cn)
+        for *_, ddl in suspendidos: cn.execute(ddl)
+        cn.execute("INSERT INTO Cambios(ticket, op) VALUES ('*', 'R')")
+    if n_clientes: _catalogos.invalidar()
+    return n
 
 def _init_db():
     with _conn() as cn:
@@ -46,76 +518,446 @@ def _init_db():
                 ("TextilNova","Valeria Ortiz"),("SolarTech","Diego Gómez")]
         for (cli, rep) in reps:
             c.execute("INSERT OR IGNORE INTO Reportantes(cliente,nombre) VALUES (?,?)", (cli, rep))
-        # tickets demo
-        tcount = c.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0]
-        if tcount == 0:
-            import random
-            mods = ["Ventas","Inventario","Facturación","Producción","Logística","Compras","Tesorería","Contabilidad"]
-            pris = ["Alta","Media","Baja"]
-            cats = ["Error crítico","Consulta funcional","Mejora","Reporte caído","Integración"]
-            estados = ["Abierto","Priorizado","En Progreso","En Espera","Resuelto","Cerrado"]
-            agentes = ["Sofía López","Carlos Pérez"]
-            for i in range(1, 61):
-                emp = random.choice(clis)
-                rep = c.execute("SELECT nombre FROM Reportantes WHERE cliente=? ORDER BY RANDOM() LIMIT 1",(emp,)).fetchone()[0]
-                ag = random.choice(agentes)
-                mod = random.choice(mods)
-                pri = random.choice(pris)
-                cat = random.choice(cats)
-                est = random.choice(estados)
-                sla = "Dentro de SLA"
-                ts = (datetime.now() - timedelta(days=random.randint(0, 30), hours=random.randint(0, 20))).isoformat()
-                trh = None if est not in ("Resuelto","Cerrado") else round(random.uniform(1, 24),1)
-                com = "Comentario demo"
-                csat = round(random.uniform(2.5, 5.0),1) if est in ("Resuelto","Cerrado") else None
-                tid = f"TCK-{i:05d}"
-                c.execute("""INSERT OR REPLACE INTO Tickets VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)""",
-                    (tid, emp, rep, ag, mod, pri, cat, est, sla, ts, trh, com, csat))
         cn.commit()
+        _migrar(cn)
+        vacia = cn.execute("SELECT COUNT(*) FROM Tickets").fetchone()[0] == 0
+    if vacia:  # tickets demo (después de migrar: usan la secuencia de IDs y rowversion)
+        with _tx() as cn: poblar_tickets(cn, 60, dias=30)
+
+# ====== CACHÉ DE CATÁLOGOS (usuarios, clientes, reportantes: cambian poco y se leen en cada rerun) ======
+CATALOGO_TTL = float(os.environ.get("ERP_CATALOGO_TTL", "60"))  # segundos; acota lo desactualizado entre procesos
+
+class _CacheTTL:
+    # Por proceso. Las altas de este proceso invalidan al instante; las de otro proceso se ven al vencer el TTL
+    def __init__(self, ttl: float):
+        self.ttl = ttl; self._datos = {}; self._lock = threading.Lock()
+
+    def obtener(self, clave, cargar):
+        ahora = time.monotonic()
+        with self._lock:
+            hit = self._datos.get(clave)
+        if hit and hit[0] > ahora: return hit[1]
+        valor = cargar()
+        with self._lock: self._datos[clave] = (ahora + self.ttl, valor)
+        return valor
+
+    def invalidar(self, *claves):
+        with self._lock:
+            for c in (claves or list(self._datos)): self._datos.pop(c, None)
+
+_catalogos = _CacheTTL(CATALOGO_TTL)
 
 _init_db()
 
-def load_usuarios_df():
+def _leer_usuarios():
     with _conn() as cn:
         return pd.read_sql("SELECT * FROM Usuarios", cn)
 
-def load_tickets_df():
+def load_usuarios_df():
+    return _catalogos.obtener("usuarios", _leer_usuarios).copy()  # copia: quien llama puede modificarla
+
+# ====== FILTROS / PAGINACIÓN (empujados a SQL parametrizado) ======
+FILTROS_TICKETS = {"empresa":"Empresa", "modulo":"Módulo_ERP", "estado":"Estado", "prioridad":"Prioridad", "agente":"Agente_Soporte"}
+
+def _dia(v)->str:
+    return pd.Timestamp(v).date().isoformat()
+
+def _where_tickets(empresa=None, modulo=None, estado=None, prioridad=None, agente=None,
+                   desde=None, hasta=None, id_prefijo=None, cambios_desde=None, id_contiene=None):
+    conds, params = [], []
+    if cambios_desde is not None: conds.append("rowversion>?"); params.append(int(cambios_desde))
+    for k, v in (("empresa",empresa),("modulo",modulo),("estado",estado),("prioridad",prioridad),("agente",agente)):
+        if v: conds.append(f"{FILTROS_TICKETS[k]}=?"); params.append(v)
+    if desde: conds.append("Fecha_Creación>=?"); params.append(_dia(desde))
+    if hasta: conds.append("Fecha_Creación<?"); params.append(_dia(pd.Timestamp(hasta)+pd.Timedelta(days=1)))
+    if id_prefijo:
+        # rango sobre la PK en lugar de LIKE para que use el índice
+        pref = id_prefijo.strip().upper(); conds.append("ID_Ticket>=? AND ID_Ticket<?"); params += [pref, pref+"\uffff"]
+    if id_contiene:
+        # el filtro "Código" de la app: parte del ID sin distinguir mayúsculas ("123" encuentra TCK-00123)
+        conds.append("ID_Ticket LIKE ? ESCAPE '\\'")
+        params.append("%" + re.sub(r"([\\%_])", r"\\\1", id_contiene) + "%")
+    return (" WHERE " + " AND ".join(conds)) if conds else "", params
+
+_NULO = "\\N"  # NULL dentro de un cursor keyset (la convención de COPY)
+
+def _cursor_keyset(fila, col: str, clave: str)->str:
+    v = fila[col]
+    return f"{_NULO if pd.isna(v) else v}|{fila[clave]}"
+
+def _leer_keyset(cn, select: str, where: str, params: list, col: str, clave: str, orden: str, cursor=None, limit=None,
+                 tipo_clave=str)->pd.DataFrame:
+    """`select` + `where` paginado por keyset sobre (col, clave) en el orden de SQLite: los NULL de col van
+    primero en ASC y últimos en DESC. La comparación (col, clave) < (?,?) no los alcanza, así que se leen con su
+    propia consulta (col IS NULL, por clave): cada tramo recorre el índice (col, clave) y corta en LIMIT sin
+    ordenar aparte. El cursor de la página siguiente queda en df.attrs["cursor"] (None si no hay más)."""
+    op, por_valor, por_nulo = "<" if orden=="DESC" else ">", f"{col} {orden}, {clave} {orden}", f"{clave} {orden}"
+    tramos = [(None, [], por_valor)]
+    if cursor:
+        valor, _, ultimo = cursor.partition("|"); ultimo = tipo_clave(ultimo)
+        if valor==_NULO:
+            tramos = [(f"{col} IS NULL AND {clave}{op}?", [ultimo], por_nulo)] + ([(f"{col} IS NOT NULL", [], por_valor)] if orden=="ASC" else [])
+        else:
+            tramos = [(f"({col}, {clave}){op}(?,?)", [valor, ultimo], por_valor)] + ([(f"{col} IS NULL", [], por_nulo)] if orden=="DESC" else [])
+    partes = []
+    for cond, extra, por in tramos:
+        falta = int(limit) - sum(map(len, partes)) if limit else None
+        if falta==0: break
+        w = where if cond is None else f"{where} AND {cond}" if where else f" WHERE {cond}"
+        partes.append(pd.read_sql(f"{select}{w} ORDER BY {por}" + (" LIMIT ?" if falta else ""), cn,
+                                  params=[*params, *extra, *([falta] if falta else [])]))
+    df = pd.concat([p for p in partes if len(p)] or partes[:1], ignore_index=True) if len(partes) > 1 else partes[0]
+    df.attrs["cursor"] = _cursor_keyset(df.iloc[-1], col, clave) if limit and len(df)==int(limit) else None
+    return df
+
+def _parse_fechas(df: pd.DataFrame, col="Fecha_Creación")->pd.DataFrame:
+    if col in df.columns: df[col] = pd.to_datetime(df[col], format="ISO8601", errors="coerce")
+    return df
+
+def load_tickets_df(empresa=None, modulo=None, estado=None, prioridad=None, agente=None,
+                    desde=None, hasta=None, id_prefijo=None, cambios_desde=None, orden="desc", cursor=None, limit=None,
+                    id_contiene=None):
+    """Tickets filtrados en SQL. Con `limit` pagina por keyset sobre (Fecha_Creación, ID_Ticket), con los
+    tickets sin fecha al final en DESC (al principio en ASC): el cursor de la página siguiente queda en
+    df.attrs["cursor"] (None si no hay más). `cambios_desde` devuelve solo las filas con rowversion mayor
+    (refresco incremental)."""
+    where, params = _where_tickets(empresa, modulo, estado, prioridad, agente, desde, hasta, id_prefijo, cambios_desde, id_contiene)
+    orden = "ASC" if str(orden).lower()=="asc" else "DESC"
+    with _conn() as cn:
+        df = _leer_keyset(cn, "SELECT * FROM Tickets", where, params, "Fecha_Creación", "ID_Ticket", orden, cursor, limit)
+    return _parse_fechas(df)
+
+# ====== FEED DE CAMBIOS (change log Cambios, mantenido por triggers) ======
+def ultimo_cambio()->int:
     with _conn() as cn:
-        df = pd.read_sql("SELECT * FROM Tickets", cn, parse_dates=["Fecha_Creación"])
+        return cn.execute("SELECT COALESCE(MAX(id),0) FROM Cambios").fetchone()[0]
+
+def cambios_desde(since=None, limit=1000)->dict:
+    """Delta del change log posterior a `since` (id del log): filas actuales de los tickets tocados,
+    IDs borrados y `hasta` (cursor para la próxima llamada; `mas` si quedó log sin leer). Sin `since`
+    solo devuelve el cursor actual. `recargar` = el cliente debe releer todo (carga masiva, base nueva o
+    cursor anterior a lo que conserva el log)."""
+    with _conn() as cn:
+        primero, ultimo = cn.execute("SELECT COALESCE(MIN(id),0), COALESCE(MAX(id),0) FROM Cambios").fetchone()
+        delta = {"hasta": ultimo, "mas": False, "recargar": False, "borrados": [], "tickets": pd.DataFrame()}
+        if since is None: return delta
+        if int(since) > ultimo or int(since) < primero-1: return {**delta, "recargar": True}
+        log = cn.execute("SELECT id, ticket, op FROM Cambios WHERE id>? ORDER BY id LIMIT ?", (int(since), int(limit))).fetchall()
+        if not log: return {**delta, "hasta": int(since)}
+        if any(op=="R" for _, _, op in log): return {**delta, "recargar": True}
+        ultima_op = {tid: op for _, tid, op in log}  # por ticket vale la última operación
+        vivos = [t for t, op in ultima_op.items() if op!="D"]
+        partes = [pd.read_sql(f"SELECT * FROM Tickets WHERE ID_Ticket IN ({','.join('?'*len(lote))})", cn, params=lote)
+                  for lote in (vivos[i:i+LOTE_IN] for i in range(0, len(vivos), LOTE_IN))]
+    tickets = _parse_fechas(pd.concat(partes, ignore_index=True)) if partes else pd.DataFrame()
+    return {**delta, "hasta": log[-1][0], "mas": log[-1][0] < ultimo, "tickets": tickets,
+            "borrados": [t for t, op in ultima_op.items() if op=="D"]}
+
+def _consultar_lista(sql: str, params=()):
+    with _conn() as cn:
+        return [r[0] for r in cn.execute(sql, params).fetchall()]
+
+def _consulta_fts(q: str)->str:
+    # cada palabra del usuario como frase con prefijo ("tck-0001"* , "factur"*): sin sintaxis FTS5 expuesta
+    return " ".join('"' + t.replace('"', '""') + '"*' for t in str(q).split())
+
+def buscar_tickets(q: str, cursor=None, limit=50, **filtros)->pd.DataFrame:
+    """Búsqueda de texto en código, cliente, reportante, módulo, categoría y comentarios, ordenada por
+    relevancia (bm25) y combinable con los filtros de load_tickets_df. El cursor es el offset de la
+    página siguiente (df.attrs["cursor"], None si no hay más)."""
+    consulta = _consulta_fts(q)
+    if not consulta: return _parse_fechas(pd.DataFrame(columns=list(EXPORT_COLS)))
+    where, params = _where_tickets(**filtros); offset = int(cursor or 0)
+    sql = f"""SELECT Tickets.*, f.relevancia FROM
+                (SELECT rowid, bm25(Tickets_fts, {", ".join(map(str, _FTS_PESOS))}) AS relevancia
+                 FROM Tickets_fts WHERE Tickets_fts MATCH ?) f
+              JOIN Tickets ON Tickets.rowid=f.rowid{where}
+              ORDER BY f.relevancia, Tickets.Fecha_Creación DESC LIMIT ? OFFSET ?"""
+    with _conn() as cn:
+        df = pd.read_sql(sql, cn, params=[consulta, *params, int(limit), offset])
+    df = _parse_fechas(df); df.attrs["cursor"] = str(offset + len(df)) if len(df)==int(limit) else None
     return df
 
-def list_clientes():
+def contar_tickets(por="estado", **filtros)->dict:
+    """Tickets por valor de una dimensión (estado, agente, ...) con los mismos filtros que load_tickets_df."""
+    col = FILTROS_TICKETS[por]; where, params = _where_tickets(**filtros)
     with _conn() as cn:
-        return [r[0] for r in cn.execute("SELECT nombre FROM Clientes ORDER BY nombre").fetchall()]
+        return dict(cn.execute(f"SELECT {col}, COUNT(*) FROM Tickets{where} GROUP BY {col}", params).fetchall())
+
+def list_clientes():
+    return list(_catalogos.obtener("clientes", lambda: _consultar_lista("SELECT nombre FROM Clientes ORDER BY nombre")))
 
 def list_reportantes(cliente: str):
-    with _conn() as cn:
-        return [r[0] for r in cn.execute("SELECT nombre FROM Reportantes WHERE cliente=? ORDER BY nombre",(cliente,)).fetchall()]
+    return list(_catalogos.obtener(("reportantes", cliente), lambda: _consultar_lista(
+        "SELECT nombre FROM Reportantes WHERE cliente=? ORDER BY nombre", (cliente,))))
 
 def add_cliente_si_no_existe(nombre: str):
     with _conn() as cn:
         cn.execute("INSERT OR IGNORE INTO Clientes(nombre) VALUES (?)",(nombre,)); cn.commit()
+    _catalogos.invalidar("clientes")
 
 def add_reportante_si_no_existe(cliente: str, nombre: str):
     with _conn() as cn:
         cn.execute("INSERT OR IGNORE INTO Reportantes(cliente,nombre) VALUES (?,?)",(cliente,nombre)); cn.commit()
+    _catalogos.invalidar(("reportantes", cliente))
 
-def upsert_ticket(rec: dict):
-    vals = [rec.get(k) for k in ["ID_Ticket","Empresa","Usuario_Reportante","Agente_Soporte","Módulo_ERP",
-                                 "Prioridad","Categoría","Estado","SLA","Fecha_Creación",
-                                 "Tiempo_Resolución_hs","Comentarios","Satisfacción"]]
+# ====== EXPORTACIÓN EN STREAMING (memoria constante: cursor + fetchmany) ======
+EXPORT_COLS = ["ID_Ticket","Empresa","Usuario_Reportante","Agente_Soporte","Módulo_ERP","Prioridad","Categoría",
+               "Estado","SLA","Fecha_Creación","Tiempo_Resolución_hs","Satisfacción","Comentarios"]
+EXPORT_FORMATOS = {"csv": "text/csv; charset=utf-8", "arrow": "application/vnd.apache.arrow.stream",
+                   "parquet": "application/vnd.apache.parquet"}
+
+def iter_tickets(chunk=5000, orden="desc", **filtros):
+    """Lotes de tuplas (en el orden de EXPORT_COLS) leídos con un cursor del servidor. Usa una conexión
+    propia de solo lectura, fuera del pool: una descarga lenta la retiene hasta agotar (o cerrar) el
+    generador, y varias a la vez no deben dejar sin conexiones a las lecturas ni al escritor."""
+    where, params = _where_tickets(**filtros)
+    orden = "ASC" if str(orden).lower()=="asc" else "DESC"
+    sql = f"SELECT {', '.join(EXPORT_COLS)} FROM Tickets{where} ORDER BY Fecha_Creación {orden}, ID_Ticket {orden}"
+    with closing(_abrir(DB_PATH)) as cn:
+        cn.execute("PRAGMA query_only=ON"); cn.execute("PRAGMA cache_size=-2048")  # recorrido de una pasada: no hace falta caché grande
+        cur = cn.execute(sql, params)
+        try:
+            while True:
+                filas = cur.fetchmany(chunk)
+                if not filas: break
+                yield filas
+        finally:
+            cur.close()  # también si se cierra el generador a mitad (cliente que corta la descarga)
+
+def _arrow_schema(columnas=EXPORT_COLS):
+    import pyarrow as pa
+    tipos = {"Fecha_Creación": pa.timestamp("us"), "Tiempo_Resolución_hs": pa.float64(), "Satisfacción": pa.float64(),
+             "rowversion": pa.int64(), "id": pa.int64(), "relevancia": pa.float64()}
+    return pa.schema([(c, tipos.get(c, pa.string())) for c in columnas])
+
+def tabla_arrow(df: pd.DataFrame, schema=None):
+    # DataFrame -> pyarrow.Table con timestamps/floats tipados (pyarrow es opcional: solo se importa acá)
+    import pyarrow as pa
+    schema = schema or _arrow_schema(list(df.columns))
+    df = df.reindex(columns=schema.names)
+    df = _parse_fechas(df)
+    for c in ("Tiempo_Resolución_hs","Satisfacción"):
+        if c in df.columns: df[c] = pd.to_numeric(df[c], errors="coerce")
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def iter_tickets_export(formato="csv", chunk=5000, **filtros):
+    """Bytes del export listos para enviar o escribir: CSV UTF-8 con BOM (como el export de la app),
+    Arrow IPC stream o Parquet (un row group por lote)."""
+    with closing(iter_tickets(chunk=chunk, **filtros)) as lotes:
+        yield from _export_bytes(formato, lotes)
+
+def _export_bytes(formato: str, lotes):
+    if formato=="csv":
+        buf = io.StringIO(); w = csv.writer(buf, lineterminator="\n")
+        buf.write("\ufeff"); w.writerow(EXPORT_COLS)
+        for filas in lotes:
+            w.writerows(filas); yield buf.getvalue().encode("utf-8"); buf.seek(0); buf.truncate()
+        if buf.tell(): yield buf.getvalue().encode("utf-8")
+        return
+    import pyarrow as pa, pyarrow.parquet as pq
+    schema = _arrow_schema(); sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema) if formato=="arrow" else pq.ParquetWriter(sink, schema, compression="zstd")
+    def _drenar():
+        datos = sink.getvalue(); sink.seek(0); sink.truncate(); return datos
+    for filas in lotes:
+        writer.write_table(tabla_arrow(pd.DataFrame.from_records(filas, columns=EXPORT_COLS), schema))
+        yield _drenar()
+    writer.close()
+    yield _drenar()
+
+def export_tickets(destino: str, formato="csv", **filtros)->str:
+    with open(destino, "wb") as fh:
+        for parte in iter_tickets_export(formato, **filtros): fh.write(parte)
+    return destino
+
+# Consultas del dashboard: nombre -> (rollup, columnas SELECT, GROUP BY, conteo que debe quedar > 0)
+_STATS = {
+    "por_agente":    ("Rollup_Agente", "agente AS Agente_Soporte, SUM(tickets) AS Tickets", "agente", "tickets"),
+    "por_modulo":    ("Rollup_Modulo", "COALESCE(NULLIF(modulo,''),'Desconocido') AS Módulo_ERP, SUM(tickets) AS Cantidad", "1", "tickets"),
+    "por_empresa":   ("Rollup_Empresa", "COALESCE(NULLIF(empresa,''),'Desconocido') AS Empresa, SUM(tickets) AS Cantidad", "1", "tickets"),
+    "por_prioridad": ("Rollup_Prioridad", "COALESCE(NULLIF(prioridad,''),'Desconocido') AS Prioridad, SUM(tickets) AS Cantidad", "1", "tickets"),
+    "sla_modulo":    ("Rollup_Modulo", "modulo AS Módulo_ERP, sla AS SLA, SUM(tickets) AS Cantidad", "modulo, sla", "tickets"),
+    "por_dia":       ("Rollup_Agente", "fecha AS Fecha, SUM(tickets) AS Tickets", "fecha", "tickets"),
+    "csat_empresa":  ("Rollup_Empresa", "empresa AS Empresa, SUM(suma_csat_cerrados)/SUM(n_csat_cerrados) AS CSAT", "empresa", "cerrados"),
+    "backlog_dia":   ("Rollup_Agente", "fecha AS Fecha, SUM(abiertos) AS Tickets", "fecha", "abiertos"),
+    "totales":       ("Rollup_Agente", "SUM(tickets) AS Tickets, SUM(suma_resolucion_hs)/NULLIF(SUM(n_resolucion),0) AS Resolucion_hs, "
+                      "SUM(suma_csat)/NULLIF(SUM(n_csat),0) AS CSAT", None, None),
+}
+
+def load_stats(desde=None, hasta=None, agente=None)->dict:
+    """Agregados del dashboard leídos de los rollups por gráfico (tamaño acotado por días×agentes×valores
+    de la dimensión, no por tickets)."""
+    conds, params = [], []
+    if desde: conds.append("fecha>=?"); params.append(_dia(desde))
+    if hasta: conds.append("fecha<=?"); params.append(_dia(hasta))
+    if agente: conds.append("agente=?"); params.append(agente)
+    where = (" WHERE " + " AND ".join(conds)) if conds else ""
+    res = {}
+    with _conn() as cn:
+        for nombre, (tabla, cols, grupo, conteo) in _STATS.items():
+            sql = f"SELECT {cols} FROM {tabla}{where}"
+            if grupo: sql += f" GROUP BY {grupo} HAVING SUM({conteo})>0"
+            res[nombre] = pd.read_sql(sql, cn, params=params)
+    return res
+
+# Próximo rowversion; evaluado dentro de la sentencia de escritura, ya con el lock tomado
+_NUEVA_VERSION = "(SELECT COALESCE(MAX(rowversion),0)+1 FROM Tickets)"
+
+_UPSERT_COLS = ("ID_Ticket","Empresa","Usuario_Reportante","Agente_Soporte","Módulo_ERP","Prioridad","Categoría",
+                "Estado","SLA","Fecha_Creación","Tiempo_Resolución_hs","Comentarios","Satisfacción")
+_UPSERT_SQL = f"""INSERT INTO Tickets({",".join(_UPSERT_COLS)},updated_at,rowversion)
+                  VALUES ({",".join("?"*len(_UPSERT_COLS))},?,COALESCE(?,{_NUEVA_VERSION}))
+                  ON CONFLICT(ID_Ticket) DO UPDATE SET
+                    Empresa=excluded.Empresa, Usuario_Reportante=excluded.Usuario_Reportante, Agente_Soporte=excluded.Agente_Soporte,
+                    Módulo_ERP=excluded.Módulo_ERP, Prioridad=excluded.Prioridad, Categoría=excluded.Categoría, Estado=excluded.Estado,
+                    SLA=excluded.SLA, Fecha_Creación=excluded.Fecha_Creación, Tiempo_Resolución_hs=excluded.Tiempo_Resolución_hs,
+                    Comentarios=excluded.Comentarios, Satisfacción=excluded.Satisfacción,
+                    updated_at=excluded.updated_at, rowversion=excluded.rowversion"""
+
+def _fila_upsert(rec: dict, ahora: str, version=None)->tuple:
+    # version None: MAX(rowversion)+1 en la misma sentencia; en lotes se reserva una vez por transacción
+    vals = [rec.get(k) for k in _UPSERT_COLS]
     if hasattr(vals[9], "isoformat"):
         vals[9] = vals[9].isoformat()
+    return (*vals, ahora, version)
+
+def _upsert_ticket(cn, rec: dict):
+    cn.execute(_UPSERT_SQL, _fila_upsert(rec, datetime.now().isoformat()))
+
+def upsert_ticket(rec: dict):
     with _conn() as cn:
-        cn.execute("""INSERT INTO Tickets(ID_Ticket,Empresa,Usuario_Reportante,Agente_Soporte,Módulo_ERP,Prioridad,Categoría,Estado,SLA,Fecha_Creación,Tiempo_Resolución_hs,Comentarios,Satisfacción)
-                      VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
-                      ON CONFLICT(ID_Ticket) DO UPDATE SET
-                        Empresa=excluded.Empresa, Usuario_Reportante=excluded.Usuario_Reportante, Agente_Soporte=excluded.Agente_Soporte,
-                        Módulo_ERP=excluded.Módulo_ERP, Prioridad=excluded.Prioridad, Categoría=excluded.Categoría, Estado=excluded.Estado,
-                        SLA=excluded.SLA, Fecha_Creación=excluded.Fecha_Creación, Tiempo_Resolución_hs=excluded.Tiempo_Resolución_hs,
-                        Comentarios=excluded.Comentarios, Satisfacción=excluded.Satisfacción
-                   """, vals)
-        cn.commit()
+        _upsert_ticket(cn, rec); cn.commit()
+
+INGESTA_LOTE = 5000  # filas por transacción en upsert_tickets
+
+class IngestaInterrumpida(Exception):
+    """Falló un lote de upsert_tickets y se deshizo entero: los `procesados` registros anteriores ya quedaron
+    confirmados (salvo los de `errores`)."""
+    def __init__(self, procesados: int, errores: list, causa: Exception):
+        super().__init__(f"lote desde el registro {procesados} no guardado: {causa}")
+        self.procesados, self.errores = procesados, errores
+
+def upsert_tickets(registros: list, lote=INGESTA_LOTE)->list:
+    """Upsert de muchos tickets: executemany y una transacción por lote. Devuelve [(índice, error)] de los
+    registros sin ID_Ticket (lo único que la tabla rechaza; el resto se guarda). Si un lote falla (base
+    bloqueada, disco lleno...) levanta IngestaInterrumpida con lo que ya quedó confirmado."""
+    errores, ahora = [], datetime.now().isoformat()
+    for desde in range(0, len(registros), lote):
+        parte = list(enumerate(registros[desde:desde+lote], desde))
+        errores += [(i, "ID_Ticket vacío") for i, r in parte if not r.get("ID_Ticket")]
+        filas = [r for _, r in parte if r.get("ID_Ticket")]
+        try:
+            with _tx() as cn, _sin_traza(cn, len(filas)):
+                version = cn.execute(f"SELECT {_NUEVA_VERSION}").fetchone()[0]
+                cn.executemany(_UPSERT_SQL, [_fila_upsert(r, ahora, version+i) for i, r in enumerate(filas)])
+        except sqlite3.Error as e:
+            raise IngestaInterrumpida(desde, [x for x in errores if x[0] < desde], e) from e
+    return errores
+
+# ====== TICKET INDIVIDUAL (lectura por PK y PATCH con concurrencia optimista) ======
+TICKET_CAMPOS = ("Empresa","Usuario_Reportante","Agente_Soporte","Módulo_ERP","Prioridad","Categoría",
+                 "Estado","SLA","Fecha_Creación","Tiempo_Resolución_hs","Comentarios","Satisfacción")
+
+class ConflictoVersion(Exception):
+    """El ticket cambió (otro rowversion) desde que se leyó; `actual` es la fila vigente."""
+    def __init__(self, actual: dict):
+        super().__init__(f"{actual['ID_Ticket']} cambió: rowversion actual {actual['rowversion']}")
+        self.actual = actual
+
+def get_ticket(ticket_id: str)->dict | None:
+    with _conn() as cn:
+        cn.row_factory = sqlite3.Row
+        r = cn.execute("SELECT * FROM Tickets WHERE ID_Ticket=?", (ticket_id,)).fetchone()
+    return dict(r) if r else None
+
+def patch_ticket(ticket_id: str, cambios: dict, rowversion=None, usuario="api", rol="", motivo="Edición")->dict | None:
+    """UPDATE por PK solo de las columnas que cambian + su auditoría, en una transacción. Con `rowversion`
+    (el leído al empezar a editar) levanta ConflictoVersion si otro lo modificó entre tanto.
+    Devuelve la fila resultante (None si el ticket no existe)."""
+    desconocidos = set(cambios) - set(TICKET_CAMPOS)
+    if desconocidos: raise ValueError(f"Campos no editables: {sorted(desconocidos)}")
+    cambios = {c: v.isoformat() if hasattr(v, "isoformat") else v for c, v in cambios.items()}
+    with _tx() as cn:
+        cn.row_factory = sqlite3.Row
+        actual = cn.execute("SELECT * FROM Tickets WHERE ID_Ticket=?", (ticket_id,)).fetchone()
+        if actual is None: return None
+        if rowversion is not None and actual["rowversion"]!=int(rowversion): raise ConflictoVersion(dict(actual))
+        cambios = {c: v for c, v in cambios.items() if actual[c]!=v}
+        if not cambios: return dict(actual)
+        ahora = datetime.now().isoformat()
+        fila = cn.execute(f"""UPDATE Tickets SET {", ".join(f"{c}=?" for c in cambios)}, updated_at=?, rowversion={_NUEVA_VERSION}
+                              WHERE ID_Ticket=? RETURNING *""", [*cambios.values(), ahora, ticket_id]).fetchone()
+        cn.executemany("""INSERT INTO Auditoria(timestamp, usuario, rol, ticket, campo, antes, despues, motivo)
+                          VALUES (?,?,?,?,?,?,?,?)""",
+                       [(ahora, usuario, rol, ticket_id, c, str(actual[c]), str(v), motivo) for c, v in cambios.items()])
+    return dict(fila)
+
+TICKET_PREFIJO = "TCK-"
+ALTA_REINTENTOS = 100  # IDs de la secuencia ya ocupados que crear_ticket saltea antes de rendirse
+
+def _siguiente_id(cn)->str:
+    # dentro de una transacción de escritura: el UPDATE serializa a los creadores concurrentes
+    n = cn.execute("UPDATE Secuencias SET valor=valor+1 WHERE nombre='tickets' RETURNING valor").fetchone()[0]
+    return f"{TICKET_PREFIJO}{n:05d}"
+
+def crear_ticket(rec: dict, usuario="", rol="")->str:
+    """Alta atómica: reserva el próximo ID de la secuencia, inserta el ticket y su auditoría de
+    creación en una sola transacción. Nunca pisa un ticket existente. Devuelve el ID asignado."""
+    rec = {**rec, "Estado": rec.get("Estado") or "Abierto", "Fecha_Creación": rec.get("Fecha_Creación") or datetime.now()}
+    if hasattr(rec["Fecha_Creación"], "isoformat"):
+        rec["Fecha_Creación"] = rec["Fecha_Creación"].isoformat()
+    cols = [c for c in EXPORT_COLS if c!="ID_Ticket"]
+    ahora = datetime.now().isoformat()
+    with _tx() as cn:
+        for intento in range(ALTA_REINTENTOS):
+            tid = _siguiente_id(cn)
+            try:
+                cn.execute(f"""INSERT INTO Tickets(ID_Ticket,{",".join(cols)},updated_at,rowversion)
+                               VALUES (?,{",".join("?"*len(cols))},?,{_NUEVA_VERSION})""",
+                           [tid, *(rec.get(c) for c in cols), ahora])
+                break
+            except sqlite3.IntegrityError as e:
+                # solo se saltea un ID ya usado por un alta con ID explícito (upsert/importación); otra
+                # restricción (NOT NULL, CHECK, trigger) fallaría igual con cualquier ID
+                if "Tickets.ID_Ticket" not in str(e) or intento==ALTA_REINTENTOS-1: raise
+        cn.execute("""INSERT INTO Auditoria(timestamp, usuario, rol, ticket, campo, antes, despues, motivo)
+                      VALUES (?,?,?,?,'CREACION','-','-','Alta de ticket')""", (ahora, usuario, rol, tid))
+    return tid
+
+LOTE_IN = 500  # ids por sentencia IN (...), por debajo del límite de parámetros de SQLite
+
+def bulk_update_tickets(ids, set_estado=None, set_prioridad=None, set_agente=None,
+                        usuario="api", rol="", motivo="Acción masiva")->int:
+    """Aplica Estado/Prioridad/Agente a muchos tickets con UPDATE ... IN (...) y registra la
+    auditoría de cada campo modificado, todo en una sola transacción. Devuelve los tickets encontrados."""
+    cambios = {c: v for c, v in (("Estado",set_estado),("Prioridad",set_prioridad),("Agente_Soporte",set_agente)) if v}
+    ids = list(dict.fromkeys(str(i) for i in ids))
+    if not cambios or not ids: return 0
+    ahora = datetime.now().isoformat(); actualizados = 0; auditoria = []
+    sets = ", ".join(f"{c}=?" for c in cambios) + f", updated_at=?, rowversion={_NUEVA_VERSION}"
+    with _tx() as cn:
+        for i in range(0, len(ids), LOTE_IN):
+            lote = ids[i:i+LOTE_IN]; marcas = ",".join("?"*len(lote))
+            for tid, *antes in cn.execute(f"SELECT ID_Ticket, {', '.join(cambios)} FROM Tickets WHERE ID_Ticket IN ({marcas})", lote):
+                auditoria += [(ahora, usuario, rol, tid, campo, str(a), str(cambios[campo]), motivo)
+                              for campo, a in zip(cambios, antes) if a!=cambios[campo]]
+            actualizados += cn.execute(f"UPDATE Tickets SET {sets} WHERE ID_Ticket IN ({marcas})", [*cambios.values(), ahora, *lote]).rowcount
+        cn.executemany("""INSERT INTO Auditoria(timestamp, usuario, rol, ticket, campo, antes, despues, motivo)
+                          VALUES (?,?,?,?,?,?,?,?)""", auditoria)
+    return actualizados
+
+def registrar_auditoria_batch(registros, ticket: dict | None = None)->int:
+    """Inserta varios registros de auditoría (dicts con usuario, rol, ticket, campo, antes, despues,
+    motivo) y, si se pasa `ticket`, también su upsert: todo en una sola transacción."""
+    ahora = datetime.now().isoformat()
+    filas = [(ahora, r["usuario"], r["rol"], r["ticket"], str(r["campo"]), str(r["antes"]), str(r["despues"]), str(r["motivo"]))
+             for r in registros]
+    with _tx() as cn:
+        if ticket is not None: _upsert_ticket(cn, ticket)
+        cn.executemany("""INSERT INTO Auditoria(timestamp, usuario, rol, ticket, campo, antes, despues, motivo)
+                          VALUES (?,?,?,?,?,?,?,?)""", filas)
+    return len(filas)
 
 def registrar_auditoria(usuario, rol, ticket, campo, antes, despues, motivo):
     with _conn() as cn:
@@ -124,8 +966,37 @@ def registrar_auditoria(usuario, rol, ticket, campo, antes, despues, motivo):
                    (datetime.now().isoformat(), usuario, rol, ticket, str(campo), str(antes), str(despues), str(motivo)))
         cn.commit()
 
+AUDITORIA_COLS = ["id","timestamp","usuario","rol","ticket","campo","antes","despues","motivo"]
+
+def load_auditoria(ticket=None, usuario=None, campo=None, desde=None, hasta=None, cursor=None, limit=100)->pd.DataFrame:
+    """Auditoría más reciente primero, paginada por keyset sobre (timestamp, id): el cursor de la página
+    siguiente queda en df.attrs["cursor"] (None si no hay más)."""
+    conds, params = [], []
+    for col, v in (("ticket", ticket), ("usuario", usuario), ("campo", campo)):
+        if v: conds.append(f"{col}=?"); params.append(v)
+    if desde: conds.append("timestamp>=?"); params.append(_dia(desde))
+    if hasta: conds.append("timestamp<?"); params.append(_dia(pd.Timestamp(hasta)+pd.Timedelta(days=1)))
+    where = (" WHERE " + " AND ".join(conds)) if conds else ""
+    with _conn() as cn:
+        return _leer_keyset(cn, f"SELECT {', '.join(AUDITORIA_COLS)} FROM Auditoria", where, params,
+                            "timestamp", "id", "DESC", cursor, limit, tipo_clave=int)
+
+
+class _ConexionPrestada:
+    # Envoltorio de get_connection(): close() devuelve la conexión al pool en lugar de cerrarla
+    def __init__(self, pool, cn): self._pool, self._cn = pool, cn
+    def __getattr__(self, name): return getattr(self._cn, name)
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value) if name.startswith("_") else setattr(self._cn, name, value)
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+    def close(self):
+        if self._cn is not None: self._pool.release(self._cn); self._cn = None
 
 def get_connection():
-    cn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    pool = _get_pool(); cn = pool.acquire()
     cn.row_factory = sqlite3.Row
-    return cn
+    return _ConexionPrestada(pool, cn)
+
+if _INSTRUMENTAR:
+    for _nombre in _INSTRUMENTADAS: globals()[_nombre] = _instrumentada(_nombre, globals()[_nombre])
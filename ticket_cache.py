@@ -0,0 +1,114 @@
+import threading, time
+import pandas as pd
+
+class TicketCache:
+    """Frame de tickets compartido por proceso que se refresca por deltas.
+
+    La primera llamada carga la tabla completa; las siguientes solo traen las filas con
+    rowversion > high-water mark (`cargar(cambios_desde=hwm)`) y las fusionan por ID_Ticket.
+    `preparar` normaliza cada lote (p. ej. ensure_ticket_schema) antes de fusionarlo.
+    Con `refresco` > 0 la base se consulta como mucho una vez cada `refresco` segundos, salvo
+    que `marcar()` avise de una escritura propia. El frame devuelto es compartido: tratarlo como
+    de solo lectura. Los deltas no lo modifican: producen un frame nuevo que lo reemplaza.
+    """
+    def __init__(self, cargar, preparar=lambda df: df, refresco: float = 0):
+        self._cargar, self._preparar, self.refresco = cargar, preparar, refresco
+        self._lock = threading.Lock()
+        self.df = None
+        self.version = 0
+        self._generacion = 0; self._vistas = {}; self._revisado = 0.0; self._sucio = False
+
+    @staticmethod
+    def _hwm(raw: pd.DataFrame, actual: int)->int:
+        if raw.empty or "rowversion" not in raw.columns: return actual
+        return max(actual, int(pd.to_numeric(raw["rowversion"], errors="coerce").max()))
+
+    def refrescar(self)->pd.DataFrame:
+        with self._lock:
+            ahora = time.monotonic()
+            if self.df is None:
+                raw = self._cargar()
+                self.df = self._preparar(raw).reset_index(drop=True); self.version = self._hwm(raw, 0)
+                self._cambio(); self._revisado = ahora
+                return self.df
+            if not self._sucio and ahora - self._revisado < self.refresco: return self.df
+            self._sucio = False; self._revisado = ahora
+            raw = self._cargar(cambios_desde=self.version)
+            if not raw.empty:
+                self._fusionar(self._preparar(raw)); self.version = self._hwm(raw, self.version)
+            return self.df
+
+    def marcar(self):
+        # hubo una escritura (de este proceso): el próximo refrescar consulta sin esperar el intervalo
+        self._sucio = True
+
+    def vista(self, clave, construir):
+        """Derivado del frame (p. ej. los tickets de un agente) memoizado hasta el próximo cambio:
+        lo comparten todas las sesiones. Solo lectura, igual que el frame."""
+        with self._lock:
+            hit = self._vistas.get(clave)
+            if hit is not None and hit[0]==self._generacion: return hit[1]
+            df, generacion = self.df, self._generacion
+        valor = construir(df)
+        with self._lock:
+            if generacion==self._generacion: self._vistas[clave] = (generacion, valor)
+        return valor
+
+    def _cambio(self):
+        self._generacion += 1; self._vistas.clear()
+
+    def aplicar(self, raw: pd.DataFrame)->pd.DataFrame:
+        # deltas recibidos por otra vía (p. ej. un feed de cambios) en lugar de consultarlos
+        with self._lock:
+            if self.df is not None and not raw.empty:
+                self._fusionar(self._preparar(raw)); self.version = self._hwm(raw, self.version)
+            return self.df
+
+    def aplicar_delta(self, delta: dict)->pd.DataFrame:
+        # delta del feed de cambios (/changes): recargar -> se descarta el frame (el próximo refrescar lo
+        # relee completo); si no, upsert de las filas recibidas y baja de los borrados
+        if delta.get("recargar"): self.invalidar(); return None
+        if len(delta["tickets"]): self.aplicar(delta["tickets"])
+        if delta.get("borrados"): self.quitar(delta["borrados"])
+        return self.df
+
+    def quitar(self, ids):
+        with self._lock:
+            if self.df is not None:
+                self.df = self.df[~self.df["ID_Ticket"].isin(list(ids))].reset_index(drop=True); self._cambio()
+
+    def invalidar(self):
+        with self._lock:
+            self.df = None; self.version = 0; self._cambio()
+
+    @staticmethod
+    def _ampliar_categorias(df: pd.DataFrame, cambios: pd.DataFrame):
+        # un valor fuera de las categorías del frame se perdería (NaN) al castear el delta: se agregan antes
+        for c in df.columns:
+            if c in cambios.columns and isinstance(df[c].dtype, pd.CategoricalDtype):
+                nuevas = pd.Index(cambios[c].dropna().unique()).difference(df[c].cat.categories)
+                if len(nuevas): df[c] = df[c].cat.add_categories(nuevas)
+
+    def _fusionar(self, cambios: pd.DataFrame):
+        # copy-on-write (con el lock tomado): las sesiones leen self.df sin lock, así que nunca se escribe en él.
+        # Se arma un frame nuevo que comparte las columnas sin cambios y reemplaza a self.df al final
+        cambios = cambios.drop_duplicates("ID_Ticket", keep="last")
+        df = self.df.copy(deep=False)
+        self._ampliar_categorias(df, cambios)
+        pos = pd.Index(df["ID_Ticket"]).get_indexer(cambios["ID_Ticket"])
+        existentes = pos >= 0
+        if existentes.any():
+            # solo se copian las columnas que trae el delta: O(filas) por columna tocada
+            filas = pos[existentes]; upd = cambios[existentes]
+            for c in df.columns:
+                if c not in upd.columns: continue
+                try:
+                    col, valores = df[c].copy(), upd[c].astype(df[c].dtype)
+                except (TypeError, ValueError):
+                    col, valores = df[c].astype(object), upd[c]
+                col.iloc[filas] = valores.to_numpy(); df[c] = col
+        if (~existentes).any():
+            # mismos dtypes que el frame: concat conserva categóricas y float32 (si difieren, cae a object)
+            nuevos = cambios[~existentes][df.columns].astype(df.dtypes.to_dict(), errors="ignore")
+            df = pd.concat([df, nuevos], ignore_index=True)
+        self.df = df; self._cambio()